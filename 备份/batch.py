@@ -0,0 +1,272 @@
+"""
+无界面批处理：遍历 DICOM 检查目录树，按进程池并行执行 加载 -> (变换) -> 归一化 -> (滤波) -> (分割) -> (表面提取/导出)，
+输出每个检查的耗时和 summary.json。不导入 Qt，可在服务器上运行。
+
+用法示例：
+    python batch.py /data/cbct -o /data/out --segment 1000 4000 --mesh teeth mask --workers 4
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import SimpleITK as sitk
+
+from image_io import read_dicom_series, list_dicom_series
+from image_ops import transform_3d
+from visualization import preprocess_array
+from volume_filters import apply_volume_filter
+from presets import VOLUME_FILTERS
+from segmentation_utils import segment_volume
+from label_mask import MaskSet
+from isosurface import ISO_PRESETS, configure_smp, extract_isosurface, mask_mesh, save_mesh
+
+SUMMARY_NAME = "summary.json"
+
+
+def is_dicom_file(path):
+    """DICOM Part 10 文件在 128 字节前导之后有 'DICM' 标记"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(128)
+            return f.read(4) == b"DICM"
+    except OSError:
+        return False
+
+
+def find_studies(root):
+    """
+    查找目录树中的检查：含 DICOMDIR 的目录，或直接包含 DICOM 文件的目录；找到后不再深入其子目录
+    :return: 排序后的目录列表
+    """
+    studies = []
+    for folder, dirnames, filenames in os.walk(root, followlinks=True):
+        dirnames.sort()
+        if "DICOMDIR" in filenames or any(is_dicom_file(os.path.join(folder, name)) for name in filenames[:8]):
+            studies.append(folder)
+            dirnames[:] = []
+    return sorted(studies)
+
+
+def study_name(root, folder):
+    name = os.path.relpath(folder, root)
+    name = os.path.basename(os.path.abspath(root)) if name == "." else name
+    return re.sub(r"[\\/:]+", "_", name)
+
+
+def write_image(array, reference, path):
+    """按原图几何信息保存体数据（.nii.gz / .mha / .nrrd 等，由扩展名决定）"""
+    image = sitk.GetImageFromArray(np.ascontiguousarray(array))
+    image.SetSpacing(reference.GetSpacing())
+    image.SetOrigin(reference.GetOrigin())
+    image.SetDirection(reference.GetDirection())
+    sitk.WriteImage(image, path, useCompression=True)
+
+
+def process_study(folder, out_dir, options):
+    """
+    处理单个检查（在子进程中执行）
+    :param options: dict，见 build_options
+    :return: 该检查的结果字典（status、timings、outputs、stats 等），出错时 status 为 "error"
+    """
+    timings, outputs, stats = {}, {}, {}
+    result = {"folder": folder, "output_dir": out_dir, "status": "ok",
+              "timings": timings, "outputs": outputs, "stats": stats}
+    start = time.perf_counter()
+
+    def step(name, func, *args, **kwargs):
+        t = time.perf_counter()
+        value = func(*args, **kwargs)
+        timings[name] = round(time.perf_counter() - t, 3)
+        return value
+
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        series = list_dicom_series(folder)
+        if not series:
+            raise RuntimeError("未找到 DICOM 序列")
+        # 一个检查中可能有定位像等小序列，取切片最多的序列
+        series = max(series, key=lambda s: len(s["files"]))
+        image, array, metadata = step("load", read_dicom_series, folder,
+                                      series_uid=series.get("SeriesInstanceUID"))
+        spacing = image.GetSpacing()
+        result.update({"series_uid": series.get("SeriesInstanceUID", ""), "shape": list(array.shape),
+                       "spacing": list(spacing), "patient_id": metadata["基本信息"].get("患者ID", "")})
+
+        if any(options["translate"]) or any(options["rotate"]):
+            array = step("transform", transform_3d, array, options["translate"], options["rotate"],
+                         order=1, dtype=array.dtype, threads=options["threads"])
+
+        normalized = step("normalize", preprocess_array, array)
+        if options["save_normalized"]:
+            path = os.path.join(out_dir, "normalized" + options["image_ext"])
+            step("save_normalized", write_image, normalized, image, path)
+            outputs["normalized"] = path
+
+        del normalized
+
+        for name in options["filters"]:
+            # 与界面中的三维滤波相同：在原始强度上以 float32 计算
+            filtered = step(f"filter_{name}", apply_volume_filter, array, name, threads=options["threads"])
+            path = os.path.join(out_dir, f"filter_{name}" + options["image_ext"])
+            step(f"save_filter_{name}", write_image, filtered, image, path)
+            outputs[f"filter_{name}"] = path
+            del filtered
+
+        masks = None
+        if options["segment"] is not None:
+            lower, upper = options["segment"]
+            labels, count = step("segment", segment_volume, array, lower, upper, threads=options["threads"])
+            masks = MaskSet.from_labels(labels)
+            del labels
+            union = masks.union()
+            stats["segment"] = {"range": [lower, upper], "components": count,
+                                **{k: v for k, v in union.stats(spacing).items() if k != "bbox"}}
+            if options["save_mask"]:
+                path = os.path.join(out_dir, "mask" + options["image_ext"])
+                step("save_mask", write_image, np.asarray(union).astype(np.uint8), image, path)
+                outputs["mask"] = path
+
+        if options["meshes"]:
+            configure_smp(options["threads"])
+        for name, level in options["meshes"]:
+            if name == "mask":
+                if masks is None:
+                    raise ValueError("导出分割表面需要同时指定 --segment")
+                mesh = step("mesh_mask", mask_mesh, masks, spacing)
+            else:
+                mesh = step(f"mesh_{name}", extract_isosurface, array, level, spacing)
+            if mesh is None:
+                continue
+            path = os.path.join(out_dir, f"{name}.{options['mesh_format']}")
+            step(f"save_mesh_{name}", save_mesh, [mesh], path, image)
+            outputs[f"mesh_{name}"] = path
+            stats[f"mesh_{name}"] = {"triangles": mesh.GetNumberOfPolys(), "points": mesh.GetNumberOfPoints()}
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def build_options(args):
+    meshes = []
+    for name in args.mesh:
+        if name == "mask":
+            meshes.append(("mask", None))
+        else:
+            meshes.append((name, ISO_PRESETS[name]["level"]))
+    meshes += [(f"iso_{level}", level) for level in args.iso]
+    return {
+        "translate": tuple(args.translate),
+        "rotate": tuple(args.rotate),
+        "save_normalized": args.save_normalized,
+        "filters": list(args.filter),
+        "segment": tuple(args.segment) if args.segment else None,
+        "save_mask": args.save_mask,
+        "meshes": meshes,
+        "mesh_format": args.mesh_format,
+        "image_ext": args.image_ext,
+        "threads": args.threads,
+    }
+
+
+def write_summary(path, root, options, results, started):
+    done = [r for r in results if r["status"] == "ok"]
+    summary = {
+        "root": os.path.abspath(root),
+        "options": options,
+        "studies": results,
+        "totals": {
+            "studies": len(results),
+            "ok": len(done),
+            "errors": len(results) - len(done),
+            "seconds": round(time.perf_counter() - started, 3),
+            "study_seconds": round(sum(r["seconds"] for r in results), 3),
+        },
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return summary
+
+
+def run_batch(root, out_root, options, workers=None, resume=False):
+    """
+    并行处理 root 下的全部检查；每完成一个检查就重写一次 summary.json（夜间任务中断后可用 resume 继续）
+    :return: summary 字典
+    """
+    started = time.perf_counter()
+    os.makedirs(out_root, exist_ok=True)
+    summary_path = os.path.join(out_root, SUMMARY_NAME)
+
+    results = []
+    finished = set()
+    if resume and os.path.exists(summary_path):
+        with open(summary_path, encoding="utf-8") as f:
+            results = [r for r in json.load(f)["studies"] if r["status"] == "ok"]
+        finished = {r["folder"] for r in results}
+
+    studies = [s for s in find_studies(root) if s not in finished]
+    print(f"[批处理] 共 {len(studies) + len(finished)} 个检查，待处理 {len(studies)} 个")
+    workers = workers or os.cpu_count() or 1
+    if not options.get("threads"):
+        # 各进程平分 CPU 核，避免每个进程内的线程池都按全部核数开线程
+        options = dict(options, threads=max(1, (os.cpu_count() or 1) // workers))
+    with ProcessPoolExecutor(max_workers=min(workers, max(1, len(studies)))) as pool:
+        futures = {pool.submit(process_study, folder, os.path.join(out_root, study_name(root, folder)), options):
+                   folder for folder in studies}
+        for i, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results.append(result)
+            status = "完成" if result["status"] == "ok" else f"失败 ({result['error']})"
+            print(f"[批处理] {i}/{len(studies)} {result['folder']}: {status}，耗时 {result['seconds']:.1f}s")
+            write_summary(summary_path, root, options, results, started)
+    summary = write_summary(summary_path, root, options, results, started)
+    totals = summary["totals"]
+    print(f"[批处理] 成功 {totals['ok']}，失败 {totals['errors']}，总耗时 {totals['seconds']:.1f}s，结果见 {summary_path}")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="CBCT 批处理（无界面）")
+    parser.add_argument("root", help="DICOM 检查目录树")
+    parser.add_argument("-o", "--output", required=True, help="输出目录")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认为 CPU 核数）")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="每个进程内变换/分割使用的线程数（默认为 CPU 核数 / 进程数）")
+    parser.add_argument("--translate", type=float, nargs=3, default=(0, 0, 0), metavar=("DX", "DY", "DZ"))
+    parser.add_argument("--rotate", type=float, nargs=3, default=(0, 0, 0), metavar=("ALPHA", "BETA", "GAMMA"),
+                        help="欧拉角（绕 Z, X, Y 轴，单位：度）")
+    parser.add_argument("--save-normalized", action="store_true", help="保存归一化后的体数据")
+    parser.add_argument("--filter", choices=sorted(VOLUME_FILTERS), nargs="*", default=[],
+                        help="三维滤波（float32，默认参数）并保存")
+    parser.add_argument("--segment", type=int, nargs=2, metavar=("LOWER", "UPPER"), help="三维阈值分割的强度范围")
+    parser.add_argument("--save-mask", action="store_true", help="保存分割掩膜")
+    parser.add_argument("--mesh", choices=sorted(ISO_PRESETS) + ["mask"], nargs="*", default=[],
+                        help="提取并导出的表面（mask 为分割结果表面）")
+    parser.add_argument("--iso", type=int, nargs="*", default=[], help="按自定义阈值提取表面")
+    parser.add_argument("--mesh-format", choices=("stl", "ply"), default="stl")
+    parser.add_argument("--image-ext", default=".nii.gz", help="体数据输出格式的扩展名")
+    parser.add_argument("--resume", action="store_true", help="跳过 summary.json 中已成功的检查")
+    args = parser.parse_args(argv)
+    if "mask" in args.mesh and not args.segment:
+        parser.error("--mesh mask 需要同时指定 --segment")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    summary = run_batch(args.root, args.output, build_options(args), workers=args.workers, resume=args.resume)
+    return 0 if summary["totals"]["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""
+核心处理函数的性能基准（无界面）：在合成体数据（256³ ~ 1024³）和自带的检查数据上测量
+墙钟时间、内存峰值和吞吐量（体素/秒），与保存的基线比较并输出报告。
+
+每个 (用例, 尺寸) 在单独的子进程中运行，互不影响内存峰值；预计内存超过当前可用内存的用例记为跳过。
+
+用法示例：
+    python benchmark.py                                  # 256³、512³ 全部用例，与基线比较
+    python benchmark.py --sizes 256 512 1024 --repeat 5
+    python benchmark.py --cases rotate_3d sobel --save-baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from chunked_volume import available_memory
+
+SIZES = (256, 512, 1024)
+DEFAULT_SIZES = (256, 512)
+DEFAULT_STUDY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "1000427996-40岁")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+REGRESSION_THRESHOLD = 0.2  # 比基线慢 20% 以上记为变慢
+SLICES_PER_VIEW = 32        # 切片显示用例在每个方向上取的切片数
+SEGMENT_RANGE = (1000, 4000)
+ROTATION = (10.0, 5.0, 0.0)
+SHIFT = (2.7, -3.2, 5.5)    # (dz, dy, dx)，非整数像素，走插值路径
+STUDY = "study"             # 读取检查数据的用例与合成尺寸无关
+
+
+# ================= 合成体数据 =================
+
+def synthetic_volume(size, seed=0, slab=16):
+    """
+    合成类似 CBCT 的 int16 体数据：空气背景 + 椭球形软组织 + 骨壳 + 若干高密度“牙齿”，叠加噪声。
+    分块生成，1024³ 时临时内存只有一个块
+    """
+    rng = np.random.default_rng(seed)
+    volume = np.empty((size,) * 3, dtype=np.int16)
+    c = (size - 1) / 2
+    teeth = rng.uniform(0.3, 0.7, size=(24, 3)) * size
+    radius = size * 0.03
+    for z0 in range(0, size, slab):
+        z, y, x = np.ogrid[z0:min(z0 + slab, size), :size, :size]
+        r = ((z - c) / (0.45 * size)) ** 2 + ((y - c) / (0.40 * size)) ** 2 + ((x - c) / (0.35 * size)) ** 2
+        block = np.where(r < 1.0, 40.0, -1000.0)
+        block[(r > 0.8) & (r < 1.0)] = 1800.0
+        for tz, ty, tx in teeth:
+            if abs(tz - (z0 + slab / 2)) <= radius + slab:
+                block[(z - tz) ** 2 + (y - ty) ** 2 + (x - tx) ** 2 < radius ** 2] = 2600.0
+        block += rng.normal(0.0, 30.0, size=block.shape)
+        volume[z0:z0 + block.shape[0]] = block
+    return volume
+
+
+def synthetic_uint8(size):
+    """归一化后的 uint8 体数据（显示、二维滤波与分割用例的输入）"""
+    from visualization import preprocess_array
+    return preprocess_array(synthetic_volume(size))
+
+
+# ================= 用例 =================
+# 每个用例：setup(size, study) -> (参数元组, 体素数)，run(*参数)；memory 为每体素的预计内存（字节，含输入）
+
+def _setup_study(size, study):
+    import SimpleITK as sitk
+    from image_io import select_series_files
+    files = select_series_files(study)
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(files[0])
+    reader.ReadImageInformation()
+    width, height = reader.GetSize()[:2]
+    return (study,), len(files) * width * height
+
+
+def _run_read(study):
+    from image_io import read_dicom_series
+    return read_dicom_series(study)
+
+
+def _setup_volume(size, study):
+    return (synthetic_volume(size),), size ** 3
+
+
+def _setup_uint8(size, study):
+    return (synthetic_uint8(size),), size ** 3
+
+
+def _slice_indices(n):
+    return np.linspace(0, n - 1, min(n, SLICES_PER_VIEW)).astype(int)
+
+
+def _setup_slices(size, study):
+    volume = synthetic_uint8(size)
+    return (volume,), 3 * len(_slice_indices(size)) * size * size
+
+
+def _run_slices(volume):
+    """三个方向上的切片显示路径：取切片 + 转为 vtkImageData"""
+    from visualization import get_slice_image, numpy_to_vtk_image2d
+    for orientation, n in zip(("axial", "coronal", "sagittal"), volume.shape):
+        for index in _slice_indices(n):
+            numpy_to_vtk_image2d(get_slice_image(volume, orientation, index))
+
+
+def _run_preprocess(volume):
+    from visualization import preprocess_array
+    from normalization_utils import _normalized_cache
+    _normalized_cache.clear()  # 每次都测完整的归一化，而不是缓存命中
+    return preprocess_array(volume)
+
+
+def _run_translate(volume):
+    from image_ops import translate_3d
+    dz, dy, dx = SHIFT
+    return translate_3d(volume, dx, dy, dz)
+
+
+def _run_rotate(volume):
+    from image_ops import rotate_3d
+    return rotate_3d(volume, ROTATION[0])
+
+
+def _run_rotate_image(volume):
+    from image_ops import rotate_3d_image, euler_angles_to_rotation_matrix
+    return rotate_3d_image(volume, euler_angles_to_rotation_matrix(ROTATION))
+
+
+def _run_segment_mask(volume):
+    """逐轴位切片的窗宽/窗位分割（分割工具的计算部分）"""
+    from segmentation_utils import segment_mask
+    for z in range(volume.shape[0]):
+        segment_mask(volume[z])
+
+
+def _run_segment_volume(volume):
+    from segmentation_utils import segment_volume
+    return segment_volume(volume, *SEGMENT_RANGE)
+
+
+def _run_filter(volume, name):
+    from enhancement_utils import cv2_Sobel_filter, cv2_Laplace_filter
+    func = cv2_Sobel_filter if name == "sobel" else cv2_Laplace_filter
+    for z in range(volume.shape[0]):
+        func(volume[z])
+
+
+def _run_sobel(volume):
+    _run_filter(volume, "sobel")
+
+
+def _run_laplace(volume):
+    _run_filter(volume, "laplace")
+
+
+CASES = {
+    "read_dicom_series": {"setup": _setup_study, "run": _run_read, "memory": 6},
+    "preprocess_array": {"setup": _setup_volume, "run": _run_preprocess, "memory": 6},
+    "slice_to_vtk": {"setup": _setup_slices, "run": _run_slices, "memory": 4},
+    "translate_3d": {"setup": _setup_volume, "run": _run_translate, "memory": 14},
+    "rotate_3d": {"setup": _setup_volume, "run": _run_rotate, "memory": 14},
+    "rotate_3d_image": {"setup": _setup_volume, "run": _run_rotate_image, "memory": 6},
+    "segment_mask": {"setup": _setup_uint8, "run": _run_segment_mask, "memory": 4},
+    "segment_volume": {"setup": _setup_volume, "run": _run_segment_volume, "memory": 10},
+    "sobel": {"setup": _setup_uint8, "run": _run_sobel, "memory": 4},
+    "laplace": {"setup": _setup_uint8, "run": _run_laplace, "memory": 4},
+}
+
+
+def _rss_peak_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def run_case(name, size, repeat, study):
+    """
+    在子进程中执行一个用例：先运行一次（用 tracemalloc 记录内存峰值，同时作为预热），再计时 repeat 次
+    :return: 结果字典（seconds 取最短时间，voxels_per_s 按最短时间计算）
+    """
+    case = CASES[name]
+    args, voxels = case["setup"](size, study)
+    tracemalloc.start()
+    case["run"](*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        case["run"](*args)
+        times.append(time.perf_counter() - t)
+    best = min(times)
+    return {
+        "case": name,
+        "size": size,
+        "status": "ok",
+        "voxels": int(voxels),
+        "seconds": round(best, 4),
+        "median_seconds": round(float(np.median(times)), 4),
+        "voxels_per_s": round(voxels / best),
+        "peak_mb": round(peak / 1e6, 1),        # 用例执行期间 numpy/Python 分配的峰值
+        "rss_peak_mb": round(_rss_peak_mb(), 1),  # 子进程常驻内存峰值（含输入数据）
+    }
+
+
+def run_benchmarks(cases, sizes, repeat, study):
+    """按顺序逐个运行用例（串行，避免相互干扰），返回结果列表"""
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name in cases:
+        for size in ([STUDY] if CASES[name]["setup"] is _setup_study else sizes):
+            result = {"case": name, "size": size}
+            available = available_memory()
+            estimate = CASES[name]["memory"] * size ** 3 if size != STUDY else 0
+            if size == STUDY and not os.path.isdir(study):
+                result.update(status="skipped", reason=f"未找到检查数据 {study}")
+            elif available is not None and estimate > available:
+                result.update(status="skipped",
+                              reason=f"预计需要 {estimate / 1e9:.1f} GB，可用 {available / 1e9:.1f} GB")
+            else:
+                try:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        result = pool.submit(run_case, name, size, repeat, study).result()
+                except BrokenProcessPool:
+                    result.update(status="error", reason="子进程异常退出（可能内存不足）")
+                except Exception as e:
+                    result.update(status="error", reason=f"{type(e).__name__}: {e}")
+            results.append(result)
+            print(f"[基准] {format_result(result)}")
+    return results
+
+
+def format_result(result):
+    label = f"{result['case']}@{result['size']}"
+    if result["status"] != "ok":
+        return f"{label:<28} {'跳过' if result['status'] == 'skipped' else '失败'}：{result['reason']}"
+    return (f"{label:<28} {result['seconds']:>9.3f}s  {result['voxels_per_s'] / 1e6:>9.1f} M体素/s  "
+            f"峰值 {result['peak_mb']:>8.1f} MB  RSS {result['rss_peak_mb']:>8.1f} MB")
+
+
+# ================= 基线与报告 =================
+
+def environment():
+    import scipy
+    return {
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+    }
+
+
+def result_key(result):
+    return f"{result['case']}@{result['size']}"
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {"environment": {}, "results": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, env):
+    """把本次成功的结果写入基线（其他用例的基线保留）"""
+    baseline = load_baseline(path)
+    baseline["environment"] = env
+    baseline["results"].update({result_key(r): r for r in results if r["status"] == "ok"})
+    baseline["results"] = dict(sorted(baseline["results"].items()))
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    print(f"[基准] 基线已保存到 {path}")
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    与基线比较
+    :return: (报告文本, 变慢的用例列表)
+    """
+    lines = [f"{'用例':<28} {'本次':>10} {'基线':>10} {'比值':>7}  {'内存峰值(MB)':>16}  结论"]
+    regressions = []
+    for result in results:
+        if result["status"] != "ok":
+            lines.append(format_result(result))
+            continue
+        key = result_key(result)
+        base = baseline["results"].get(key)
+        if base is None:
+            lines.append(f"{key:<28} {result['seconds']:>9.3f}s {'-':>10} {'-':>7}  {result['peak_mb']:>16.1f}  无基线")
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        if ratio > 1 + threshold:
+            verdict = "变慢"
+            regressions.append(key)
+        elif ratio < 1 / (1 + threshold):
+            verdict = "变快"
+        else:
+            verdict = "持平"
+        memory = f"{result['peak_mb']:.1f} / {base['peak_mb']:.1f}"
+        lines.append(f"{key:<28} {result['seconds']:>9.3f}s {base['seconds']:>9.3f}s {ratio:>7.2f}  {memory:>16}  {verdict}")
+    return "\n".join(lines), regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="核心处理函数性能基准")
+    parser.add_argument("--cases", choices=list(CASES), nargs="*", default=list(CASES), help="要运行的用例（默认全部）")
+    parser.add_argument("--sizes", type=int, choices=SIZES, nargs="*", default=list(DEFAULT_SIZES),
+                        help="合成体数据边长")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例计时的次数（取最短时间）")
+    parser.add_argument("--study", default=DEFAULT_STUDY, help="read_dicom_series 用例读取的检查目录")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument("--save-baseline", action="store_true", help="用本次结果更新基线")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="判定变慢的相对阈值")
+    parser.add_argument("-o", "--output", help="把本次结果保存为 JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = environment()
+    results = run_benchmarks(args.cases, args.sizes, args.repeat, args.study)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"environment": env, "results": results}, f, ensure_ascii=False, indent=2)
+
+    baseline = load_baseline(args.baseline)
+    if baseline["environment"] and baseline["environment"] != env:
+        print(f"[基准] 注意：基线的运行环境不同 {baseline['environment']}")
+    report, regressions = compare(results, baseline, args.threshold)
+    print(report)
+    if args.save_baseline:
+        save_baseline(args.baseline, results, env)
+        return 0
+    if regressions:
+        print(f"[基准] {len(regressions)} 个用例比基线慢 {args.threshold:.0%} 以上：{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
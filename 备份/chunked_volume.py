@@ -0,0 +1,237 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+DEFAULT_CHUNK = 64
+# 超过该大小（或超过当前可用内存的 MEMORY_FRACTION）的体数据改用分块内存映射存储，不再整体驻留内存
+LARGE_VOLUME_BYTES = 512 * 1024 ** 2
+MEMORY_FRACTION = 0.25
+
+
+def available_memory():
+    """当前可用内存（字节，/proc/meminfo 的 MemAvailable），读取失败时返回 None"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def should_chunk(nbytes):
+    """nbytes 大小的体数据是否应使用 ChunkedVolume"""
+    limit = LARGE_VOLUME_BYTES
+    available = available_memory()
+    if available is not None:
+        limit = min(limit, available * MEMORY_FRACTION)
+    return nbytes > limit
+
+
+class VolumeGeometry:
+    """
+    只保存空间信息的轻量对象，提供与 sitk.Image 相同的 GetSpacing/GetOrigin/GetDirection/GetSize 接口，
+    用来代替仅为读取间距而保留的整幅 SimpleITK 图像
+    """
+
+    def __init__(self, spacing, origin, direction, size):
+        self.spacing = tuple(float(v) for v in spacing)
+        self.origin = tuple(float(v) for v in origin)
+        self.direction = tuple(float(v) for v in direction)
+        self.size = tuple(int(v) for v in size)
+
+    @classmethod
+    def from_image(cls, image):
+        return cls(image.GetSpacing(), image.GetOrigin(), image.GetDirection(), image.GetSize())
+
+    def GetSpacing(self):
+        return self.spacing
+
+    def GetOrigin(self):
+        return self.origin
+
+    def GetDirection(self):
+        return self.direction
+
+    def GetSize(self):
+        return self.size
+
+
+def _normalize_key(key, shape):
+    """将基本索引统一为每个轴一个 (start, stop, step, 是否降维)"""
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(k is Ellipsis for k in key):
+        i = key.index(Ellipsis)
+        key = key[:i] + (slice(None),) * (len(shape) - len(key) + 1) + key[i + 1:]
+    key = key + (slice(None),) * (len(shape) - len(key))
+    if len(key) != len(shape):
+        raise IndexError("too many indices for ChunkedVolume")
+
+    ranges = []
+    for k, n in zip(key, shape):
+        if isinstance(k, slice):
+            start, stop, step = k.indices(n)
+            if step < 0:
+                raise IndexError("ChunkedVolume does not support negative steps")
+            stop = max(start, stop)
+            ranges.append((start, stop, step, False))
+        else:
+            k = int(k)
+            if k < 0:
+                k += n
+            if not 0 <= k < n:
+                raise IndexError(f"index {k} is out of bounds for axis with size {n}")
+            ranges.append((k, k + 1, 1, True))
+    return ranges
+
+
+class ChunkedVolume:
+    """
+    分块（默认 64³）存储在内存映射文件中的三维体数据，可在切片、直方图、分割代码中代替 ndarray。
+    读取任一轴位/冠状/矢状面只会访问与该平面相交的数据块。
+    """
+
+    def __init__(self, path, shape, dtype, chunk=DEFAULT_CHUNK, mode="r+", owns_file=False):
+        self.path = path
+        self.shape = tuple(int(v) for v in shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk = int(chunk)
+        self.grid = tuple(-(-n // self.chunk) for n in self.shape)
+        self._owns_file = owns_file
+        c = self.chunk
+        self._blocks = np.memmap(path, dtype=self.dtype, mode=mode, shape=self.grid + (c, c, c))
+
+    @classmethod
+    def create(cls, shape, dtype, path=None, chunk=DEFAULT_CHUNK):
+        """创建空的分块体数据；未给出路径时使用临时文件，对象销毁后自动删除"""
+        owns_file = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=".chunks")
+            os.close(fd)
+        grid = [-(-int(n) // chunk) for n in shape]
+        nbytes = int(np.prod(grid)) * chunk ** 3 * np.dtype(dtype).itemsize
+        with open(path, "wb") as f:
+            f.truncate(nbytes)
+        volume = cls(path, shape, dtype, chunk=chunk, mode="r+", owns_file=owns_file)
+        volume._write_header()
+        return volume
+
+    @classmethod
+    def from_array(cls, array, path=None, chunk=DEFAULT_CHUNK):
+        volume = cls.create(array.shape, array.dtype, path=path, chunk=chunk)
+        for z0 in range(0, array.shape[0], chunk):
+            volume[z0:z0 + chunk] = array[z0:z0 + chunk]
+        volume.flush()
+        return volume
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            header = json.load(f)
+        return cls(path, header["shape"], header["dtype"], chunk=header["chunk"], mode=mode)
+
+    def _write_header(self):
+        with open(self.path + ".json", "w", encoding="utf-8") as f:
+            json.dump({"shape": list(self.shape), "dtype": self.dtype.str, "chunk": self.chunk}, f)
+
+    def save(self, path):
+        """将分块文件复制到 path，返回以只读方式打开的新对象"""
+        self.flush()
+        shutil.copyfile(self.path, path)
+        shutil.copyfile(self.path + ".json", path + ".json")
+        return ChunkedVolume.open(path)
+
+    def flush(self):
+        if self._blocks.mode != "r":
+            self._blocks.flush()
+
+    def __del__(self):
+        if getattr(self, "_owns_file", False):
+            self._blocks = None
+            for p in (self.path, self.path + ".json"):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _block_ranges(self, start, stop):
+        c = self.chunk
+        for b in range(start // c, -(-stop // c)):
+            lo = max(start, b * c)
+            hi = min(stop, (b + 1) * c)
+            yield b, lo - b * c, hi - b * c, lo - start, hi - start
+
+    def __getitem__(self, key):
+        ranges = _normalize_key(key, self.shape)
+        (z0, z1, _, _), (y0, y1, _, _), (x0, x1, _, _) = ranges
+        out = np.empty((z1 - z0, y1 - y0, x1 - x0), dtype=self.dtype)
+        # 只遍历与所请求区域相交的数据块
+        for bz, sz0, sz1, oz0, oz1 in self._block_ranges(z0, z1):
+            for by, sy0, sy1, oy0, oy1 in self._block_ranges(y0, y1):
+                for bx, sx0, sx1, ox0, ox1 in self._block_ranges(x0, x1):
+                    out[oz0:oz1, oy0:oy1, ox0:ox1] = self._blocks[bz, by, bx, sz0:sz1, sy0:sy1, sx0:sx1]
+        steps = tuple(slice(None, None, step) for _, _, step, _ in ranges)
+        out = out[steps]
+        drop = tuple(0 if squeeze else slice(None) for _, _, _, squeeze in ranges)
+        return out[drop]
+
+    def __setitem__(self, key, value):
+        ranges = _normalize_key(key, self.shape)
+        if any(step != 1 for _, _, step, _ in ranges):
+            raise IndexError("ChunkedVolume assignment does not support steps")
+        (z0, z1, _, _), (y0, y1, _, _), (x0, x1, _, _) = ranges
+        value = np.asarray(value, dtype=self.dtype)
+        if value.ndim == sum(not squeeze for _, _, _, squeeze in ranges):
+            # 整数索引降掉的维度补回来，使 volume[5] = slice_2d 之类的写法可以广播
+            for axis, (_, _, _, squeeze) in enumerate(ranges):
+                if squeeze:
+                    value = np.expand_dims(value, axis)
+        value = np.broadcast_to(value, (z1 - z0, y1 - y0, x1 - x0))
+        for bz, sz0, sz1, oz0, oz1 in self._block_ranges(z0, z1):
+            for by, sy0, sy1, oy0, oy1 in self._block_ranges(y0, y1):
+                for bx, sx0, sx1, ox0, ox1 in self._block_ranges(x0, x1):
+                    self._blocks[bz, by, bx, sz0:sz1, sy0:sy1, sx0:sx1] = value[oz0:oz1, oy0:oy1, ox0:ox1]
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[:, :, :]
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def iter_slabs(self):
+        """按块层（chunk 厚度）沿 z 轴依次返回 (z0, z1, slab)"""
+        for z0 in range(0, self.shape[0], self.chunk):
+            z1 = min(z0 + self.chunk, self.shape[0])
+            yield z0, z1, self[z0:z1]
+
+    def map_slabs(self, func, dtype, path=None):
+        """逐块层计算 func(slab)，结果写入新的 ChunkedVolume"""
+        out = ChunkedVolume.create(self.shape, dtype, path=path, chunk=self.chunk)
+        for z0, z1, slab in self.iter_slabs():
+            out[z0:z1] = func(slab)
+        out.flush()
+        return out
+
+    def min(self):
+        return min(slab.min() for _, _, slab in self.iter_slabs())
+
+    def max(self):
+        return max(slab.max() for _, _, slab in self.iter_slabs())
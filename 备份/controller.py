@@ -1,53 +1,100 @@
-from PyQt5.QtWidgets import QFileDialog, QMessageBox, QTableWidgetItem
-from image_io import read_dicom_series
-from visualization import show_views_with_slider, update_slice, update_status_bar, enable_measurement
+from PyQt5.QtWidgets import QFileDialog, QMessageBox, QTableWidgetItem, QInputDialog
+from PyQt5.QtCore import QTimer
+# 以下直接导入的模块合计约 11ms（numpy 已随 vtkmodules.qt 导入），不影响首个窗口时间
+from volume_cache import VolumeCache
+from dicomdir import describe_series
 from test_debug import handle_test_button
 from transform_dialog import TransformDialog
-from image_ops import translate_3d, rotate_3d
-from histogram_utils import draw_histogram
-from enhancement_utils import apply_image_enhancement
-from segmentation_utils import segment
 from orthodontic_processor import OrthodonticProcessor
-import vtk
+from render_scheduler import RenderScheduler
 import numpy as np
-from PyQt5.QtCore import QThread, pyqtSignal
-from image_ops import euler_angles_to_rotation_matrix, rotate_3d_image
+from job_executor import JobExecutor
+from presets import ISO_PRESETS, VOLUME_FILTERS
+from startup import lazy_module
+import instrumentation
 
-class RotationWorker(QThread):
-    finishing = pyqtSignal(np.ndarray)
-
-    def __init__(self, array, angles):
-        super().__init__()
-        self.array = array
-        self.angles = angles
-
-    def running(self):
-        try:
-            R = euler_angles_to_rotation_matrix(self.angles)
-            result = rotate_3d_image(self.array, R)
-            self.finishing.emit(result)
-        except Exception as e:
-            print("[旋转线程] 错误:", str(e))
+# 以下模块依赖 vtk、SimpleITK、scipy、cv2 等，加载图像或使用工具时才导入，主窗口可以立即显示
+image_io = lazy_module("image_io")
+visualization = lazy_module("visualization")
+image_ops = lazy_module("image_ops")
+histogram_utils = lazy_module("histogram_utils")
+enhancement_utils = lazy_module("enhancement_utils")
+segmentation_utils = lazy_module("segmentation_utils")
+label_mask = lazy_module("label_mask")
+normalization_utils = lazy_module("normalization_utils")
+volume_rendering = lazy_module("volume_rendering")
+isosurface = lazy_module("isosurface")
+volume_filters = lazy_module("volume_filters")
+live_filter = lazy_module("live_filter")
 
 class Controller:
     def __init__(self, ui):
         self.ui = ui
         self.image = None
         self.array = None
+        self.original_array = None
+        self.transforms = None  # 加载图像后创建
         self.metadata = None
         self.measurement_enabled = False
+        self.volume_cache = VolumeCache()
+        self.scheduler = RenderScheduler(self.ui)
+        self.jobs = JobExecutor()
+        self.jobs.progressChanged.connect(self.on_job_progress)
+        self.jobs.busyChanged.connect(self.on_jobs_busy)
+        self.histogram_engine = None
+        self.histogram_plot = None  # 第一次画直方图时创建（matplotlib 画布按需生成）
         self.orthodontic = OrthodonticProcessor(self.ui)
         self.rotation_angle = 0.0  # 默认角度
+        self.masks = None  # 分割得到的掩膜集合（MaskSet，原始网格）
+        self.segment_range = (1000, 4000)  # 三维阈值分割/区域生长的强度范围
+        self.filtered = None  # 三维滤波结果（float32，与 filter_source 同网格），显示时代替原图
+        self.filter_source = None
+        self.live = None  # 实时滤波（LiveFilter），第一次开启时创建
+
+        # 状态栏的帧率/延迟读数，每 0.5 秒按最近 1 秒内渲染的切片帧刷新
+        self.perf_timer = QTimer(self.ui)
+        self.perf_timer.setInterval(500)
+        self.perf_timer.timeout.connect(self.update_perf_readout)
+        self.perf_timer.start()
 
         # 菜单栏“打开文件”
         self.ui.openFileAction.triggered.connect(self.load_dicom)
         self.ui.openOrthoAction.triggered.connect(self.load_orthodontic_dicom)
+        self.ui.undoAction.triggered.connect(self.undo_transform)
+        self.ui.redoAction.triggered.connect(self.redo_transform)
+        self.ui.commitTransformAction.triggered.connect(self.commit_transform)
+        self.ui.cancelJobButton.clicked.connect(self.jobs.cancel_all)
+        for mode, action in self.ui.fusionModeActions.items():
+            action.triggered.connect(lambda _, m=mode: self.orthodontic.set_fusion_mode(m))
+        self.ui.removeOverlayAction.triggered.connect(self.orthodontic.remove_overlay)
+        self.ui.registerAction.triggered.connect(self.orthodontic.auto_register)
+        self.ui.segment3dAction.triggered.connect(self.start_segmentation)
+        self.ui.regionGrowAction.triggered.connect(self.start_region_grow)
+        self.ui.clearSegmentAction.triggered.connect(self.clear_segmentation)
+        for preset, action in self.ui.volumePresetActions.items():
+            action.triggered.connect(lambda checked, p=preset: self.set_volume_preset(p))
+        for preset, action in self.ui.surfaceActions.items():
+            action.triggered.connect(lambda checked, p=preset: self.extract_surface(p))
+        self.ui.customSurfaceAction.triggered.connect(self.extract_custom_surface)
+        self.ui.maskSurfaceAction.triggered.connect(self.extract_mask_surface)
+        self.ui.clearSurfaceAction.triggered.connect(self.clear_surfaces)
+        self.ui.exportSurfaceAction.triggered.connect(self.export_surfaces)
+        for name, action in self.ui.filterActions.items():
+            action.triggered.connect(lambda checked, n=name: self.start_volume_filter(n))
+        self.ui.clearFilterAction.triggered.connect(self.clear_volume_filter)
+        for name, action in self.ui.liveFilterActions.items():
+            action.triggered.connect(lambda checked, n=name: self.set_live_filter(n))
+        self.ui.instrumentAction.toggled.connect(self.set_instrumentation)
+        self.ui.traceMemoryAction.toggled.connect(instrumentation.set_memory_tracking)
+        self.ui.exportTraceAction.triggered.connect(self.export_trace)
 
         # 滑块响应
         self.ui.axialBar.valueChanged.connect(lambda val: self.update_from_slider('axial', val))
         self.ui.sagittalBar.valueChanged.connect(lambda val: self.update_from_slider('sagittal', val))
         self.ui.coronalBar.valueChanged.connect(lambda val: self.update_from_slider('coronal', val))
 
+        self.ui.hist_source_box.currentTextChanged.connect(lambda _: self.update_histogram())
+
         # 快捷按钮
         self.ui.tool_buttons["加载DICOM"].clicked.connect(self.load_dicom)
         self.ui.tool_buttons["平移"].clicked.connect(self.show_translation_dialog)
@@ -55,29 +102,89 @@ class Controller:
         self.ui.tool_buttons["距离测量"].clicked.connect(self.toggle_measurement_mode)
         self.ui.tool_buttons["分割"].clicked.connect(self.start_segmentation)
         self.ui.tool_buttons["一键复位"].clicked.connect(self.reset_view)
-        self.ui.tool_buttons["图像增强"].clicked.connect(lambda: apply_image_enhancement(self.ui))
+        self.ui.tool_buttons["保存"].clicked.connect(self.export_surfaces)
+        self.ui.tool_buttons["图像增强"].clicked.connect(lambda: enhancement_utils.apply_image_enhancement(self.ui))
 
     def load_dicom(self):
         folder = QFileDialog.getExistingDirectory(None, "选择DICOM文件夹")
         if folder:
             try:
-                self.image, self.array, self.metadata = read_dicom_series(folder, return_numpy=True)
-                show_views_with_slider(self.array, self.ui, self.image)
-                renderer = vtk.vtkRenderer()
-                renderer.SetBackground(0.0, 0.0, 0.0)
-                self.ui.threeDWidget.GetRenderWindow().AddRenderer(renderer)
-                self.ui.threeDWidget.GetRenderWindow().Render()
-                self.display_dicom_info()
-                self.update_histogram()
+                series = self.choose_series(folder)
+                if series is None:
+                    return
             except Exception as e:
                 QMessageBox.warning(self.ui, "错误", f"加载DICOM失败:\n{str(e)}")
+                return
+            # 解码、归一化和直方图统计都在后台完成，界面保持可交互
+            self.jobs.submit("load", lambda job: self._load_volume(job, folder, series),
+                             on_done=self.on_dicom_loaded,
+                             on_error=lambda e: QMessageBox.warning(self.ui, "错误", f"加载DICOM失败:\n{str(e)}"))
+
+    def _load_volume(self, job, folder, series):
+        """工作线程：读取序列并预先算好显示所需的归一化结果和直方图"""
+        def on_slice(index, slice_array, loaded, total):
+            if index == total // 2:
+                job.post(self.show_preview, slice_array)
+            if loaded == total or loaded % 16 == 0:
+                job.report(loaded, total, "正在加载切片")
+
+        image, array, metadata = image_io.read_dicom_series_cached(folder, series, cache=self.volume_cache,
+                                                                   on_slice=on_slice)
+        job.report(0, 2, "正在归一化")
+        normalization_utils.normalize_volume(array)
+        job.report(1, 2, "正在统计直方图")
+        engine = histogram_utils.HistogramEngine(array)
+        return image, array, metadata, engine
+
+    def on_dicom_loaded(self, result):
+        self.image, self.array, self.metadata, self.histogram_engine = result
+        self.jobs.cancel("transform")
+        self.original_array = self.array
+        self.transforms = image_ops.TransformStack()
+        self.masks = None
+        self.filtered = self.filter_source = None
+        self.ui._label_overlay = None
+        visualization.show_views_with_slider(self.array, self.ui, self.image)
+        volume_rendering.get_volume_view(self.ui.threeDWidget).clear_meshes()
+        self.update_volume_rendering()
+        self.display_dicom_info()
+        self.update_histogram()
+
+    def choose_series(self, folder):
+        """列出文件夹中的序列（优先 DICOMDIR），多于一个时由用户选择"""
+        series = image_io.list_dicom_series(folder)
+        if not series:
+            raise RuntimeError("未找到 DICOM 序列")
+        if len(series) == 1:
+            return series[0]
+        labels = [f"{i + 1}. {describe_series(s)}" for i, s in enumerate(series)]
+        label, ok = QInputDialog.getItem(self.ui, "选择序列", "该文件夹包含多个序列，请选择：", labels, 0, False)
+        if not ok:
+            return None
+        return series[labels.index(label)]
+
+    def show_preview(self, slice_array):
+        # 中间轴位切片先到先显示，其余切片后台继续解码
+        preview = visualization.preprocess_array(slice_array)
+        visualization.render_slice(preview, self.ui.axialWidget, reset_camera=True)
+
+    def on_job_progress(self, key, done, total, message):
+        self.ui.jobProgress.setMaximum(max(total, 1))
+        self.ui.jobProgress.setValue(done)
+        self.ui.status_bar.showMessage(f"{message}: {done}/{total}")
+
+    def on_jobs_busy(self, busy):
+        self.ui.jobProgress.setVisible(busy)
+        self.ui.cancelJobButton.setVisible(busy)
+        if busy:
+            self.ui.jobProgress.setValue(0)
+        else:
+            self.ui.status_bar.clearMessage()
 
     def load_orthodontic_dicom(self):
         print("[正畸] 加载正畸图像")
-        success = self.orthodontic.load_second_image()
-        if success:
-            self.orthodontic.apply_overlay()
-        else:
+        started = self.orthodontic.load_second_image(on_loaded=self.orthodontic.apply_overlay)
+        if not started:
             print("[正畸] 加载失败或被用户取消")
 
     def display_dicom_info(self):
@@ -112,8 +219,7 @@ class Controller:
         self.ui.info_table.resizeColumnsToContents()
 
     def update_from_slider(self, orientation, index):
-        update_slice(self.array, self.ui, orientation, index, sitk_image=self.image)
-        update_status_bar(self.ui)
+        self.scheduler.request_slice(orientation, index, self.image)
     # def update_from_slider(self, orientation, index):
     #     if self.array is None:
     #         return
@@ -147,29 +253,61 @@ class Controller:
         if self.array is None:
             return
         print(f"[平移] dx={dx}, dy={dy}, dz={dz}")
-        self.array = translate_3d(self.array, dx=dx, dy=dy, dz=dz)
-        show_views_with_slider(self.array, self.ui, self.image)
+        self.transforms.translate(dx=dx, dy=dy, dz=dz)
+        self.refresh_transformed()
 
-    def apply_rotation(self, angle):
+    def apply_rotation(self, angles):
+        """:param angles: 欧拉角 [α, β, γ]（绕 Z, X, Y 轴）；只给一个数时为绕 Z 轴旋转"""
         if self.array is None:
             return
-        print(f"[旋转] angle={angle}")
-        self.array = rotate_3d(self.array, angle=angle, axes=(1, 2))
-        show_views_with_slider(self.array, self.ui, self.image)
+        angles = np.atleast_1d(np.asarray(angles, dtype=float))
+        angles = np.pad(angles, (0, 3 - len(angles)))
+        print(f"[旋转] angles={angles.tolist()}")
+        rotation = image_ops.euler_rotation_matrix(angles)
+        self.transforms.rotate(rotation, image_ops.volume_center(self.original_array.shape))
+        self.refresh_transformed()
 
-    # def on_rotation_finished(self, result_array):
-    #     print("[旋转] 线程完成，刷新界面")
-    #     self.array = result_array
-    #     show_views_with_slider(self.array, self.ui, self.image)
-    #     self.update_histogram()
-    #
-    # def apply_rotation(self, angle_xyz):
-    #     if self.array is None:
-    #         return
-    #     print(f"[旋转] 启动线程, angles={angle_xyz}")
-    #     self.rotation_thread = RotationWorker(self.array.copy(), angle_xyz)
-    #     self.rotation_thread.finishing.connect(self.on_rotation_finished)
-    #     self.rotation_thread.start()
+    @instrumentation.traced("transform_preview", "transform")
+    def refresh_transformed(self):
+        # 始终从原始体数据出发；交互阶段只重采样当前显示的三个平面，整体重采样留到提交时
+        self.jobs.cancel("transform", reason="变换已更新，放弃未完成的整体重采样")
+        self.array = self.transforms.reslice(self.original_array)
+        self.update_label_overlay()
+        visualization.show_views_with_slider(self.displayed_array(), self.ui, self.image)
+        self.update_histogram()
+        self.update_volume_rendering()
+        self.update_surface_matrices()
+
+    def commit_transform(self):
+        """把当前变换整体重采样为真实体数据（导出、三维处理前使用），在后台分块执行"""
+        if not isinstance(self.array, image_ops.ReslicedVolume):
+            return
+        print("[变换] 整体重采样")
+        resliced = self.array
+        self.jobs.submit("transform",
+                         lambda job: resliced.materialize(progress=lambda done, total: job.report(done, total, "正在重采样")),
+                         on_done=lambda result: self.on_transform_committed(resliced, result))
+
+    def on_transform_committed(self, resliced, result):
+        if self.array is not resliced:
+            return
+        self.array = result
+        visualization.show_views_with_slider(self.displayed_array(), self.ui, self.image)
+        self.update_histogram()
+
+    def undo_transform(self):
+        if self.original_array is None or not self.transforms.can_undo():
+            return
+        self.transforms.undo()
+        print("[撤销] 回到上一步变换")
+        self.refresh_transformed()
+
+    def redo_transform(self):
+        if self.original_array is None or not self.transforms.can_redo():
+            return
+        self.transforms.redo()
+        print("[重做] 恢复下一步变换")
+        self.refresh_transformed()
 
     def show_translation_dialog(self):
         dlg = TransformDialog(mode="translate", parent=self.ui)
@@ -180,48 +318,326 @@ class Controller:
     def show_rotation_dialog(self):
         dlg = TransformDialog(mode="rotate", parent=self.ui)
         if dlg.exec_():
-            angle = dlg.get_rotation_angle()
-            self.apply_rotation(angle)
+            angles = dlg.get_rotation_angles()
+            self.apply_rotation(angles)
 
 
+    @instrumentation.traced("histogram", "histogram")
     def update_histogram(self, slider=None, index=None):
         if self.array is None:
             return
         choice = self.ui.hist_source_box.currentText().lower()
-        z, y, x = self.array.shape
-
-        if choice == "axial":
-            idx = index if slider == "axial" and index is not None else self.ui.axialBar.value()
-            data = self.array[idx, :, :]
-        elif choice == "sagittal":
-            idx = index if slider == "sagittal" and index is not None else self.ui.sagittalBar.value()
-            data = self.array[:, :, idx]
-        elif choice == "coronal":
-            idx = index if slider == "coronal" and index is not None else self.ui.coronalBar.value()
-            data = self.array[:, idx, :]
-        else:
-            data = self.array.flatten()
 
-        self.ui.hist_ax.clear()
-        draw_histogram(data, self.ui.hist_ax, mode=choice)
-        self.ui.hist_canvas.draw()
+        # 体数据变化（加载、提交变换）后才重新统计，滚动时只查表
+        resliced = isinstance(self.array, image_ops.ReslicedVolume)
+        base = self.array.source if resliced else self.array
+        if self.histogram_engine is None or not self.histogram_engine.matches(base):
+            self.histogram_engine = histogram_utils.HistogramEngine(base)
+
+        bars = {"axial": self.ui.axialBar, "sagittal": self.ui.sagittalBar, "coronal": self.ui.coronalBar}
+        idx = None
+        if choice in bars:
+            idx = index if slider == choice and index is not None else bars[choice].value()
+
+        engine = self.histogram_engine
+        if resliced and choice in bars:
+            # 变换尚未提交：直接统计按需重采样出的当前平面
+            counts = engine.plane_counts(visualization.get_slice_image(self.array, choice, idx))
+        else:
+            counts = engine.counts(choice, idx)
+        if self.histogram_plot is None:
+            self.histogram_plot = histogram_utils.HistogramPlot(self.ui.ensure_hist_canvas())
+        self.histogram_plot.update(engine.edges, counts, mode=choice)
+        self.ui.hist_canvas.draw_idle()
 
     def toggle_measurement_mode(self):
         self.measurement_enabled = not self.measurement_enabled
         print(f"[测量模式] {'开启' if self.measurement_enabled else '关闭'}")
-        enable_measurement(self.ui, self.measurement_enabled, self.image)
+        visualization.enable_measurement(self.ui, self.measurement_enabled, self.image)
 
     def start_segmentation(self):
-        if not hasattr(self.ui, "_preprocessed_array"):
+        """三维阈值分割 + 连通域标记（原始强度），结果作为标签叠加在三个视图上"""
+        if self.original_array is None:
+            QMessageBox.warning(self.ui, "错误", "请先加载图像！")
+            return
+        lower, ok = QInputDialog.getInt(self.ui, "三维阈值分割", "强度下限:", self.segment_range[0], -32768, 32767)
+        if not ok:
+            return
+        upper, ok = QInputDialog.getInt(self.ui, "三维阈值分割", "强度上限:", self.segment_range[1], lower, 32767)
+        if not ok:
+            return
+        self.segment_range = (lower, upper)
+        volume = self.original_array
+
+        def run(job):
+            job.report(0, 2, "正在三维分割")
+            labels, count = segmentation_utils.segment_volume(volume, lower, upper)
+            job.report(1, 2, "正在压缩掩膜")
+            return label_mask.MaskSet.from_labels(labels), count
+
+        self.jobs.submit("segment", run, on_done=self.on_segmented)
+
+    def on_segmented(self, result):
+        masks, count = result
+        stats = masks.union().stats(self.image.GetSpacing())
+        print(f"[分割] {count} 个连通域, {stats['voxels']} 个体素, {stats['volume_ml']:.2f} mL, "
+              f"掩膜占用 {masks.nbytes / 1e6:.1f} MB")
+        self.ui.status_bar.showMessage(f"分割完成：{count} 个连通域，总体积 {stats['volume_ml']:.2f} mL", 5000)
+        self.set_masks(masks)
+
+    def start_region_grow(self):
+        """进入种子拾取模式，点击任一视图中的牙齿/骨骼后在后台做区域生长"""
+        if self.original_array is None:
+            QMessageBox.warning(self.ui, "错误", "请先加载图像！")
+            return
+        self.ui.status_bar.showMessage("区域生长：请在任一视图中点击种子点")
+        visualization.enable_seed_picking(self.ui, self.image, self.on_seed_picked)
+
+    def on_seed_picked(self, seed):
+        visualization.enable_measurement(self.ui, False, self.image)  # 恢复滚动浏览
+        # 显示坐标经当前变换的逆映射回原始网格
+        source = np.linalg.inv(self.transforms.matrix) @ np.array(list(seed) + [1.0])
+        seed = tuple(int(np.clip(round(v), 0, n - 1)) for v, n in zip(source[:3], self.original_array.shape))
+        lower, upper = self.segment_range
+        print(f"[区域生长] 种子 {seed}, 范围 [{lower}, {upper}]")
+        volume = self.original_array
+
+        def run(job):
+            job.report(0, 1, "正在区域生长")
+            region = segmentation_utils.region_grow(volume, seed, lower, upper)
+            return None if region is None else label_mask.BitMask.from_dense(region)
+
+        self.jobs.submit("segment", run, on_done=self.on_region_grown)
+
+    def on_region_grown(self, region):
+        if region is None:
+            QMessageBox.information(self.ui, "区域生长", "种子点强度不在分割范围内")
+            return
+        # 每次生长的区域作为一个新掩膜加入集合（例如逐颗选取牙齿）
+        masks = self.masks if self.masks is not None else label_mask.MaskSet(self.original_array.shape)
+        name = f"区域 {len(masks) + 1}"
+        masks.add(name, region)
+        stats = region.stats(self.image.GetSpacing())
+        print(f"[区域生长] {name}: {stats['voxels']} 个体素, {stats['volume_mm3']:.1f} mm³")
+        self.ui.status_bar.showMessage(f"{name}：{stats['voxels']} 个体素，体积 {stats['volume_mm3']:.1f} mm³", 5000)
+        self.set_masks(masks)
+
+    def set_masks(self, masks):
+        self.masks = masks
+        self.update_label_overlay()
+        self.refresh_views()
+
+    def clear_segmentation(self):
+        self.set_masks(None)
+
+    def update_label_overlay(self):
+        # 标签跟随当前（未提交的）变换按最近邻取平面
+        if self.masks is None or not len(self.masks):
+            self.ui._label_overlay = None
+        else:
+            self.ui._label_overlay = self.transforms.reslice(self.masks, order=0)
+
+    def update_volume_rendering(self):
+        """后台生成体绘制的粗层和细层，粗层先显示；变换后的体数据直接在粗网格上重采样"""
+        view = volume_rendering.get_volume_view(self.ui.threeDWidget)
+        volume, spacing = self.array, self.image.GetSpacing()
+
+        def run(job):
+            volume_rendering.render_volume_levels(
+                volume, spacing,
+                on_level=lambda level, array, factor: job.post(view.set_level, level, array, spacing, factor),
+                progress=lambda done, total: job.report(done, total, "正在准备体绘制"))
+
+        self.jobs.submit("volume_render", run)
+
+    def set_volume_preset(self, preset):
+        volume_rendering.get_volume_view(self.ui.threeDWidget).set_preset(preset)
+
+    def extract_surface(self, preset):
+        config = ISO_PRESETS[preset]
+        self.start_surface(config["label"], config["level"], config["color"])
+
+    def extract_custom_surface(self):
+        if self.original_array is None:
+            QMessageBox.warning(self.ui, "错误", "请先加载图像！")
+            return
+        level, ok = QInputDialog.getInt(self.ui, "等值面", "阈值:", ISO_PRESETS["bone"]["level"], -32768, 32767)
+        if ok:
+            self.start_surface(f"阈值 {level}", level, ISO_PRESETS["bone"]["color"])
+
+    def start_surface(self, name, level, color):
+        """后台提取原始体数据的等值面；网格按 (体数据, 阈值) 缓存，显示时再套用当前变换"""
+        if self.original_array is None:
             QMessageBox.warning(self.ui, "错误", "请先加载图像！")
             return
-        window_width = 100
-        window_level = 200
-        for orientation in ["axial", "sagittal", "coronal"]:
-            segment(self.ui, orientation, window_width, window_level)
+        volume, spacing = self.original_array, self.image.GetSpacing()
+        self.jobs.submit(
+            "surface",
+            lambda job: isosurface.volume_mesh(volume, level, spacing,
+                                               progress=lambda d, t: job.report(d, t, "正在提取表面")),
+            on_done=lambda mesh: self.show_surface(name, mesh, color))
+
+    def extract_mask_surface(self):
+        if self.masks is None or not len(self.masks):
+            QMessageBox.warning(self.ui, "错误", "请先进行分割！")
+            return
+        masks, spacing = self.masks, self.image.GetSpacing()
+        self.jobs.submit(
+            "surface",
+            lambda job: isosurface.mask_mesh(masks, spacing,
+                                             progress=lambda d, t: job.report(d, t, "正在提取表面")),
+            on_done=lambda mesh: self.show_surface("分割结果", mesh, isosurface.MASK_COLOR))
+
+    def show_surface(self, name, mesh, color):
+        if mesh is None:
+            return
+        # 同一时刻只显示一个表面，切换阈值时替换
+        view = volume_rendering.get_volume_view(self.ui.threeDWidget)
+        for other in list(view.meshes):
+            if other != name:
+                view.remove_mesh(other, render=False)
+        view.set_mesh(name, mesh, color, isosurface.xyz_matrix(self.transforms.matrix, self.image.GetSpacing()))
+        self.ui.status_bar.showMessage(f"表面 {name}：{mesh.GetNumberOfPolys()} 个三角形", 5000)
+
+    def update_surface_matrices(self):
+        view = volume_rendering.get_volume_view(self.ui.threeDWidget)
+        if not view.meshes:
+            return
+        matrix = isosurface.xyz_matrix(self.transforms.matrix, self.image.GetSpacing())
+        for name in view.meshes:
+            view.set_mesh_matrix(name, matrix)
+        view.render()
+
+    def clear_surfaces(self):
+        volume_rendering.get_volume_view(self.ui.threeDWidget).clear_meshes()
+
+    def export_surfaces(self):
+        """“保存”：把三维视图中的表面（含当前变换）按原图的原点和方向导出为患者坐标（mm）下的 STL/PLY"""
+        meshes = volume_rendering.get_volume_view(self.ui.threeDWidget).mesh_data()
+        if not meshes:
+            QMessageBox.warning(self.ui, "错误", "请先在“三维”菜单中提取表面！")
+            return
+        path, _ = QFileDialog.getSaveFileName(self.ui, "导出表面", "surface.stl", "STL (*.stl);;PLY (*.ply)")
+        if not path:
+            return
+        try:
+            isosurface.save_mesh(meshes, path, self.image)
+        except (ValueError, IOError) as e:
+            QMessageBox.critical(self.ui, "导出失败", str(e))
+            return
+        self.ui.status_bar.showMessage(f"已导出 {path}（患者坐标，单位 mm）", 5000)
+
+    def start_volume_filter(self, name):
+        """对当前体数据做三维滤波（后台分块多线程），完成后三个视图显示滤波结果"""
+        if self.original_array is None:
+            QMessageBox.warning(self.ui, "错误", "请先加载图像！")
+            return
+        params = self.ask_filter_params(name)
+        if params is None:
+            return
+        # 未提交的变换不影响滤波：在原网格上滤波，显示时套用同一变换
+        source = self.array.source if isinstance(self.array, image_ops.ReslicedVolume) else self.array
+        label = VOLUME_FILTERS[name]["label"]
+
+        def run(job):
+            return volume_filters.filtered_volume(
+                source, name, params, progress=lambda done, total: job.report(done, total, f"正在三维滤波（{label}）"))
+
+        self.jobs.submit("filter", run, on_done=lambda result: self.on_volume_filtered(source, label, result))
+
+    def ask_filter_params(self, name):
+        """询问滤波参数，取消时返回 None"""
+        defaults = VOLUME_FILTERS[name]["params"]
+        if name == "gaussian":
+            sigma, ok = QInputDialog.getDouble(self.ui, "高斯平滑", "sigma（体素）:", defaults["sigma"], 0.3, 10.0, 1)
+            return {"sigma": sigma} if ok else None
+        if name == "median":
+            size, ok = QInputDialog.getInt(self.ui, "中值滤波", "邻域边长（奇数）:", defaults["size"], 3, 7, 2)
+            return {"size": size | 1} if ok else None
+        if name == "clahe":
+            limit, ok = QInputDialog.getDouble(self.ui, "CLAHE", "对比度限制:", defaults["clip_limit"], 0.5, 40.0, 1)
+            return {"clip_limit": limit} if ok else None
+        return {}
+
+    def on_volume_filtered(self, source, label, result):
+        base = self.array.source if isinstance(self.array, image_ops.ReslicedVolume) else self.array
+        if base is not source:
+            return  # 滤波期间体数据已更换
+        self.filtered, self.filter_source = result, source
+        print(f"[滤波] 显示三维{label}结果")
+        visualization.show_views_with_slider(self.displayed_array(), self.ui, self.image)
+
+    def clear_volume_filter(self):
+        if self.filtered is None:
+            return
+        self.filtered = self.filter_source = None
+        visualization.show_views_with_slider(self.displayed_array(), self.ui, self.image)
+
+    def set_live_filter(self, name):
+        """开启（name 为 LIVE_FILTERS 中的键）或关闭（None）滚动时的逐切片滤波"""
+        if name is None:
+            if self.live is not None:
+                print(f"[实时滤波] 关闭 {self.live.stats()}")
+            self.ui._live_filter = None
+        else:
+            if self.live is None:
+                self.live = live_filter.LiveFilter()
+            self.live.set_filter(name)
+            self.ui._live_filter = self.live
+            print(f"[实时滤波] {name}")
+        if self.image is not None:
+            self.refresh_views()
+
+    def displayed_array(self):
+        """视图中显示的体数据：有三维滤波结果时显示滤波结果（跟随未提交的变换），否则为当前体数据"""
+        if self.filtered is not None:
+            if self.array is self.filter_source:
+                return self.filtered
+            if isinstance(self.array, image_ops.ReslicedVolume) and self.array.source is self.filter_source:
+                return self.array.with_source(self.filtered)
+            print("[滤波] 体数据已更新，恢复显示原图")
+            self.filtered = self.filter_source = None
+        return self.array
+
+    def update_perf_readout(self):
+        stats = instrumentation.frame_stats() if instrumentation.is_enabled() else None
+        if stats is None:
+            self.ui.perfLabel.clear()
+            return
+        fps, latency, worst = stats
+        self.ui.perfLabel.setText(f"{fps:.0f} FPS | 延迟 {latency * 1e3:.0f} ms（最大 {worst * 1e3:.0f} ms）")
+
+    def set_instrumentation(self, enabled):
+        instrumentation.set_enabled(enabled)
+        self.ui.traceMemoryAction.setEnabled(enabled)
+        if not enabled:
+            self.ui.perfLabel.clear()
+
+    def export_trace(self):
+        """导出最近的耗时记录（Chrome trace JSON），并在控制台打印各步骤的汇总"""
+        path, _ = QFileDialog.getSaveFileName(self.ui, "导出性能追踪", "cbct_trace.json", "Chrome Trace (*.json)")
+        if not path:
+            return
+        try:
+            count = instrumentation.export_chrome_trace(path)
+        except OSError as e:
+            QMessageBox.warning(self.ui, "错误", f"导出失败:\n{str(e)}")
+            return
+        summary = sorted(instrumentation.summary().items(), key=lambda item: -item[1]["total_ms"])
+        for name, item in summary:
+            print(f"[性能] {name}: {item['count']} 次, 平均 {item['mean_ms']:.2f} ms, "
+                  f"最大 {item['max_ms']:.2f} ms, 合计 {item['total_ms']:.0f} ms")
+        self.ui.status_bar.showMessage(f"已导出 {count} 个性能事件到 {path}", 5000)
+
+    def refresh_views(self):
+        bars = {"axial": self.ui.axialBar, "sagittal": self.ui.sagittalBar, "coronal": self.ui.coronalBar}
+        for orientation, bar in bars.items():
+            self.scheduler.request_slice(orientation, bar.value(), self.image)
 
     def reset_view(self):
         if self.image is None or self.array is None:
             return
-        show_views_with_slider(self.array, self.ui, self.image)
-        self.update_histogram()
+        if not self.transforms.is_identity():
+            # 复位到原始位置，记为一步，可撤销
+            self.transforms.reset()
+        self.refresh_transformed()
@@ -0,0 +1,290 @@
+import os
+import struct
+
+# DICOMDIR 目录记录中常用的关键 tag
+RECORD_TAGS = {
+    (0x0010, 0x0010): "PatientName",
+    (0x0010, 0x0020): "PatientID",
+    (0x0010, 0x0030): "PatientBirthDate",
+    (0x0010, 0x0040): "PatientSex",
+    (0x0008, 0x0020): "StudyDate",
+    (0x0008, 0x0030): "StudyTime",
+    (0x0008, 0x0050): "AccessionNumber",
+    (0x0008, 0x1030): "StudyDescription",
+    (0x0020, 0x000D): "StudyInstanceUID",
+    (0x0020, 0x0010): "StudyID",
+    (0x0008, 0x0060): "Modality",
+    (0x0008, 0x103E): "SeriesDescription",
+    (0x0020, 0x000E): "SeriesInstanceUID",
+    (0x0020, 0x0011): "SeriesNumber",
+    (0x0020, 0x0013): "InstanceNumber",
+    (0x0020, 0x0032): "ImagePositionPatient",
+    (0x0020, 0x0037): "ImageOrientationPatient",
+    (0x0020, 0x1041): "SliceLocation",
+    (0x0008, 0x0018): "SOPInstanceUID",
+    (0x0028, 0x0010): "Rows",
+    (0x0028, 0x0011): "Columns",
+}
+
+# 需要 4 字节长度字段的显式 VR
+LONG_VRS = {b"OB", b"OD", b"OF", b"OL", b"OW", b"SQ", b"UC", b"UN", b"UR", b"UT", b"OV", b"SV", b"UV"}
+# 隐式 VR 下无法从文件得知 VR，按 tag 指定，其余一律按字符串处理
+IMPLICIT_VRS = {
+    (0x0004, 0x1200): b"UL",
+    (0x0004, 0x1202): b"UL",
+    (0x0004, 0x1212): b"US",
+    (0x0004, 0x1220): b"SQ",
+    (0x0004, 0x1400): b"UL",
+    (0x0004, 0x1410): b"US",
+    (0x0004, 0x1420): b"UL",
+}
+UNDEFINED = 0xFFFFFFFF
+ITEM = (0xFFFE, 0xE000)
+ITEM_END = (0xFFFE, 0xE00D)
+SEQ_END = (0xFFFE, 0xE0DD)
+
+
+class DicomDirError(RuntimeError):
+    pass
+
+
+def _read_header(data, pos, explicit):
+    group, elem = struct.unpack_from("<HH", data, pos)
+    tag = (group, elem)
+    if group == 0xFFFE or not explicit:
+        # 条目分隔符以及隐式 VR 均为 4 字节长度
+        length = struct.unpack_from("<I", data, pos + 4)[0]
+        vr = None if group == 0xFFFE else IMPLICIT_VRS.get(tag, b"LO")
+        return tag, vr, pos + 8, length
+    vr = data[pos + 4:pos + 6]
+    if vr in LONG_VRS:
+        length = struct.unpack_from("<I", data, pos + 8)[0]
+        return tag, vr, pos + 12, length
+    length = struct.unpack_from("<H", data, pos + 6)[0]
+    return tag, vr, pos + 8, length
+
+
+def _decode_value(vr, raw):
+    if vr == b"US":
+        return struct.unpack_from("<H", raw)[0] if len(raw) >= 2 else 0
+    if vr == b"UL":
+        return struct.unpack_from("<I", raw)[0] if len(raw) >= 4 else 0
+    return raw.decode("latin-1", errors="replace").rstrip("\x00 ")
+
+
+def _parse_items(data, pos, length, explicit):
+    """解析序列中的所有条目，返回 [(条目起始偏移, 元素字典), ...] 与序列结束位置"""
+    items = []
+    end = None if length == UNDEFINED else pos + length
+    while end is None or pos < end:
+        tag, _, value_pos, item_length = _read_header(data, pos, explicit)
+        if tag == SEQ_END:
+            return items, value_pos
+        if tag != ITEM:
+            raise DicomDirError(f"序列中出现非法 tag: {tag}")
+        item_end = None if item_length == UNDEFINED else value_pos + item_length
+        elements, pos = _parse_dataset(data, value_pos, item_end, explicit)
+        items.append((value_pos - 8, elements))
+    return items, pos
+
+
+def _parse_dataset(data, pos, end, explicit):
+    """解析数据集（end 为 None 表示以条目结束符终止），返回元素字典与结束位置"""
+    elements = {}
+    limit = len(data) if end is None else end
+    while pos < limit:
+        tag, vr, value_pos, length = _read_header(data, pos, explicit)
+        if tag == ITEM_END:
+            return elements, value_pos
+        if vr == b"SQ" or length == UNDEFINED:
+            elements[tag], pos = _parse_items(data, value_pos, length, explicit)
+            continue
+        elements[tag] = _decode_value(vr, data[value_pos:value_pos + length])
+        pos = value_pos + length
+    return elements, pos
+
+
+def _parse_file(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[128:132] != b"DICM":
+        raise DicomDirError(f"不是合法的 DICOM 文件: {path}")
+
+    # 文件元信息（0002 组）始终为显式 VR 小端
+    meta, pos = {}, 132
+    while pos < len(data) and struct.unpack_from("<H", data, pos)[0] == 0x0002:
+        tag, vr, value_pos, length = _read_header(data, pos, True)
+        meta[tag] = _decode_value(vr, data[value_pos:value_pos + length])
+        pos = value_pos + length
+
+    explicit = meta.get((0x0002, 0x0010), "1.2.840.10008.1.2.1") != "1.2.840.10008.1.2"
+    dataset, _ = _parse_dataset(data, pos, None, explicit)
+    return dataset
+
+
+def _record_to_dict(elements):
+    record = {name: elements[tag] for tag, name in RECORD_TAGS.items() if tag in elements}
+    record["type"] = str(elements.get((0x0004, 0x1430), "")).strip().upper()
+    file_id = elements.get((0x0004, 0x1500))
+    if file_id:
+        record["file_id"] = [part for part in str(file_id).split("\\") if part]
+    return record
+
+
+def _walk_records(records, first_offset):
+    """按 DICOMDIR 中的偏移链表（下一条/下一级）重建层级结构"""
+    nodes = []
+    offset, seen = first_offset, set()
+    while offset and offset in records and offset not in seen:
+        seen.add(offset)
+        elements = records[offset]
+        # 0x0000 表示该记录已失效
+        if elements.get((0x0004, 0x1410), 0xFFFF) != 0:
+            node = _record_to_dict(elements)
+            node["children"] = _walk_records(records, elements.get((0x0004, 0x1420), 0))
+            nodes.append(node)
+        offset = elements.get((0x0004, 0x1400), 0)
+    return nodes
+
+
+def _walk_sequential(items):
+    """偏移信息缺失时，按记录出现顺序和类型层级重建结构"""
+    levels = {"PATIENT": 0, "STUDY": 1, "SERIES": 2}
+    roots, stack = [], []
+    for _, elements in items:
+        if elements.get((0x0004, 0x1410), 0xFFFF) == 0:
+            continue
+        node = _record_to_dict(elements)
+        node["children"] = []
+        level = levels.get(node["type"], 3)
+        del stack[level:]
+        parent = stack[-1] if stack else None
+        (parent["children"] if parent else roots).append(node)
+        if level < 3:
+            stack.append(node)
+    return roots
+
+
+class _PathResolver:
+    """DICOMDIR 中的文件 ID 为大写，在大小写敏感的文件系统上逐级做不区分大小写的匹配"""
+
+    def __init__(self, root):
+        self.root = root
+        self._listings = {}
+
+    def resolve(self, parts):
+        path = os.path.join(self.root, *parts)
+        if os.path.exists(path):
+            return path
+        current = self.root
+        for part in parts:
+            if current not in self._listings:
+                try:
+                    self._listings[current] = {name.upper(): name for name in os.listdir(current)}
+                except OSError:
+                    self._listings[current] = {}
+            current = os.path.join(current, self._listings[current].get(part.upper(), part))
+        return current
+
+
+def _slice_sort_key(image):
+    position = image.get("ImagePositionPatient")
+    orientation = image.get("ImageOrientationPatient")
+    if position and orientation:
+        try:
+            p = [float(v) for v in position.split("\\")]
+            o = [float(v) for v in orientation.split("\\")]
+            normal = (o[1] * o[5] - o[2] * o[4], o[2] * o[3] - o[0] * o[5], o[0] * o[4] - o[1] * o[3])
+            return 0, sum(a * b for a, b in zip(p, normal))
+        except (ValueError, IndexError):
+            pass
+    # 与 GDCM 一致按层面位置升序；缺失时退化为 SliceLocation、InstanceNumber
+    for rank, key in enumerate(("SliceLocation", "InstanceNumber"), start=1):
+        try:
+            return rank, float(image.get(key, ""))
+        except ValueError:
+            continue
+    return 3, 0.0
+
+
+def read_dicomdir(path):
+    """
+    读取 DICOMDIR 索引（只读这一个文件，不打开任何图像文件）
+    :param path: DICOMDIR 文件路径
+    :return: 患者列表，每个患者含 studies，每个 study 含 series，每个 series 含已排序的 files
+    """
+    try:
+        dataset = _parse_file(path)
+    except (struct.error, IndexError) as e:
+        raise DicomDirError(f"DICOMDIR 文件损坏: {e}")
+    items = dataset.get((0x0004, 0x1220), [])
+    records = {offset: elements for offset, elements in items}
+    first_offset = dataset.get((0x0004, 0x1200), 0)
+    roots = _walk_records(records, first_offset) if first_offset in records else _walk_sequential(items)
+
+    resolver = _PathResolver(os.path.dirname(os.path.abspath(path)))
+    patients = []
+    for patient_node in roots:
+        if patient_node["type"] != "PATIENT":
+            continue
+        patient = {k: v for k, v in patient_node.items() if k not in ("children", "type")}
+        patient["studies"] = []
+        for study_node in patient_node["children"]:
+            if study_node["type"] != "STUDY":
+                continue
+            study = {k: v for k, v in study_node.items() if k not in ("children", "type")}
+            study["series"] = []
+            for series_node in study_node["children"]:
+                if series_node["type"] != "SERIES":
+                    continue
+                series = {k: v for k, v in series_node.items() if k not in ("children", "type")}
+                images = [node for node in series_node["children"] if node.get("file_id")]
+                images.sort(key=_slice_sort_key)
+                series["files"] = [resolver.resolve(node["file_id"]) for node in images]
+                if series["files"]:
+                    study["series"].append(series)
+            patient["studies"].append(study)
+        patients.append(patient)
+    return patients
+
+
+def find_dicomdir(folder, max_depth=3):
+    """在所选文件夹及其上级目录中查找 DICOMDIR"""
+    current = os.path.abspath(folder)
+    for _ in range(max_depth + 1):
+        try:
+            names = os.listdir(current)
+        except OSError:
+            names = []
+        for name in names:
+            if name.upper() == "DICOMDIR" and os.path.isfile(os.path.join(current, name)):
+                return os.path.join(current, name)
+        parent = os.path.dirname(current)
+        if parent == current:
+            break
+        current = parent
+    return None
+
+
+def list_series(patients):
+    """将层级索引展开为 series 列表，并附带所属患者和检查的信息"""
+    result = []
+    for patient in patients:
+        for study in patient["studies"]:
+            for series in study["series"]:
+                entry = dict(series)
+                entry["patient"] = {k: v for k, v in patient.items() if k != "studies"}
+                entry["study"] = {k: v for k, v in study.items() if k != "series"}
+                result.append(entry)
+    return result
+
+
+def describe_series(series):
+    """生成用于界面选择的序列简述"""
+    parts = [
+        series.get("SeriesNumber", ""),
+        series.get("Modality", ""),
+        series.get("SeriesDescription", ""),
+        f"{len(series.get('files', []))} 张",
+    ]
+    return " | ".join(str(p) for p in parts if p)
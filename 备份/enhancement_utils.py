@@ -1,9 +1,10 @@
 import cv2
 import numpy as np
-from PyQt5.QtWidgets import QMessageBox, QInputDialog
 from visualization import numpy_to_vtk_image2d, render_image2d, get_slice_image
 
 def apply_image_enhancement(ui):
+    from PyQt5.QtWidgets import QMessageBox, QInputDialog  # 滤波函数本身不依赖 Qt，可在批处理中使用
+
     if not hasattr(ui, "_preprocessed_array"):
         QMessageBox.warning(ui, "错误", "请先加载 DICOM 数据！")
         return
@@ -60,3 +61,12 @@ def cv2_Sobel_filter(image, direction='both'):
 
 def cv2_Laplace_filter(image):
     return cv2.Laplacian(image, cv2.CV_8U)
+
+def enhance_slice(slice_array, filter_name, direction='both'):
+    """二维增强：Sobel/Laplace 结果与原切片 1:1 混合（与图像增强工具的显示效果一致）"""
+    slice_array = np.ascontiguousarray(slice_array, dtype=np.uint8)
+    if filter_name == "sobel":
+        filtered = cv2_Sobel_filter(slice_array, direction)
+    else:
+        filtered = cv2_Laplace_filter(slice_array)
+    return cv2.addWeighted(slice_array, 0.5, filtered, 0.5, 0)
@@ -0,0 +1,161 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from image_ops import ReslicedVolume, rigid_matrix, PLANE_AXES
+from normalization_utils import normalize_volume
+from presets import FUSION_MODES
+
+SLICE_CACHE_SIZE = 12  # 缓存的融合切片数（三个视图来回切换时命中）
+
+
+class FusionEngine:
+    """
+    按需融合两幅体数据：第二幅图像只归一化一次，平移/旋转合成为一个仿射矩阵，
+    只对当前显示的平面重采样并混合；参数变化时只清空切片缓存
+    """
+
+    def __init__(self, base, moving, mode="add", alpha=0.5, checker=32, alignment=None):
+        """
+        :param base: 显示用的第一幅图像（已归一化的 uint8 体数据或 ReslicedVolume）
+        :param moving: 第二幅图像（原始强度），归一化结果有缓存；尺寸可以与 base 不同
+        :param mode: FUSION_MODES 中的一种
+        :param alpha: alpha/叠加模式中第二幅图像的权重
+        :param checker: 棋盘格边长（体素）
+        :param alignment: 把第二幅图像放到 base 网格上的 4x4 正向矩阵（物理坐标对齐或配准结果），默认单位阵
+        """
+        self.base = base
+        self.moving = normalize_volume(moving)
+        self.shape = tuple(base.shape)
+        self.mode = mode
+        self.alpha = alpha
+        self.checker = checker
+        self.alignment = np.eye(4) if alignment is None else np.asarray(alignment, dtype=float)
+        self.translation = (0, 0, 0)
+        self.rotation = (0, 0, 0)
+        self._resliced = None
+        self._cache = OrderedDict()
+        # 实时滤波的预取线程也会调用 plane()：缓存的读写都在锁内，参数变化时 _generation 加一，
+        # 旧参数下算出的切片不再写入缓存
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._update()
+
+    def set_transform(self, translation=(0, 0, 0), rotation=(0, 0, 0)):
+        """手动微调：先平移再按欧拉角 [α, β, γ] 绕体中心旋转（与 transform_3d 一致），叠加在 alignment 之后"""
+        translation = tuple(translation)
+        rotation = tuple(np.pad(np.atleast_1d(np.asarray(rotation, dtype=float)), (0, 3 - np.size(rotation))))
+        if translation == self.translation and rotation == self.rotation:
+            return
+        self.translation, self.rotation = translation, rotation
+        self._update()
+
+    def set_alignment(self, matrix):
+        self.alignment = np.asarray(matrix, dtype=float)
+        self._update()
+
+    def _update(self):
+        matrix = rigid_matrix(self.shape, self.translation, self.rotation) @ self.alignment
+        if np.allclose(matrix, np.eye(4)) and tuple(self.moving.shape) == self.shape:
+            self._resliced = self.moving
+        else:
+            self._resliced = ReslicedVolume(self.moving, matrix, order=1, shape=self.shape)
+        self._clear_cache()
+
+    def _clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._generation += 1
+
+    def set_mode(self, mode, alpha=None):
+        if mode not in FUSION_MODES:
+            raise ValueError(f"Unsupported fusion mode: {mode}")
+        self.mode = mode
+        if alpha is not None:
+            self.alpha = alpha
+        self._clear_cache()
+
+    def plane(self, axis, index):
+        key = (axis, index)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+            generation = self._generation
+        # 重采样和混合在锁外进行，GUI 线程不必等待预取线程
+        base = np.asarray(self.base[(slice(None),) * axis + (index,)])
+        moving = np.asarray(self._resliced[(slice(None),) * axis + (index,)])
+        result = self.blend(base, moving, axis, index)
+        with self._lock:
+            if generation == self._generation:
+                self._cache[key] = result
+                if len(self._cache) > SLICE_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return result
+
+    def blend(self, base, moving, axis, index):
+        base = base.astype(np.float32)
+        moving = moving.astype(np.float32)
+        if self.mode == "add":
+            # 与原先整体叠加的公式一致
+            return np.clip(base + self.alpha * moving, 0, 255).astype(np.uint8)
+        if self.mode == "alpha":
+            return ((1 - self.alpha) * base + self.alpha * moving).astype(np.uint8)
+        if self.mode == "color":
+            # 第一幅为品红、第二幅为绿色：重合处呈灰白，错位处显色
+            b, m = base.astype(np.uint8), moving.astype(np.uint8)
+            return np.stack([b, m, b], axis=-1)
+        # 棋盘格：按三维体素坐标划分，三个视图中的格子彼此对应
+        inplane = [a for a in range(3) if a != axis]
+        u = np.arange(self.shape[inplane[0]])[:, None] // self.checker
+        v = np.arange(self.shape[inplane[1]])[None, :] // self.checker
+        mask = (u + v + index // self.checker) % 2 == 1
+        return np.where(mask, moving, base).astype(np.uint8)
+
+    def volume(self):
+        return FusionVolume(self)
+
+
+class FusionVolume:
+    """
+    融合结果的惰性体数据视图：取轴位/冠状/矢状平面时才计算该平面；
+    彩色模式下平面形状为 (h, w, 3)。结果已是显示用 uint8，不再归一化
+    """
+
+    normalized = True
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.shape = engine.shape
+        self.dtype = np.dtype(np.uint8)
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def version(self):
+        """融合参数每变化一次加一（对象本身不变，切片缓存据此判断是否过期）"""
+        return self.engine._generation
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        ints = [i for i, k in enumerate(key) if isinstance(k, (int, np.integer))]
+        full = [i for i, k in enumerate(key) if isinstance(k, slice) and k == slice(None)]
+        if len(ints) == 1 and len(full) == 2:
+            axis = ints[0]
+            index = int(key[axis])
+            if index < 0:
+                index += self.shape[axis]
+            return self.engine.plane(axis, index)
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None, copy=None):
+        array = np.stack([self.engine.blend(np.asarray(self.engine.base[z]),
+                                            np.asarray(self.engine._resliced[z]), PLANE_AXES['axial'], z)
+                          for z in range(self.shape[0])])
+        return array if dtype is None else array.astype(dtype, copy=False)
@@ -1,10 +1,100 @@
+import weakref
+
 import numpy as np
+from normalization_utils import integer_domain, lut_index, iter_slabs
+from instrumentation import traced
+
+class HistogramEngine:
+    """
+    一次遍历体数据，预先算好三个方向每张切片的整数直方图：
+    axial[z]、coronal[y]、sagittal[x] 各为 (切片数, bins) 的计数表，整体直方图由求和得到
+    """
+
+    @traced("histogram_stats", "histogram")
+    def __init__(self, volume, bins=100):
+        self.bins = bins
+        self._source = weakref.ref(volume)
+        self.shape = volume.shape
+
+        vmin = min(float(slab.min()) for _, _, slab in iter_slabs(volume))
+        vmax = max(float(slab.max()) for _, _, slab in iter_slabs(volume))
+        self.edges = np.linspace(vmin, vmax, bins + 1)
+
+        z, y, x = volume.shape
+        self.axial = np.zeros((z, bins), dtype=np.int64)
+        self.coronal = np.zeros((y, bins), dtype=np.int64)
+        self.sagittal = np.zeros((x, bins), dtype=np.int64)
+
+        domain = integer_domain(volume.dtype)
+        lut = self._bin_lut(domain) if domain is not None else None
+        self._dtype = np.dtype(volume.dtype)
+        self._lut = lut
+        y_index = (np.arange(y, dtype=np.int32) * bins)[None, :, None]
+        x_index = (np.arange(x, dtype=np.int32) * bins)[None, None, :]
+        for z0, z1, slab in iter_slabs(volume):
+            b = lut[lut_index(slab, domain[0])] if lut is not None else self._bin_float(slab)
+            b = b.astype(np.int32)
+            z_index = (np.arange(z1 - z0, dtype=np.int32) * bins)[:, None, None]
+            self.axial[z0:z1] += np.bincount((b + z_index).ravel(), minlength=(z1 - z0) * bins).reshape(-1, bins)
+            self.coronal += np.bincount((b + y_index).ravel(), minlength=y * bins).reshape(y, bins)
+            self.sagittal += np.bincount((b + x_index).ravel(), minlength=x * bins).reshape(x, bins)
+        self.whole = self.axial.sum(axis=0)
+
+    def _bin_lut(self, domain):
+        # 每个整数强度直接映射到箱号，与 np.histogram 的分箱规则一致（最大值落在最后一箱）
+        lo, n = domain
+        values = np.arange(lo, lo + n, dtype=np.float64)
+        bins = np.searchsorted(self.edges, values, side="right") - 1
+        return np.clip(bins, 0, self.bins - 1).astype(np.uint8)
+
+    def _bin_float(self, slab):
+        bins = np.searchsorted(self.edges, slab, side="right") - 1
+        return np.clip(bins, 0, self.bins - 1)
+
+    def plane_counts(self, plane):
+        """按本引擎的分箱统计任意二维平面（例如按需重采样得到的切片）"""
+        domain = integer_domain(plane.dtype)
+        if domain is not None and np.dtype(plane.dtype) == self._dtype:
+            b = self._lut[lut_index(plane, domain[0])]
+        else:
+            b = self._bin_float(plane)
+        return np.bincount(b.ravel(), minlength=self.bins)[:self.bins]
+
+    def matches(self, volume):
+        return self._source() is volume
+
+    def counts(self, mode, index=None):
+        if mode == "axial":
+            return self.axial[index]
+        if mode == "coronal":
+            return self.coronal[index]
+        if mode == "sagittal":
+            return self.sagittal[index]
+        return self.whole
+
+
+class HistogramPlot:
+    """保留柱状图的 artist，刷新时只改柱高，不再 clear + hist 重绘"""
 
-def draw_histogram(data, ax, mode="axial"):
-    flat = data.flatten()
-    ax.hist(flat, bins=100, color="steelblue", edgecolor="black")
-    ax.set_title(f"{mode.capitalize()} Histogram")
-    ax.set_xlabel("Intensity")
-    ax.set_ylabel("Pixel Count")
-    ax.figure.tight_layout()
+    def __init__(self, ax):
+        self.ax = ax
+        self.bars = None
+        self._edges = None
 
+    def update(self, edges, counts, mode="axial"):
+        ax = self.ax
+        if self.bars is None or self._edges is not edges:
+            ax.clear()
+            self.bars = ax.bar(edges[:-1], counts, width=np.diff(edges), align="edge",
+                               color="steelblue", edgecolor="black")
+            self._edges = edges
+            ax.set_xlabel("Intensity")
+            ax.set_ylabel("Pixel Count")
+            ax.set_xlim(edges[0], edges[-1])
+            ax.set_title(f"{mode.capitalize()} Histogram")
+            ax.figure.tight_layout()
+        else:
+            for rect, height in zip(self.bars, counts):
+                rect.set_height(height)
+            ax.set_title(f"{mode.capitalize()} Histogram")
+        ax.set_ylim(0, max(int(counts.max()), 1) * 1.05)
@@ -1,16 +1,83 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
 import SimpleITK as sitk
 import numpy as np
 
-def read_dicom_series(folder, return_numpy=True):
+from dicomdir import DicomDirError, find_dicomdir, read_dicomdir, list_series
+from volume_cache import VolumeCache
+from chunked_volume import ChunkedVolume, VolumeGeometry, should_chunk
+from instrumentation import traced
+
+MAX_IN_FLIGHT = 2  # 每个解码线程最多排队的切片数
+
+# 构造中文标签（可选）
+TAG_MAP = {
+    "0010|0010": "患者姓名",
+    "0010|0020": "患者ID",
+    "0008|0060": "成像模态",
+    "0008|0020": "检查日期",
+    "0008|1030": "检查描述",
+    "0020|000D": "Study UID",
+    "0028|0010": "图像行数",
+    "0028|0011": "图像列数",
+    "0028|0030": "像素间距",
+    "0028|0100": "位深"
+}
+
+
+def build_metadata(full_info):
+    basic_info = {}
+    for tag, label in TAG_MAP.items():
+        basic_info[label] = full_info.get(tag, "(无)")
+
+    return {
+        "基本信息": basic_info,
+        "全部DICOM标签": full_info  # ✅ 添加所有标签
+    }
+
+
+def list_dicom_series(folder):
+    """
+    列出文件夹中的全部序列：优先读取 DICOMDIR 索引（不打开图像文件），否则退回 GDCM 目录扫描
+    :return: series 字典列表，每项至少包含 SeriesInstanceUID 和已排序的 files
+    """
+    dicomdir_path = find_dicomdir(folder)
+    if dicomdir_path:
+        try:
+            root = os.path.join(os.path.abspath(folder), "")
+            series = [s for s in list_series(read_dicomdir(dicomdir_path))
+                      if s["files"][0].startswith(root)]
+            if series:
+                return series
+        except (DicomDirError, OSError) as e:
+            print(f"[DICOMDIR] 解析失败，改为扫描目录: {e}")
+
     reader = sitk.ImageSeriesReader()
-    reader.MetaDataDictionaryArrayUpdateOn()
-    reader.LoadPrivateTagsOn()
+    return [{"SeriesInstanceUID": uid, "files": list(reader.GetGDCMSeriesFileNames(folder, uid))}
+            for uid in reader.GetGDCMSeriesIDs(folder)]
 
-    series_IDs = reader.GetGDCMSeriesIDs(folder)
-    if not series_IDs:
+
+def select_series_files(folder, series_uid=None):
+    """按 SeriesInstanceUID 选出序列文件；未指定时取第一个序列"""
+    series = list_dicom_series(folder)
+    if not series:
         raise RuntimeError("未找到 DICOM 序列")
+    if series_uid is None:
+        return series[0]["files"]
+    for entry in series:
+        if entry.get("SeriesInstanceUID") == series_uid:
+            return entry["files"]
+    raise RuntimeError(f"未找到指定的 DICOM 序列: {series_uid}")
+
+
+def read_dicom_series(folder, return_numpy=True, series_uid=None):
+    reader = sitk.ImageSeriesReader()
+    reader.MetaDataDictionaryArrayUpdateOn()
+    reader.LoadPrivateTagsOn()
 
-    file_names = reader.GetGDCMSeriesFileNames(folder, series_IDs[0])
+    file_names = select_series_files(folder, series_uid)
     reader.SetFileNames(file_names)
 
     image = reader.Execute()
@@ -23,30 +90,161 @@ def read_dicom_series(folder, return_numpy=True):
         value = reader.GetMetaData(0, key)
         full_info[key] = value
 
-    # 构造中文标签（可选）
-    tag_map = {
-        "0010|0010": "患者姓名",
-        "0010|0020": "患者ID",
-        "0008|0060": "成像模态",
-        "0008|0020": "检查日期",
-        "0008|1030": "检查描述",
-        "0020|000D": "Study UID",
-        "0028|0010": "图像行数",
-        "0028|0011": "图像列数",
-        "0028|0030": "像素间距",
-        "0028|0100": "位深"
-    }
-
-    basic_info = {}
-    for tag, label in tag_map.items():
-        basic_info[label] = full_info.get(tag, "(无)")
-
-    metadata = {
-        "基本信息": basic_info,
-        "全部DICOM标签": full_info  # ✅ 添加所有标签
-    }
+    metadata = build_metadata(full_info)
 
     if return_numpy:
         return image, array, metadata
     else:
         return image
+
+
+def _read_slice_header(file_name):
+    header = sitk.ImageFileReader()
+    header.SetFileName(file_name)
+    header.LoadPrivateTagsOn()
+    header.ReadImageInformation()
+    full_info = {key: header.GetMetaData(key) for key in header.GetMetaDataKeys()}
+    return header, full_info
+
+
+def _decode_slice(file_name):
+    return sitk.ReadImage(file_name)
+
+
+def _read_series_sequential(file_names, full_info, on_slice=None):
+    """用 ImageSeriesReader 顺序读取整个序列（单核时使用），返回值与 read_dicom_series_parallel 相同"""
+    reader = sitk.ImageSeriesReader()
+    reader.SetFileNames(file_names)
+    image = reader.Execute()
+    array = sitk.GetArrayFromImage(image)
+    geometry = VolumeGeometry.from_image(image)
+    del image
+    if on_slice is not None:
+        # 顺序读取没有逐层进度，读完后补一次中间层回调（预览和进度条）
+        total = array.shape[0]
+        on_slice(total // 2, array[total // 2], total, total)
+    return geometry, array, build_metadata(full_info)
+
+
+def _center_out_order(n):
+    """从中间切片向两端交替排列，保证中间轴位面最先解码"""
+    mid = n // 2
+    order = [mid]
+    for step in range(1, n):
+        if mid + step < n:
+            order.append(mid + step)
+        if mid - step >= 0:
+            order.append(mid - step)
+    return order
+
+
+def read_dicom_series_parallel(folder, file_names=None, on_slice=None, max_workers=None, series_uid=None,
+                               chunked=None):
+    """
+    多线程逐切片解码 DICOM 序列，直接写入预分配的体数据
+    :param folder: DICOM 文件夹
+    :param file_names: 已排序的切片文件列表（默认由 DICOMDIR 或 GDCM 扫描得到）
+    :param on_slice: 回调 on_slice(index, slice_array, loaded, total)，在调用线程中按到达顺序触发
+    :param max_workers: 线程数（默认为 CPU 核数；为 1 且不分块时改用 ImageSeriesReader 顺序读取）
+    :param series_uid: 未给出 file_names 时按 SeriesInstanceUID 选择序列
+    :param chunked: 是否写入分块内存映射的 ChunkedVolume（默认由 should_chunk 按体数据大小和可用内存决定）
+    :return: (geometry, array, metadata)；geometry 为 VolumeGeometry，提供与 sitk.Image 相同的几何接口
+    """
+    if file_names is None:
+        file_names = select_series_files(folder, series_uid)
+    file_names = list(file_names)
+    if not file_names:
+        raise RuntimeError("未找到 DICOM 序列")
+
+    header, full_info = _read_slice_header(file_names[0])
+    width, height = header.GetSize()[:2]
+    dtype = sitk.GetArrayViewFromImage(sitk.Image([1, 1], header.GetPixelID())).dtype
+    total = len(file_names)
+    shape = (total, height, width)
+    if chunked is None:
+        chunked = should_chunk(int(np.prod(shape)) * dtype.itemsize)
+    array = ChunkedVolume.create(shape, dtype) if chunked else np.empty(shape, dtype=dtype)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers == 1 and not chunked:
+        # 单核时线程池没有收益，ImageSeriesReader 顺序解码反而快约一倍
+        return _read_series_sequential(file_names, full_info, on_slice)
+
+    loaded = 0
+    order = iter(_center_out_order(total))
+    futures = {}
+
+    def submit(count):
+        for i in islice(order, count):
+            futures[pool.submit(_decode_slice, file_names[i])] = i
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # 最多同时保留 MAX_IN_FLIGHT × 线程数 张已提交/已解码的切片，峰值内存不随层数增长
+        submit(MAX_IN_FLIGHT * max_workers)
+        try:
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = futures.pop(future)  # 释放 future 持有的 sitk.Image
+                    # 视图只在 sitk.Image 存活期间有效，这里拷贝一份再写入预分配体数据
+                    slice_array = np.array(sitk.GetArrayViewFromImage(future.result())[0])
+                    array[index] = slice_array
+                    loaded += 1
+                    if on_slice is not None:
+                        on_slice(index, slice_array, loaded, total)
+                submit(len(done))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    # 几何信息：层内取首张切片，层间由首尾切片位置推算（与 ImageSeriesReader 一致）
+    sx, sy = header.GetSpacing()[:2]
+    first = np.array(header.GetOrigin(), dtype=float)
+    direction = np.array(header.GetDirection(), dtype=float).reshape(3, 3)
+    sz = 1.0
+    if total > 1:
+        last_header, _ = _read_slice_header(file_names[-1])
+        step = (np.array(last_header.GetOrigin(), dtype=float) - first) / (total - 1)
+        norm = float(np.linalg.norm(step))
+        if norm > 0:
+            sz = norm
+            direction[:, 2] = step / norm
+
+    if chunked:
+        array.flush()
+    # 不再额外构造一份 SimpleITK 图像，只保留几何信息
+    geometry = VolumeGeometry((sx, sy, sz), first, direction.flatten(), (width, height, total))
+    return geometry, array, build_metadata(full_info)
+
+
+@traced("load", "io")
+def read_dicom_series_cached(folder, series=None, cache=None, on_slice=None, max_workers=None):
+    """
+    带磁盘缓存的序列读取：命中时直接返回内存映射的体数据，未命中时并行解码并写入缓存
+    :param series: list_dicom_series 返回的序列字典（默认取第一个序列）
+    :param cache: VolumeCache 实例（默认使用 DEFAULT_CACHE_DIR）
+    """
+    if series is None:
+        all_series = list_dicom_series(folder)
+        if not all_series:
+            raise RuntimeError("未找到 DICOM 序列")
+        series = all_series[0]
+    if cache is None:
+        cache = VolumeCache()
+
+    file_names = series["files"]
+    key = cache.make_key(series.get("SeriesInstanceUID", ""), file_names)
+    hit = cache.get(key)
+    if hit is not None:
+        print(f"[缓存] 命中 {series.get('SeriesInstanceUID', '')}")
+        return hit
+
+    image, array, metadata = read_dicom_series_parallel(
+        folder, file_names=file_names, on_slice=on_slice, max_workers=max_workers)
+    try:
+        cache.put(key, image, array, metadata)
+    except (OSError, ValueError) as e:
+        print(f"[缓存] 写入失败: {e}")
+    return image, array, metadata
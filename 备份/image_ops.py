@@ -1,6 +1,11 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import numpy as np
 from scipy.ndimage import shift, rotate
-from scipy.ndimage import affine_transform
+from scipy.ndimage import affine_transform, map_coordinates
+from instrumentation import traced
+
 def translate_3d(volume, dx=0, dy=0, dz=0):
     """
     平移三维图像：dx, dy, dz 分别为在 x, y, z 方向的偏移量（单位：像素）
@@ -67,4 +72,316 @@ def rotate_3d_image(image, rotation_matrix, center=None):
         mode='constant',
         cval=0
     )
-    return rotated
\ No newline at end of file
+    return rotated
+
+def translation_matrix(dx=0, dy=0, dz=0):
+    """
+    平移的 4x4 正向仿射矩阵（体素索引坐标，顺序为 z, y, x），与 translate_3d 的方向一致
+    """
+    mat = np.eye(4)
+    mat[:3, 3] = (dz, dy, dx)
+    return mat
+
+
+def rotation_matrix_about_center(rotation_matrix, center):
+    """绕 center 旋转的 4x4 正向仿射矩阵：p' = R (p - c) + c"""
+    center = np.asarray(center, dtype=float)
+    mat = np.eye(4)
+    mat[:3, :3] = rotation_matrix
+    mat[:3, 3] = center - rotation_matrix @ center
+    return mat
+
+
+def plane_rotation_matrix(angle, axes=(1, 2)):
+    """
+    在 axes 两轴构成的平面内旋转的 3x3 正向矩阵，与 rotate_3d（scipy.ndimage.rotate）的方向一致
+    """
+    a = np.radians(angle)
+    rot = np.eye(3)
+    i, j = axes
+    rot[i, i] = np.cos(a)
+    rot[i, j] = -np.sin(a)
+    rot[j, i] = np.sin(a)
+    rot[j, j] = np.cos(a)
+    return rot
+
+
+def volume_center(shape):
+    return (np.asarray(shape, dtype=float) - 1) / 2.0
+
+
+def euler_rotation_matrix(angles_deg, order='zxy'):
+    """
+    欧拉角在 numpy 索引坐标 (z, y, x) 下的 3x3 正向旋转矩阵
+    :param angles_deg: [α, β, γ]（绕 Z, X, Y 轴，单位：度），与 euler_angles_to_rotation_matrix 相同
+    只给 α 时与 rotate_3d(angle=α, axes=(1, 2)) 的方向一致
+    """
+    # 索引顺序与 (x, y, z) 相反，换序会翻转手性，因此角度取反后再换序
+    rot = euler_angles_to_rotation_matrix(-np.asarray(angles_deg, dtype=float), order=order)
+    return rot[::-1, ::-1]
+
+
+def rigid_matrix(shape, translation=(0, 0, 0), angles=(0, 0, 0), order='zxy'):
+    """先平移 (dx, dy, dz) 再绕体中心按欧拉角旋转的 4x4 正向矩阵，用于一次完成平移 + 旋转"""
+    mat = translation_matrix(*translation)
+    if np.any(angles):
+        mat = rotation_matrix_about_center(euler_rotation_matrix(angles, order), volume_center(shape)) @ mat
+    return mat
+
+
+AFFINE_SLAB = 64
+
+
+@traced("transform", "transform")
+def apply_affine(volume, forward_matrix, order=3, mode='nearest', progress=None, slab=AFFINE_SLAB,
+                 output_shape=None, dtype=None, threads=1):
+    """
+    按 4x4 正向仿射矩阵对体数据做一次重采样：输出体素 p 取自输入的 M⁻¹ p
+    :param progress: 可选回调 progress(done, total)，块与块之间调用（回调可抛异常中止）
+    :param output_shape: 输出网格尺寸（默认与输入相同；两幅尺寸不同的图像对齐到同一网格时使用）
+    :param dtype: 输出类型（默认与输入相同）；整数输出先按 float32 计算再四舍五入并截断到类型范围
+    :param threads: 大于 1 时各块并行计算（scipy 在插值时释放 GIL）
+    :param slab: 每块的轴位层数；为 None 且无需进度回调时整体一次 affine_transform
+    分块时按轴位切分输出，每块只读取并预滤波其覆盖的输入子块，峰值内存与块大小而非整幅体数据成正比
+    """
+    inverse = np.linalg.inv(forward_matrix)
+    source_shape = np.array(volume.shape)
+    out_shape = np.array(source_shape if output_shape is None else output_shape)
+    dtype = np.dtype(volume.dtype if dtype is None else dtype)
+    if slab is None and progress is None and dtype == volume.dtype:
+        return affine_transform(
+            np.asarray(volume),
+            matrix=inverse[:3, :3],
+            offset=inverse[:3, 3],
+            output_shape=tuple(out_shape),
+            order=order,
+            mode=mode
+        )
+
+    output = np.empty(tuple(out_shape), dtype=dtype)
+    # 样条预滤波的影响随距离指数衰减，子块四周多取 12 个体素（与 scipy 内部的补边一致）
+    margin = 12 if order > 1 else 2
+    a, t = inverse[:3, :3], inverse[:3, 3]
+    total = int(out_shape[0])
+
+    def resample(z0, z1):
+        corners = np.array([[z, y, x] for z in (z0, z1 - 1) for y in (0, out_shape[1] - 1) for x in (0, out_shape[2] - 1)],
+                           dtype=float)
+        coords = corners @ a.T + t
+        lo = np.clip(np.floor(coords.min(axis=0)).astype(int) - margin, 0, source_shape - 1)
+        hi = np.maximum(np.clip(np.ceil(coords.max(axis=0)).astype(int) + margin + 1, 0, source_shape), lo + 1)
+        block = np.asarray(volume[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]])
+        integer = dtype.kind in "iu" and (order > 1 or dtype != block.dtype)
+        out = np.empty((z1 - z0, out_shape[1], out_shape[2]), dtype=np.float32) if integer else output[z0:z1]
+        affine_transform(
+            block,
+            matrix=a,
+            offset=t + a @ np.array([z0, 0, 0], dtype=float) - lo,
+            output_shape=out.shape,
+            output=out,
+            order=order,
+            mode=mode
+        )
+        if integer:
+            info = np.iinfo(dtype)
+            np.clip(np.rint(out, out=out), info.min, info.max, out=out)
+            output[z0:z1] = out
+        return z1
+
+    slab = slab or total
+    slabs = [(z0, min(z0 + slab, total)) for z0 in range(0, total, slab)]
+    if threads <= 1:
+        for z0, z1 in slabs:
+            resample(z0, z1)
+            if progress is not None:
+                progress(z1, total)
+        return output
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(resample, z0, z1) for z0, z1 in slabs]
+        try:
+            done = 0
+            for future in as_completed(futures):
+                future.result()
+                done += 1
+                if progress is not None:
+                    progress(done * total // len(slabs), total)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return output
+
+
+def transform_3d(volume, translation=(0, 0, 0), angles=(0, 0, 0), order=1, dtype=np.float32, threads=None):
+    """
+    平移 + 三轴欧拉旋转合成为一次 affine_transform（代替 translate_3d 后再 rotate_3d 的两次整体重采样）
+    :param order: 插值阶数（1 为线性，3 为三次样条）。只有 order=1 能做到耗时减半、内存峰值降到 1/4 以下：
+                  220×268×268 uint8 上两次整体重采样约 11.6 s / 203 MB，order=1 约 1.6 s / 16 MB；
+                  order=3 约 10 s / 70~120 MB（随块大小），三维三次样条每个体素取 64 个点，单次也比原来的
+                  shift + 逐层二维 rotate 慢，只省内存。批处理使用 order=1
+    :param dtype: 输出类型，np.float32 或 np.uint8
+    :param threads: 分块并行的线程数（默认为 CPU 核数）
+    """
+    matrix = rigid_matrix(volume.shape, translation, angles)
+    return apply_affine(volume, matrix, order=order, mode='nearest', dtype=dtype,
+                        threads=threads or os.cpu_count() or 1)
+
+
+class TransformStack:
+    """
+    非破坏式变换栈：原始体数据保持不变，所有平移/旋转合成为一个 4x4 仿射矩阵，
+    显示用体数据由原图一次重采样得到；撤销/重做只涉及矩阵运算
+    """
+
+    def __init__(self):
+        self._history = [np.eye(4)]
+        self._position = 0
+
+    @property
+    def matrix(self):
+        return self._history[self._position]
+
+    def is_identity(self):
+        return np.allclose(self.matrix, np.eye(4))
+
+    def push(self, step_matrix):
+        """在当前变换之后追加一步（新步骤左乘），并丢弃可重做的分支"""
+        composed = np.asarray(step_matrix, dtype=float) @ self.matrix
+        del self._history[self._position + 1:]
+        self._history.append(composed)
+        self._position += 1
+        return composed
+
+    def translate(self, dx=0, dy=0, dz=0):
+        return self.push(translation_matrix(dx, dy, dz))
+
+    def rotate(self, rotation_matrix, center):
+        return self.push(rotation_matrix_about_center(rotation_matrix, center))
+
+    def reset(self):
+        """回到原始位置（记为一步，可以撤销）"""
+        return self.push(np.linalg.inv(self.matrix))
+
+    def can_undo(self):
+        return self._position > 0
+
+    def can_redo(self):
+        return self._position < len(self._history) - 1
+
+    def undo(self):
+        if self.can_undo():
+            self._position -= 1
+        return self.matrix
+
+    def redo(self):
+        if self.can_redo():
+            self._position += 1
+        return self.matrix
+
+    def apply(self, volume, order=3, mode='nearest', progress=None):
+        """从原始体数据生成当前变换下的显示体数据；恒等变换时直接返回原图"""
+        if self.is_identity():
+            return volume
+        return apply_affine(volume, self.matrix, order=order, mode=mode, progress=progress)
+
+    def reslice(self, volume, order=1, mode='nearest'):
+        """与 apply 相同，但返回按需重采样的 ReslicedVolume，只计算实际显示的平面"""
+        if self.is_identity():
+            return volume
+        return ReslicedVolume(volume, self.matrix, order=order, mode=mode)
+
+
+PLANE_AXES = {'axial': 0, 'coronal': 1, 'sagittal': 2}
+
+
+class ReslicedVolume:
+    """
+    按需重采样的变换后体数据：只在读取某个轴位/冠状/矢状平面时，用 map_coordinates 采样该平面；
+    采样网格按方向缓存，换切片只需平移网格。读取其他区域或转换为数组时才整体重采样。
+    """
+
+    def __init__(self, source, forward_matrix, order=1, mode='nearest', shape=None):
+        self.source = source
+        self.matrix = np.asarray(forward_matrix, dtype=float)
+        self.inverse = np.linalg.inv(self.matrix)
+        self.order = order
+        self.mode = mode
+        self.shape = tuple(source.shape if shape is None else shape)
+        self.dtype = np.dtype(source.dtype)
+        self._grids = {}
+        self._materialized = None
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def with_source(self, source):
+        """同一变换作用于另一份同形状的体数据（例如归一化后的原图）"""
+        return ReslicedVolume(source, self.matrix, order=self.order, mode=self.mode, shape=self.shape)
+
+    def _plane_grid(self, axis):
+        """
+        输出平面在输入体数据中的采样坐标（不含所在层的偏移）：
+        coords = A[:, 平面内两轴] @ 平面网格 + t，层号变化时只需加上 A[:, axis] * index
+        """
+        grid = self._grids.get(axis)
+        if grid is None:
+            inplane = [a for a in range(3) if a != axis]
+            u, v = np.meshgrid(np.arange(self.shape[inplane[0]], dtype=np.float32),
+                               np.arange(self.shape[inplane[1]], dtype=np.float32), indexing='ij')
+            a = self.inverse[:3, :3].astype(np.float32)
+            t = self.inverse[:3, 3].astype(np.float32)
+            grid = (a[:, inplane[0], None, None] * u + a[:, inplane[1], None, None] * v + t[:, None, None])
+            self._grids[axis] = grid
+        return grid
+
+    @traced("reslice_plane", "transform")
+    def plane(self, axis, index):
+        if self._materialized is not None:
+            return np.take(self._materialized, index, axis=axis)
+        step = self.inverse[:3, axis].astype(np.float32) * np.float32(index)
+        coords = self._plane_grid(axis) + step[:, None, None]
+        # 只读取采样点覆盖的子块（对 ChunkedVolume 只会访问相交的数据块）
+        shape = np.array(self.source.shape)
+        lo = np.clip(np.floor(coords.min(axis=(1, 2))).astype(int) - 1, 0, shape - 1)
+        hi = np.maximum(np.clip(np.ceil(coords.max(axis=(1, 2))).astype(int) + 2, 0, shape), lo + 1)
+        block = np.asarray(self.source[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]])
+        coords -= lo.astype(np.float32)[:, None, None]
+        return map_coordinates(block, coords, order=self.order, mode=self.mode, output=self.dtype)
+
+    def materialize(self, order=3, progress=None, threads=None):
+        """整体重采样（提交或导出时使用），分块多线程执行，输出类型与原图相同"""
+        if self._materialized is None:
+            self._materialized = apply_affine(self.source, self.matrix, order=order, mode=self.mode,
+                                              progress=progress, output_shape=self.shape, dtype=self.dtype,
+                                              threads=threads or os.cpu_count() or 1)
+        return self._materialized
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+        ints = [i for i, k in enumerate(key) if isinstance(k, (int, np.integer))]
+        full = [i for i, k in enumerate(key) if isinstance(k, slice) and k == slice(None)]
+        if len(ints) == 1 and len(full) == 2:
+            axis = ints[0]
+            index = int(key[axis])
+            if index < 0:
+                index += self.shape[axis]
+            if not 0 <= index < self.shape[axis]:
+                raise IndexError(f"index {index} is out of bounds for axis with size {self.shape[axis]}")
+            return self.plane(axis, index)
+        return self.materialize()[key]
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.materialize()
+        return array if dtype is None else array.astype(dtype, copy=False)
@@ -0,0 +1,180 @@
+"""
+热点路径计时：加载、归一化、取切片、VTK 上传、渲染、直方图、变换、标签叠加、分割等步骤的耗时
+（可选内存分配增量）记入环形缓冲区，可导出为 Chrome trace（chrome://tracing 或 Perfetto 打开）。
+
+默认开启，只记录时间（每个事件约 1 µs）；设置 CBCT_INSTRUMENT=0 关闭，关闭后每次调用只多一次标志判断。
+设置 CBCT_TRACE_MEMORY=1（或在菜单中勾选）时用 tracemalloc 记录每个步骤的分配增量，有额外开销。
+"""
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+RING_SIZE = 50_000    # 最多保留的事件数，旧事件自动丢弃
+FRAME_HISTORY = 600   # 最多保留的帧数（帧率/延迟统计）
+
+_enabled = os.environ.get("CBCT_INSTRUMENT", "1") != "0"
+_memory = False
+_events = deque(maxlen=RING_SIZE)  # (名称, 类别, 开始 ns, 耗时 ns, 线程 id, 分配增量字节或 None)
+_frames = deque(maxlen=FRAME_HISTORY)  # (结束时刻 s, 延迟 s)
+_threads = {}  # 线程 id -> 线程名
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_enabled(enabled):
+    global _enabled
+    _enabled = bool(enabled)
+    print(f"[性能] 计时记录{'开启' if _enabled else '关闭'}")
+
+
+def memory_enabled():
+    return _memory
+
+
+def set_memory_tracking(enabled):
+    """开启/关闭分配增量记录（tracemalloc 会拖慢所有 Python 分配，只在排查时使用）"""
+    global _memory
+    _memory = bool(enabled)
+    if _memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    print(f"[性能] 内存分配记录{'开启' if _memory else '关闭'}")
+
+
+class _Span:
+    __slots__ = ("name", "category", "start", "memory")
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.memory = tracemalloc.get_traced_memory()[0] if _memory else None
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        delta = tracemalloc.get_traced_memory()[0] - self.memory if self.memory is not None else None
+        thread = threading.get_ident()
+        if thread not in _threads:
+            _threads[thread] = threading.current_thread().name
+        _events.append((self.name, self.category, self.start, end - self.start, thread, delta))
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, category="app"):
+    """
+    记录一段代码的耗时：with span("render", "view"): ...
+    关闭时返回空操作的上下文管理器
+    """
+    return _Span(name, category) if _enabled else _NULL_SPAN
+
+
+def traced(name, category="app"):
+    """函数装饰器版本的 span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_frame(latency):
+    """
+    记录一帧切片渲染完成
+    :param latency: 从该帧最早的切换请求（滑块/滚轮）到画面渲染完成的时间（秒）
+    """
+    if _enabled:
+        _frames.append((time.perf_counter(), latency))
+
+
+def frame_stats(window=1.0):
+    """
+    最近 window 秒内的帧率和延迟
+    :return: (fps, 平均延迟 s, 最大延迟 s)；这段时间没有渲染时返回 None
+    """
+    now = time.perf_counter()
+    recent = [latency for t, latency in _frames if now - t <= window]
+    if not recent:
+        return None
+    return len(recent) / window, sum(recent) / len(recent), max(recent)
+
+
+def events():
+    """环形缓冲区中的事件（按记录顺序）"""
+    return list(_events)
+
+
+def clear():
+    _events.clear()
+    _frames.clear()
+
+
+def summary():
+    """按步骤名汇总：{名称: {"count", "total_ms", "mean_ms", "max_ms"}}"""
+    result = {}
+    for name, category, start, duration, thread, delta in list(_events):
+        item = result.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        item["count"] += 1
+        item["total_ms"] += duration / 1e6
+        item["max_ms"] = max(item["max_ms"], duration / 1e6)
+    for item in result.values():
+        item["mean_ms"] = item["total_ms"] / item["count"]
+    return result
+
+
+def chrome_trace():
+    """Chrome trace-event 格式（完整事件 "X"，时间单位 µs）"""
+    pid = os.getpid()
+    trace = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+             for tid, name in list(_threads.items())]
+    for name, category, start, duration, thread, delta in list(_events):
+        event = {"name": name, "cat": category, "ph": "X", "pid": pid, "tid": thread,
+                 "ts": start / 1e3, "dur": duration / 1e3}
+        if delta is not None:
+            event["args"] = {"alloc_bytes": delta}
+        trace.append(event)
+    for t, latency in list(_frames):
+        trace.append({"name": "frame_latency_ms", "ph": "C", "pid": pid, "ts": t * 1e6,
+                      "args": {"latency": round(latency * 1e3, 3)}})
+    return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+
+def export_chrome_trace(path):
+    """把环形缓冲区写成 Chrome trace JSON，返回事件数"""
+    trace = chrome_trace()
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(trace, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    print(f"[性能] 已导出 {len(trace['traceEvents'])} 个事件到 {path}")
+    return len(trace["traceEvents"])
+
+
+if os.environ.get("CBCT_TRACE_MEMORY") == "1":
+    set_memory_tracking(True)
@@ -0,0 +1,227 @@
+import os
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import vtk
+
+from volume_pyramid import pyramid_level
+from presets import ISO_PRESETS
+from visualization import numpy_to_vtk_volume
+
+MASK_COLOR = (0.95, 0.55, 0.45)
+DECIMATE_REDUCTION = 0.75   # 去掉的三角形比例
+CLUSTER_TRIANGLES = 1_000_000  # 超过该三角形数时先做顶点聚类，再做二次误差简化（直接简化数百万三角形太慢）
+CLUSTER_SPACING = 2.0       # 顶点聚类的网格边长（体素）
+SMOOTH_ITERATIONS = 15
+SMOOTH_PASS_BAND = 0.1
+MESH_CACHE_SIZE = 8
+
+# (id(source), key) -> (weakref(source), polydata)，按最近使用淘汰
+_mesh_cache = OrderedDict()
+_smp_threads = None  # configure_smp 设置过的线程数
+
+
+def configure_smp(threads=None):
+    """
+    让 Flying Edges 按 SMP 后端多线程执行（默认的 Sequential 后端是单线程）；提取表面前调用
+    :param threads: 线程数；为 None 时若已设置过则保持不变，否则取 CPU 核数
+    """
+    global _smp_threads
+    if threads is None:
+        if _smp_threads is not None:
+            return
+        threads = os.cpu_count() or 1
+    if threads == _smp_threads:
+        return
+    if vtk.vtkSMPTools.GetBackend() != "Sequential" or vtk.vtkSMPTools.SetBackend("STDThread"):
+        vtk.vtkSMPTools.Initialize(threads)
+    _smp_threads = threads
+
+
+def extract_isosurface(volume, level, spacing=(1.0, 1.0, 1.0), factor=1, offset=(0, 0, 0),
+                       reduction=DECIMATE_REDUCTION, iterations=SMOOTH_ITERATIONS, progress=None):
+    """
+    等值面提取：vtkFlyingEdges3D（多线程）-> 简化（大网格先 vtkQuadricClustering）-> vtkQuadricDecimation
+    -> vtkWindowedSincPolyDataFilter -> 法线
+    :param volume: (z, y, x) 体数据
+    :param level: 等值面阈值
+    :param spacing: 原图的 (sx, sy, sz)
+    :param factor: 先取 1/factor 金字塔层再提取（1 为原始分辨率）
+    :param offset: volume 在原图中的起点 (z0, y0, x0)（从裁剪后的掩膜提取时使用）
+    :param progress: 可选回调 progress(done, total)
+    :return: vtkPolyData，坐标与体绘制相同（体素索引 × 间距，单位 mm）
+    """
+    steps = 4
+    state = {"step": 0, "error": None}
+
+    def report(done):
+        state["step"] = done
+        if progress is not None:
+            progress(done, steps)
+
+    def run(algorithm, input_data):
+        """执行一个 VTK 过滤器；progress 抛出异常时通过 AbortExecute 尽快中止，并在返回后重新抛出"""
+        def on_progress(obj, event):
+            if state["error"] is None:
+                try:
+                    report(state["step"])
+                except Exception as e:
+                    state["error"] = e
+                    obj.AbortExecuteOn()
+
+        algorithm.SetInputData(input_data)
+        algorithm.AddObserver("ProgressEvent", on_progress)
+        algorithm.Update()
+        if state["error"] is not None:
+            raise state["error"]
+        return algorithm.GetOutput()
+
+    start = time.perf_counter()
+    report(0)
+    configure_smp()
+    image = numpy_to_vtk_volume(np.asarray(pyramid_level(volume, factor)), spacing, factor)
+    image.SetOrigin(*(o + s * z for o, s, z in zip(image.GetOrigin(), spacing, offset[::-1])))
+
+    contour = vtk.vtkFlyingEdges3D()
+    contour.SetValue(0, level)
+    contour.ComputeNormalsOff()
+    contour.ComputeGradientsOff()
+    contour.ComputeScalarsOff()
+    mesh = run(contour, image)
+    triangles = mesh.GetNumberOfPolys()
+    report(1)
+
+    target = triangles * (1 - reduction)
+    if reduction > 0 and triangles > CLUSTER_TRIANGLES:
+        cluster = vtk.vtkQuadricClustering()
+        cluster.AutoAdjustNumberOfDivisionsOff()
+        cluster.SetDivisionSpacing(*([CLUSTER_SPACING * min(spacing) * factor] * 3))
+        mesh = run(cluster, mesh)
+    if reduction > 0 and mesh.GetNumberOfPolys() > target:
+        decimate = vtk.vtkQuadricDecimation()
+        decimate.SetTargetReduction(1 - target / mesh.GetNumberOfPolys())
+        mesh = run(decimate, mesh)
+    report(2)
+
+    if iterations > 0 and mesh.GetNumberOfPolys():
+        smooth = vtk.vtkWindowedSincPolyDataFilter()
+        smooth.SetNumberOfIterations(iterations)
+        smooth.SetPassBand(SMOOTH_PASS_BAND)
+        smooth.BoundarySmoothingOff()
+        smooth.NonManifoldSmoothingOn()
+        smooth.NormalizeCoordinatesOn()
+        mesh = run(smooth, mesh)
+    report(3)
+
+    normals = vtk.vtkPolyDataNormals()
+    normals.SplittingOff()
+    normals.ConsistencyOn()
+    output = run(normals, mesh)
+    mesh = vtk.vtkPolyData()
+    mesh.ShallowCopy(output)
+    report(4)
+    print(f"[表面] 阈值 {level}: {triangles} -> {mesh.GetNumberOfPolys()} 个三角形, "
+          f"耗时 {time.perf_counter() - start:.2f}s")
+    return mesh
+
+
+def _cache_get(source, key):
+    entry = _mesh_cache.get((id(source), key))
+    if entry is not None and entry[0]() is source:
+        _mesh_cache.move_to_end((id(source), key))
+        return entry[1]
+    return None
+
+
+def _cache_put(source, key, mesh):
+    cache_key = (id(source), key)
+    _mesh_cache[cache_key] = (weakref.ref(source, lambda _: _mesh_cache.pop(cache_key, None)), mesh)
+    while len(_mesh_cache) > MESH_CACHE_SIZE:
+        _mesh_cache.popitem(last=False)
+
+
+def volume_mesh(volume, level, spacing, factor=1, progress=None):
+    """体数据在某一阈值下的等值面，按 (体数据, 阈值, 层级) 缓存，来回切换阈值时不会重复计算"""
+    key = ("level", level, factor, tuple(spacing))
+    mesh = _cache_get(volume, key)
+    if mesh is None:
+        mesh = extract_isosurface(volume, level, spacing, factor, progress=progress)
+        _cache_put(volume, key, mesh)
+    return mesh
+
+
+def mask_mesh(masks, spacing, progress=None):
+    """分割掩膜集合（MaskSet）并集的表面；只在掩膜包围盒内提取，集合内容变化后重新计算"""
+    key = ("mask", tuple(masks.names()), tuple(spacing))
+    mesh = _cache_get(masks, key)
+    if mesh is None:
+        union = masks.union()
+        box = union.bbox()
+        if box is None:
+            return None
+        # 外扩一层体素，保证表面在包围盒边缘闭合
+        lo = [max(0, b[0] - 1) for b in box]
+        hi = [min(n, b[1] + 1) for b, n in zip(box, union.shape)]
+        block = union.block(lo[0], hi[0], lo[1], hi[1], lo[2], hi[2]).astype(np.uint8)
+        mesh = extract_isosurface(block, 0.5, spacing, offset=lo, progress=progress)
+        _cache_put(masks, key, mesh)
+    return mesh
+
+
+def xyz_matrix(forward_matrix, spacing):
+    """把 (z, y, x) 体素索引下的 4x4 正向矩阵换算为网格坐标（x, y, z，单位 mm）下的矩阵"""
+    scale = np.diag(list(spacing) + [1.0])
+    flip = np.eye(4)[[2, 1, 0, 3]]  # (x, y, z) <-> (z, y, x)
+    return scale @ flip @ np.asarray(forward_matrix, dtype=float) @ flip @ np.linalg.inv(scale)
+
+
+def patient_matrix(geometry):
+    """网格坐标（体素索引 × 间距，x, y, z）到患者坐标（DICOM LPS，单位 mm）的 4x4 矩阵：先按方向矩阵旋转，再平移到原点"""
+    matrix = np.eye(4)
+    matrix[:3, :3] = np.asarray(geometry.GetDirection(), dtype=float).reshape(3, 3)
+    matrix[:3, 3] = geometry.GetOrigin()
+    return matrix
+
+
+def save_mesh(meshes, path, geometry=None):
+    """
+    把一个或多个网格合并保存为 STL 或 PLY（按扩展名），二进制格式
+    :param geometry: 原图（sitk.Image / VolumeGeometry）；给出时按其原点和方向把顶点换算到患者坐标，
+                     可与原始 DICOM 对齐；为 None 时保存网格坐标（体素索引 × 间距，起点为 0）
+    """
+    append = vtk.vtkAppendPolyData()
+    for mesh in meshes:
+        append.AddInputData(mesh)
+    append.Update()
+    output = append.GetOutput()
+    if geometry is not None:
+        matrix = patient_matrix(geometry)
+        transform = vtk.vtkTransform()
+        transform.SetMatrix(matrix.flatten())
+        apply = vtk.vtkTransformPolyDataFilter()
+        apply.SetInputData(output)
+        apply.SetTransform(transform)
+        apply.Update()
+        output = apply.GetOutput()
+        if np.linalg.det(matrix[:3, :3]) < 0:
+            # 方向矩阵含镜像时翻转三角形顶点顺序，保持法线朝外
+            reverse = vtk.vtkReverseSense()
+            reverse.SetInputData(output)
+            reverse.ReverseNormalsOn()
+            reverse.Update()
+            output = reverse.GetOutput()
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".stl":
+        writer = vtk.vtkSTLWriter()
+    elif ext == ".ply":
+        writer = vtk.vtkPLYWriter()
+    else:
+        raise ValueError(f"不支持的网格格式: {ext}")
+    writer.SetFileName(path)
+    writer.SetInputData(output)
+    writer.SetFileTypeToBinary()
+    if not writer.Write():
+        raise IOError(f"写入失败: {path}")
+    print(f"[表面] 已保存 {path}（{output.GetNumberOfPolys()} 个三角形）")
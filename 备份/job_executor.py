@@ -0,0 +1,179 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from instrumentation import span
+
+
+class JobCancelled(Exception):
+    """任务被取消（或被同名的新任务取代）时，由 Job.check / Job.report 在工作线程中抛出"""
+
+
+_job_ids = itertools.count(1)
+
+
+class Job:
+    """
+    一次后台任务的句柄。任务函数以 func(job) 的形式在工作线程中执行，
+    通过 job.report 汇报进度、job.post 把中间结果交给 GUI 线程；两者都会检查取消标记
+    """
+
+    def __init__(self, key, executor, on_done=None, on_error=None, on_progress=None):
+        self.key = key
+        self.id = next(_job_ids)
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.future = None
+        self.started = time.perf_counter()
+        self._executor = executor
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled(self.key)
+
+    def report(self, done, total, message=""):
+        """汇报进度（工作线程中调用）；任务已取消时抛出 JobCancelled 以尽快退出"""
+        self.check()
+        self._executor._progress.emit(self, int(done), int(total), message)
+
+    def post(self, callback, *args):
+        """在 GUI 线程中执行 callback(*args)，例如加载过程中的预览；任务过期后自动丢弃"""
+        self.check()
+        self._executor._post.emit(self, callback, args)
+
+
+class JobExecutor(QObject):
+    """
+    后台任务执行器：耗时计算放到线程池，结果、进度和异常经由 Qt 信号回到 GUI 线程。
+    同一 key 同时只保留最新的任务，新提交会取消旧任务（例如连续修改旋转角度），
+    旧任务即使已经算完，结果也不会再交给界面。
+    只用线程池：numpy/scipy/SimpleITK/VTK 的计算核心都会释放 GIL，而换成进程池需要把数百 MB 的体数据
+    和 job.report/job.post 所依赖的闭包在进程间序列化，代价比并行收益更大
+    """
+
+    progressChanged = pyqtSignal(str, int, int, str)  # key, done, total, message
+    busyChanged = pyqtSignal(bool)
+
+    # 内部信号：从工作线程发出，以队列方式在 GUI 线程处理
+    _finished = pyqtSignal(object, object)
+    _failed = pyqtSignal(object, object)
+    _progress = pyqtSignal(object, int, int, str)
+    _post = pyqtSignal(object, object, object)
+
+    def __init__(self, max_workers=None):
+        super().__init__()
+        if max_workers is None:
+            # 至少两个线程：长时间的加载不应挡住分割等短任务
+            max_workers = max(2, min(4, os.cpu_count() or 1))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._active = {}  # key -> Job
+
+        self._finished.connect(self._on_finished)
+        self._failed.connect(self._on_failed)
+        self._progress.connect(self._on_progress)
+        self._post.connect(self._on_post)
+
+    def submit(self, key, func, on_done=None, on_error=None, on_progress=None):
+        """
+        提交任务
+        :param key: 任务类别；同一 key 的旧任务会被取消
+        :param func: 在工作线程中执行的 func(job)，返回值交给 on_done
+        :param on_done: GUI 线程回调 on_done(result)
+        :param on_error: GUI 线程回调 on_error(exception)（默认只打印）
+        :param on_progress: GUI 线程回调 on_progress(done, total, message)
+        :return: Job
+        """
+        self.cancel(key, reason="被新请求取代")
+        job = Job(key, self, on_done=on_done, on_error=on_error, on_progress=on_progress)
+        self._active[key] = job
+        job.future = self._pool.submit(self._run, job, func)
+        if len(self._active) == 1:
+            self.busyChanged.emit(True)
+        return job
+
+    def _run(self, job, func):
+        try:
+            job.check()
+            with span(f"job:{job.key}", "job"):
+                result = func(job)
+        except JobCancelled:
+            self._finished.emit(job, None)
+        except Exception as e:
+            self._failed.emit(job, e)
+        else:
+            self._finished.emit(job, result)
+
+    def _is_current(self, job):
+        return self._active.get(job.key) is job and not job.cancelled
+
+    def _retire(self, job):
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+            if not self._active:
+                self.busyChanged.emit(False)
+
+    def _on_finished(self, job, result):
+        current = self._is_current(job)
+        self._retire(job)
+        if not current:
+            print(f"[任务] {job.key}#{job.id} 已取消，丢弃结果")
+            return
+        print(f"[任务] {job.key}#{job.id} 完成，耗时 {time.perf_counter() - job.started:.2f}s")
+        if job.on_done is not None:
+            job.on_done(result)
+
+    def _on_failed(self, job, error):
+        current = self._is_current(job)
+        self._retire(job)
+        if not current:
+            return
+        print(f"[任务] {job.key}#{job.id} 出错: {error}")
+        if job.on_error is not None:
+            job.on_error(error)
+
+    def _on_progress(self, job, done, total, message):
+        if not self._is_current(job):
+            return
+        if job.on_progress is not None:
+            job.on_progress(done, total, message)
+        self.progressChanged.emit(job.key, done, total, message)
+
+    def _on_post(self, job, callback, args):
+        if self._is_current(job):
+            callback(*args)
+
+    def cancel(self, key, reason="已取消"):
+        job = self._active.get(key)
+        if job is None:
+            return False
+        job.cancel()
+        job.future.cancel()
+        print(f"[任务] {key}#{job.id} {reason}")
+        self._retire(job)
+        return True
+
+    def cancel_all(self):
+        for key in list(self._active):
+            self.cancel(key)
+
+    def is_running(self, key=None):
+        if key is None:
+            return bool(self._active)
+        return key in self._active
+
+    def shutdown(self, wait=False):
+        self.cancel_all()
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,259 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy import ndimage
+
+# 0..255 每个字节中 1 的个数
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class BitMask:
+    """
+    紧凑的二值掩膜：只保存包围盒内的数据，并沿 x 轴按位打包（每体素 1 bit）。
+    支持取任意轴位/冠状/矢状平面、任意子块，掩膜之间的交并差运算，以及体素数/体积统计
+    """
+
+    def __init__(self, shape, offset, packed, box_shape):
+        """
+        :param shape: 完整体数据尺寸 (z, y, x)
+        :param offset: 包围盒起点 (z0, y0, x0)
+        :param packed: np.packbits(包围盒内的 bool 数据, axis=2)
+        :param box_shape: 包围盒尺寸 (dz, dy, dx)
+        """
+        self.shape = tuple(int(v) for v in shape)
+        self.offset = tuple(int(v) for v in offset)
+        self.packed = packed
+        self.box_shape = tuple(int(v) for v in box_shape)
+        self.dtype = np.dtype(bool)
+
+    @classmethod
+    def empty(cls, shape):
+        return cls(shape, (0, 0, 0), np.zeros((0, 0, 0), dtype=np.uint8), (0, 0, 0))
+
+    @classmethod
+    def from_dense(cls, mask, offset=(0, 0, 0), shape=None):
+        """
+        由 bool 数组构造，自动裁剪到前景包围盒
+        :param offset: mask 在完整体数据中的起点（mask 本身是子块时使用）
+        :param shape: 完整体数据尺寸（默认为 mask.shape）
+        """
+        mask = np.asarray(mask, dtype=bool)
+        shape = mask.shape if shape is None else shape
+        box = ndimage.find_objects(mask.view(np.uint8))
+        if not box or box[0] is None:
+            return cls.empty(shape)
+        box = box[0]
+        cropped = mask[box]
+        offset = tuple(o + s.start for o, s in zip(offset, box))
+        return cls(shape, offset, np.packbits(cropped, axis=2), cropped.shape)
+
+    @classmethod
+    def from_labels(cls, labels, label):
+        return cls.from_dense(labels == label)
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    def is_empty(self):
+        return 0 in self.box_shape
+
+    def bbox(self):
+        """包围盒 ((z0, z1), (y0, y1), (x0, x1))，空掩膜返回 None"""
+        if self.is_empty():
+            return None
+        return tuple((o, o + n) for o, n in zip(self.offset, self.box_shape))
+
+    def crop(self, z0, z1, y0, y1, x0, x1):
+        """
+        与 [z0:z1, y0:y1, x0:x1] 相交部分的 bool 数据，只解包相交的字节
+        :return: (相交部分在该子块中的切片, bool 数组)；不相交时返回 None
+        """
+        if self.is_empty():
+            return None
+        oz, oy, ox = self.offset
+        dz, dy, dx = self.box_shape
+        lo = (max(z0, oz), max(y0, oy), max(x0, ox))
+        hi = (min(z1, oz + dz), min(y1, oy + dy), min(x1, ox + dx))
+        if any(l >= h for l, h in zip(lo, hi)):
+            return None
+        bx0, bx1 = lo[2] - ox, hi[2] - ox
+        byte0, byte1 = bx0 // 8, (bx1 + 7) // 8
+        bits = np.unpackbits(self.packed[lo[0] - oz:hi[0] - oz, lo[1] - oy:hi[1] - oy, byte0:byte1], axis=2)
+        region = tuple(slice(l - s, h - s) for l, h, s in zip(lo, hi, (z0, y0, x0)))
+        return region, bits[:, :, bx0 - byte0 * 8:bx1 - byte0 * 8].view(bool)
+
+    def block(self, z0, z1, y0, y1, x0, x1):
+        """完整坐标下 [z0:z1, y0:y1, x0:x1] 的 bool 子块"""
+        out = np.zeros((z1 - z0, y1 - y0, x1 - x0), dtype=bool)
+        cropped = self.crop(z0, z1, y0, y1, x0, x1)
+        if cropped is not None:
+            out[cropped[0]] = cropped[1]
+        return out
+
+    def plane(self, axis, index):
+        """取轴位 (0)、冠状 (1)、矢状 (2) 平面"""
+        z, y, x = self.shape
+        if axis == 0:
+            return self.block(index, index + 1, 0, y, 0, x)[0]
+        if axis == 1:
+            return self.block(0, z, index, index + 1, 0, x)[:, 0]
+        return self.block(0, z, 0, y, index, index + 1)[:, :, 0]
+
+    def __getitem__(self, key):
+        (z0, z1), (y0, y1), (x0, x1), squeeze = _key_bounds(key, self.shape)
+        out = self.block(z0, z1, y0, y1, x0, x1)
+        return out.reshape([n for n, s in zip(out.shape, squeeze) if not s])
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.block(0, self.shape[0], 0, self.shape[1], 0, self.shape[2])
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    # ---------- 集合运算 ----------
+
+    def _binary(self, other, op):
+        if self.shape != other.shape:
+            raise ValueError("掩膜尺寸不一致")
+        boxes = [b for b in (self.bbox(), other.bbox()) if b is not None]
+        if not boxes:
+            return BitMask.empty(self.shape)
+        lo = [min(b[i][0] for b in boxes) for i in range(3)]
+        hi = [max(b[i][1] for b in boxes) for i in range(3)]
+        args = (lo[0], hi[0], lo[1], hi[1], lo[2], hi[2])
+        return BitMask.from_dense(op(self.block(*args), other.block(*args)), offset=lo, shape=self.shape)
+
+    def __and__(self, other):
+        return self._binary(other, np.logical_and)
+
+    def __or__(self, other):
+        return self._binary(other, np.logical_or)
+
+    def __xor__(self, other):
+        return self._binary(other, np.logical_xor)
+
+    def __sub__(self, other):
+        return self._binary(other, lambda a, b: a & ~b)
+
+    # ---------- 统计 ----------
+
+    def count(self):
+        """前景体素数（打包字节查表计数；包围盒末尾的补齐位恒为 0）"""
+        return int(_POPCOUNT[self.packed].sum(dtype=np.int64))
+
+    def stats(self, spacing=(1.0, 1.0, 1.0)):
+        """
+        体素数与体积
+        :param spacing: sitk_image.GetSpacing() 的 (sx, sy, sz)，单位 mm
+        """
+        voxels = self.count()
+        volume_mm3 = voxels * float(np.prod(spacing))
+        return {
+            "voxels": voxels,
+            "volume_mm3": volume_mm3,
+            "volume_ml": volume_mm3 / 1000.0,
+            "bbox": self.bbox(),
+            "bytes": self.nbytes,
+        }
+
+
+class MaskSet:
+    """
+    同一患者的一组命名掩膜（各颗牙齿、根管、气道等）。
+    作为体数据视图时返回 int32 标签（第 i 个掩膜为 i + 1，后加入的覆盖先加入的），可直接用于叠加显示
+    """
+
+    def __init__(self, shape):
+        self.shape = tuple(int(v) for v in shape)
+        self.dtype = np.dtype(np.int32)
+        self.masks = OrderedDict()
+
+    @classmethod
+    def from_labels(cls, labels, prefix="连通域"):
+        """把连通域标记结果拆成按包围盒裁剪的掩膜（小连通域只占很少的空间）"""
+        masks = cls(labels.shape)
+        for i, box in enumerate(ndimage.find_objects(labels), start=1):
+            if box is None:
+                continue
+            offset = [s.start for s in box]
+            masks.add(f"{prefix} {i}", BitMask.from_dense(labels[box] == i, offset=offset, shape=labels.shape))
+        return masks
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def nbytes(self):
+        return sum(m.nbytes for m in self.masks.values())
+
+    def add(self, name, mask):
+        if mask.shape != self.shape:
+            raise ValueError("掩膜尺寸不一致")
+        self.masks[name] = mask
+
+    def remove(self, name):
+        self.masks.pop(name, None)
+
+    def names(self):
+        return list(self.masks)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def union(self):
+        """所有掩膜的并集（在总包围盒上一次合并，不逐个两两运算）"""
+        boxes = [m.bbox() for m in self.masks.values() if not m.is_empty()]
+        if not boxes:
+            return BitMask.empty(self.shape)
+        lo = [min(b[i][0] for b in boxes) for i in range(3)]
+        hi = [max(b[i][1] for b in boxes) for i in range(3)]
+        return BitMask.from_dense(self.block(lo[0], hi[0], lo[1], hi[1], lo[2], hi[2]) > 0,
+                                  offset=lo, shape=self.shape)
+
+    def stats(self, spacing=(1.0, 1.0, 1.0)):
+        return OrderedDict((name, mask.stats(spacing)) for name, mask in self.masks.items())
+
+    def block(self, z0, z1, y0, y1, x0, x1):
+        out = np.zeros((z1 - z0, y1 - y0, x1 - x0), dtype=np.int32)
+        for label, mask in enumerate(self.masks.values(), start=1):
+            # 只处理与子块相交的掩膜，且只写入相交部分
+            cropped = mask.crop(z0, z1, y0, y1, x0, x1)
+            if cropped is not None:
+                region, bits = cropped
+                out[region][bits] = label
+        return out
+
+    def __getitem__(self, key):
+        (z0, z1), (y0, y1), (x0, x1), squeeze = _key_bounds(key, self.shape)
+        out = self.block(z0, z1, y0, y1, x0, x1)
+        return out.reshape([n for n, s in zip(out.shape, squeeze) if not s])
+
+    def __array__(self, dtype=None, copy=None):
+        out = self.block(0, self.shape[0], 0, self.shape[1], 0, self.shape[2])
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+
+def _key_bounds(key, shape):
+    """把由整数和步长为 1 的切片组成的索引转换为每个轴的 [start, stop) 以及是否降维"""
+    if not isinstance(key, tuple):
+        key = (key,)
+    key = key + (slice(None),) * (3 - len(key))
+    bounds, squeeze = [], []
+    for k, n in zip(key, shape):
+        if isinstance(k, (int, np.integer)):
+            k = int(k) + n if k < 0 else int(k)
+            if not 0 <= k < n:
+                raise IndexError(f"index {k} is out of bounds for axis with size {n}")
+            bounds.append((k, k + 1))
+            squeeze.append(True)
+        elif isinstance(k, slice) and k.step in (None, 1):
+            start, stop, _ = k.indices(n)
+            bounds.append((start, max(start, stop)))
+            squeeze.append(False)
+        else:
+            raise IndexError("只支持整数和步长为 1 的切片索引")
+    return bounds[0], bounds[1], bounds[2], squeeze
@@ -0,0 +1,154 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from presets import LIVE_FILTERS
+from enhancement_utils import enhance_slice
+from visualization import get_slice_image
+from instrumentation import span
+
+LIVE_CACHE_BYTES = 128 * 1024 ** 2  # 滤波后切片缓存的内存上限
+PREFETCH_SLICES = 4                 # 沿滚动方向预取的切片数
+
+ORIENTATION_AXES = {"axial": 0, "coronal": 1, "sagittal": 2}
+
+
+class SliceCache:
+    """按字节数限制的 LRU 切片缓存（GUI 线程读写，预取线程写入）"""
+
+    def __init__(self, max_bytes=LIVE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._items[key] = value
+            self.nbytes += value.nbytes
+            while self.nbytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+
+class LiveFilter:
+    """
+    实时滤波：滚动时对每张新显示的切片做二维 Sobel/Laplace 增强，结果按 (方向, 层号, 滤波, 代数) 缓存；
+    根据同一方向上两次请求的先后判断滚动方向，在后台线程预取该方向上的后续 PREFETCH_SLICES 张切片。
+    每换一次体数据（体数据带 version 属性时，如 FusionVolume，版本变化也算）代数加一，
+    预取线程在换数据前算出的旧切片键中代数不同，不会被新体数据命中
+    """
+
+    def __init__(self, max_bytes=LIVE_CACHE_BYTES, prefetch=PREFETCH_SLICES):
+        self.name = None
+        self.prefetch = prefetch
+        self.cache = SliceCache(max_bytes)
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slice_prefetch")
+        self._volume = None
+        self._version = None
+        self._generation = 0
+        self._last = {}  # 方向 -> 上一次显示的层号
+        self._queued = set()
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+
+    def set_filter(self, name):
+        self.name = name
+        self._last.clear()
+
+    def slice(self, array, orientation, index=None):
+        """取经过滤波的显示切片（uint8）；index 为 None 时取中间层"""
+        version = getattr(array, "version", None)
+        if array is not self._volume or version != self._version:
+            # 换了体数据（加载、变换、三维滤波、融合参数）：旧切片全部作废
+            self._generation += 1
+            self.cache.clear()
+            self._last.clear()
+            self._volume, self._version = array, version
+        n = array.shape[ORIENTATION_AXES[orientation]]
+        index = n // 2 if index is None else int(np.clip(index, 0, n - 1))
+        key = (orientation, index, self.name, self._generation)
+        result = self.cache.get(key)
+        if result is None:
+            self.misses += 1
+            result = self._compute(array, orientation, index, self.name)
+            self.cache.put(key, result)
+        else:
+            self.hits += 1
+        self._prefetch(array, orientation, index, n)
+        return result
+
+    def _compute(self, array, orientation, index, name):
+        config = LIVE_FILTERS[name]
+        with span("live_filter", "filter"):
+            return enhance_slice(get_slice_image(array, orientation, index), config["filter"],
+                                 config.get("direction", "both"))
+
+    def _prefetch(self, array, orientation, index, n):
+        last = self._last.get(orientation)
+        self._last[orientation] = index
+        if last is None or last == index:
+            return
+        step = 1 if index > last else -1
+        for k in range(1, self.prefetch + 1):
+            i = index + step * k
+            if not 0 <= i < n:
+                break
+            key = (orientation, i, self.name, self._generation)
+            if key in self._queued or key in self.cache:
+                continue
+            self._queued.add(key)
+            self._pool.submit(self._prefetch_one, array, orientation, i, key)
+
+    def _prefetch_one(self, array, orientation, index, key):
+        try:
+            # 体数据或滤波已更换、或已滚动到别处（例如反向滚动）时放弃
+            if key[3] != self._generation or key[2] != self.name:
+                return
+            last = self._last.get(orientation)
+            if last is None or abs(index - last) > self.prefetch:
+                return
+            result = self._compute(array, orientation, index, key[2])
+            # 计算期间换了体数据时丢弃结果（即使写入，键中的代数也不会再被命中）
+            if key[3] == self._generation:
+                self.cache.put(key, result)
+                self.prefetched += 1
+        finally:
+            self._queued.discard(key)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "prefetched": self.prefetched,
+            "cached": len(self.cache),
+            "cache_mb": round(self.cache.nbytes / 1e6, 1),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,9 +1,18 @@
-from PyQt5.QtWidgets import QApplication
-from ui_main import MainWindow
+import startup
 import sys
 
+with startup.measure("PyQt5"):
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+with startup.measure("ui_main"):
+    from ui_main import MainWindow
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    with startup.measure("创建 QApplication", kind="phase"):
+        app = QApplication(sys.argv)
+    with startup.measure("创建主窗口", kind="phase"):
+        window = MainWindow()
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    # 事件循环处理完第一批事件（窗口已绘制）时记录首个窗口时间；设置 CBCT_STARTUP_REPORT=1 或 --startup-report 打印完整报告
+    QTimer.singleShot(0, startup.first_window_shown)
+    sys.exit(app.exec_())
@@ -0,0 +1,147 @@
+import weakref
+
+import numpy as np
+
+from chunked_volume import ChunkedVolume
+from image_ops import ReslicedVolume
+from instrumentation import traced
+
+SLAB_SLICES = 32  # 每次处理的轴位切片数，控制临时内存
+FLOAT_BINS = 65536
+
+# id(volume) -> (weakref(volume), 归一化结果)；体数据在本项目中不会被原地修改
+_normalized_cache = {}
+
+
+def iter_slabs(volume):
+    if isinstance(volume, ChunkedVolume):
+        yield from volume.iter_slabs()
+        return
+    for z0 in range(0, volume.shape[0], SLAB_SLICES):
+        z1 = min(z0 + SLAB_SLICES, volume.shape[0])
+        yield z0, z1, volume[z0:z1]
+
+
+def integer_domain(dtype):
+    """返回可用查找表处理的整数取值下界和取值个数；不适用时返回 None"""
+    dtype = np.dtype(dtype)
+    if dtype.kind in "iu" and dtype.itemsize <= 2:
+        info = np.iinfo(dtype)
+        return int(info.min), int(info.max) - int(info.min) + 1
+    return None
+
+
+def lut_index(slab, lo):
+    if lo == 0:
+        return slab
+    if slab.dtype == np.int16:
+        # 有符号 16 位翻转符号位即得到按大小排列的 0..65535 索引，无需 int32 临时数组
+        return slab.view(np.uint16) ^ np.uint16(0x8000)
+    return slab.astype(np.int32) - lo
+
+
+def intensity_histogram(volume):
+    """
+    一次遍历统计整数直方图
+    :return: (values, counts)，values 为每个箱对应的强度值
+    """
+    domain = integer_domain(volume.dtype)
+    if domain is not None:
+        lo, n = domain
+        counts = np.zeros(n, dtype=np.int64)
+        for _, _, slab in iter_slabs(volume):
+            counts += np.bincount(lut_index(slab, lo).ravel(), minlength=n)
+        return np.arange(lo, lo + n), counts
+
+    # 浮点或宽整数：先求范围，再做定宽直方图（结果为近似值）
+    vmin = min(float(slab.min()) for _, _, slab in iter_slabs(volume))
+    vmax = max(float(slab.max()) for _, _, slab in iter_slabs(volume))
+    edges = np.linspace(vmin, vmax, FLOAT_BINS + 1)
+    counts = np.zeros(FLOAT_BINS, dtype=np.int64)
+    for _, _, slab in iter_slabs(volume):
+        counts += np.histogram(slab, bins=edges)[0]
+    return edges[:-1], counts
+
+
+def percentiles_from_histogram(values, counts, qs):
+    """与 np.percentile（线性插值）一致的百分位数，只依赖直方图"""
+    cdf = np.cumsum(counts)
+    total = int(cdf[-1])
+    result = []
+    for q in qs:
+        pos = q / 100.0 * (total - 1)
+        k = int(np.floor(pos))
+        v0 = values[np.searchsorted(cdf, k, side="right")]
+        v1 = values[np.searchsorted(cdf, min(k + 1, total - 1), side="right")]
+        result.append(float(v0) + (pos - k) * (float(v1) - float(v0)))
+    return result
+
+
+def intensity_percentiles(volume, qs=(1, 99)):
+    values, counts = intensity_histogram(volume)
+    return percentiles_from_histogram(values, counts, qs)
+
+
+def build_lut(lo, n, p_lo, p_hi):
+    """整数取值域 [lo, lo+n) 到 uint8 的查找表，等价于裁剪到 [p_lo, p_hi] 后线性拉伸到 0~255"""
+    values = np.arange(lo, lo + n, dtype=np.float64)
+    if p_hi <= p_lo:
+        return np.zeros(n, dtype=np.uint8)
+    return ((np.clip(values, p_lo, p_hi) - p_lo) / (p_hi - p_lo) * 255).astype(np.uint8)
+
+
+@traced("normalize", "volume")
+def normalize_volume(volume, qs=(1, 99), use_cache=True):
+    """
+    按 1%/99% 百分位把体数据归一化到 uint8：一次整数直方图求百分位，再分块查表，结果按体数据缓存
+    :param volume: ndarray / np.memmap / ChunkedVolume / ReslicedVolume
+    :return: 与输入同形状的 uint8 ndarray（ChunkedVolume、ReslicedVolume 输入返回同类对象）
+    """
+    if getattr(volume, "normalized", False):
+        # 融合结果等已是显示用 uint8
+        return volume
+    if isinstance(volume, ReslicedVolume):
+        # 强度映射与空间变换可交换：归一化原图（有缓存）后再按同一变换按需取平面
+        return volume.with_source(normalize_volume(volume.source, qs, use_cache))
+
+    key = id(volume)
+    if use_cache and key in _normalized_cache:
+        ref, cached_qs, result = _normalized_cache[key]
+        if ref() is volume and cached_qs == tuple(qs):
+            return result
+
+    p_lo, p_hi = intensity_percentiles(volume, qs)
+    domain = integer_domain(volume.dtype)
+    if domain is not None:
+        lut = build_lut(domain[0], domain[1], p_lo, p_hi)
+
+        def convert(slab):
+            return lut[lut_index(slab, domain[0])]
+    else:
+        scale = 255.0 / (p_hi - p_lo) if p_hi > p_lo else 0.0
+
+        def convert(slab):
+            out = np.clip(slab, p_lo, p_hi).astype(np.float32)
+            out -= p_lo
+            out *= scale
+            return out.astype(np.uint8)
+
+    if isinstance(volume, ChunkedVolume):
+        result = volume.map_slabs(convert, np.uint8)
+    else:
+        result = np.empty(volume.shape, dtype=np.uint8)
+        for z0, z1, slab in iter_slabs(volume):
+            result[z0:z1] = convert(slab)
+
+    if use_cache:
+        _remember(volume, tuple(qs), result)
+    return result
+
+
+def _remember(volume, qs, result):
+    key = id(volume)
+    try:
+        ref = weakref.ref(volume, lambda _: _normalized_cache.pop(key, None))
+    except TypeError:
+        return
+    _normalized_cache[key] = (ref, qs, result)
@@ -1,8 +1,13 @@
 import numpy as np
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
-from image_io import read_dicom_series
-from image_ops import translate_3d, rotate_3d
-from visualization import show_views_with_slider
+from startup import lazy_module
+
+# 正畸工具的依赖（SimpleITK、vtk、scipy）在第一次使用时才导入
+image_io = lazy_module("image_io")
+visualization = lazy_module("visualization")
+normalization_utils = lazy_module("normalization_utils")
+fusion_engine = lazy_module("fusion_engine")
+registration = lazy_module("registration")
 
 class OrthodonticProcessor:
     def __init__(self, ui):
@@ -12,8 +17,17 @@ class OrthodonticProcessor:
         self.overlay_visible = False
         self.current_translation = [0, 0, 0]
         self.current_rotation = [0, 0, 0]
+        self.fusion_mode = "add"
+        self.fusion = None
+        self.alignment = None
+        self._base_array = None
 
-    def load_second_image(self):
+    def load_second_image(self, on_loaded=None):
+        """
+        选择第二幅图像并在后台读取
+        :param on_loaded: 读取成功后在 GUI 线程调用的回调
+        :return: 是否已开始读取
+        """
         if not hasattr(self.ui, '_preprocessed_array') or self.ui._preprocessed_array is None:
             QMessageBox.warning(self.ui, "错误", "请先加载第一个 DICOM 图像！")
             return False
@@ -23,54 +37,130 @@ class OrthodonticProcessor:
             return False
 
         try:
-            image, array, _ = read_dicom_series(folder, return_numpy=True)
-
-            if array.shape != self.ui._preprocessed_array.shape:
-                QMessageBox.warning(self.ui, "错误", "两个图像尺寸不一致，无法叠加！")
+            series = self.ui.controller.choose_series(folder)
+            if series is None:
                 return False
-
-            self.second_image = image
-            self.second_array = array
-            self.current_translation = [0, 0, 0]
-            self.current_rotation = [0, 0, 0]
-            return True
         except Exception as e:
             QMessageBox.critical(self.ui, "错误", f"加载 DICOM 失败: {str(e)}")
             return False
 
+        cache = self.ui.controller.volume_cache
+
+        def run(job):
+            def on_slice(index, slice_array, loaded, total):
+                if loaded == total or loaded % 16 == 0:
+                    job.report(loaded, total, "正在加载第二幅图像")
+            image, array, metadata = image_io.read_dicom_series_cached(folder, series, cache=cache, on_slice=on_slice)
+            job.report(0, 1, "正在归一化第二幅图像")
+            self.preprocess_array(array)  # 结果被缓存，融合时直接取用
+            return image, array, metadata
+
+        self.ui.controller.jobs.submit(
+            "second_image", run,
+            on_done=lambda result: self.on_second_image_loaded(result, on_loaded),
+            on_error=lambda e: QMessageBox.critical(self.ui, "错误", f"加载 DICOM 失败: {str(e)}"))
+        return True
+
+    def on_second_image_loaded(self, result, on_loaded=None):
+        image, array, _ = result
+        self.second_image = image
+        self.second_array = array
+        self.current_translation = [0, 0, 0]
+        self.current_rotation = [0, 0, 0]
+        # 尺寸/间距不同的两幅图像先按物理坐标放到第一幅图像的网格上，自动配准后再替换
+        self.set_alignment(registration.alignment_matrix(self.ui.controller.image, image))
+        if on_loaded is not None:
+            on_loaded()
+
     def apply_overlay(self):
+        """
+        显示融合结果：第二幅图像的归一化结果有缓存，平移/旋转只更新变换矩阵，
+        只计算当前显示的三个切片，调整对位时即时刷新
+        """
         if self.second_array is None:
             return
 
-        second = self.preprocess_array(self.second_array.copy())
+        if self.fusion is None or not self.overlay_visible:
+            # 叠加显示后 _preprocessed_array 会变成融合结果，底图在首次叠加时记下
+            self._base_array = self.ui._preprocessed_array
+            self.fusion = fusion_engine.FusionEngine(self._base_array, self.second_array, mode=self.fusion_mode,
+                                       alignment=self.alignment)
+            self.fusion.set_transform(self.current_translation, self.current_rotation)
+            visualization.show_views_with_slider(self.fusion.volume(), self.ui, self.ui.controller.image)
+            self.overlay_visible = True
+            return
+
+        self.fusion.set_transform(self.current_translation, self.current_rotation)
+        self.refresh_views()
 
-        if any(self.current_translation):
-            second = translate_3d(second, *self.current_translation)
-        if any(self.current_rotation):
-            second = rotate_3d(second, self.current_rotation[0], axes=(1, 2))  # 只实现一个方向旋转
+    def set_alignment(self, matrix):
+        # 第一幅图像上已有的平移/旋转同样作用于第二幅图像
+        self.alignment = self.ui.controller.transforms.matrix @ matrix
+        if self.fusion is not None:
+            self.fusion.set_alignment(self.alignment)
+
+    def auto_register(self):
+        """后台做刚体配准，结果直接用于融合显示"""
+        if self.second_array is None:
+            QMessageBox.warning(self.ui, "错误", "请先加载第二幅图像！")
+            return
+        controller = self.ui.controller
+        fixed, fixed_geometry = controller.original_array, controller.image
+        moving, moving_geometry = self.second_array, self.second_image
+
+        def run(job):
+            return registration.register_rigid(fixed, moving, fixed_geometry, moving_geometry,
+                                  progress=lambda done, total: job.report(done, total, "正在配准"))
+
+        controller.jobs.submit("registration", run, on_done=self.on_registered,
+                               on_error=lambda e: QMessageBox.critical(self.ui, "错误", f"配准失败: {str(e)}"))
+
+    def on_registered(self, result):
+        levels = ", ".join(f"1/{level['factor']}: {level['seconds']:.2f}s" for level in result["levels"])
+        print(f"[配准] 完成，总耗时 {result['seconds']:.2f}s（{levels}）")
+        self.ui.status_bar.showMessage(f"配准完成 {result['seconds']:.2f}s（{levels}）", 10000)
+        self.current_translation = [0, 0, 0]
+        self.current_rotation = [0, 0, 0]
+        self.set_alignment(result["matrix"])
+        if self.overlay_visible:
+            self.fusion.set_transform(self.current_translation, self.current_rotation)
+            self.refresh_views()
+        else:
+            self.apply_overlay()
 
-        original = self.ui._preprocessed_array.copy()
-        combined = np.clip(original + 0.5 * second, 0, 255).astype(np.uint8)
+    def refresh_views(self):
+        scheduler = self.ui.controller.scheduler
+        bars = {"axial": self.ui.axialBar, "sagittal": self.ui.sagittalBar, "coronal": self.ui.coronalBar}
+        for orientation, bar in bars.items():
+            scheduler.request_slice(orientation, bar.value(), self.ui.controller.image)
 
-        show_views_with_slider(combined, self.ui, sitk_image=None)
-        self.overlay_visible = True
+    def set_fusion_mode(self, mode):
+        self.fusion_mode = mode
+        print(f"[融合] 模式: {mode}")
+        if self.fusion is not None and self.overlay_visible:
+            self.fusion.set_mode(mode)
+            self.refresh_views()
 
     def preprocess_array(self, array):
-        array = np.clip(array, np.percentile(array, 1), np.percentile(array, 99))
-        array = (array - array.min()) / (array.max() - array.min()) * 255
-        return array.astype(np.uint8)
+        # 第二幅图像不变，归一化结果会被缓存，重复叠加时不再重新统计
+        return normalization_utils.normalize_volume(array)
 
     def remove_overlay(self):
-        if hasattr(self.ui, '_preprocessed_array'):
-            show_views_with_slider(self.ui._preprocessed_array, self.ui, self.ui.controller.image)
+        if self._base_array is not None:
+            visualization.show_views_with_slider(self._base_array, self.ui, self.ui.controller.image)
+        elif hasattr(self.ui, '_preprocessed_array'):
+            visualization.show_views_with_slider(self.ui._preprocessed_array, self.ui, self.ui.controller.image)
         self.overlay_visible = False
+        self.fusion = None
 
     def translate_second_image(self, dx, dy, dz):
         self.current_translation = [dx, dy, dz]
         if self.overlay_visible:
             self.apply_overlay()
 
-    def rotate_second_image(self, angle):
-        self.current_rotation = [angle, 0, 0]
+    def rotate_second_image(self, angles):
+        """:param angles: 欧拉角 [α, β, γ]（绕 Z, X, Y 轴）；只给一个数时为绕 Z 轴旋转"""
+        angles = list(np.atleast_1d(angles).astype(float))
+        self.current_rotation = angles + [0.0] * (3 - len(angles))
         if self.overlay_visible:
             self.apply_overlay()
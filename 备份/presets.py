@@ -0,0 +1,46 @@
+# 菜单中用到的选项表，不依赖 vtk/scipy，主窗口创建时即可导入
+
+FUSION_MODES = {
+    "add": "叠加",
+    "alpha": "透明度融合",
+    "color": "彩色融合",
+    "checkerboard": "棋盘格",
+}
+
+# 传递函数预设（原始强度）：opacity 为 (强度, 不透明度)，color 为 (强度, r, g, b)
+VOLUME_PRESETS = {
+    "bone": {
+        "label": "骨骼",
+        "opacity": [(-1000, 0.0), (200, 0.0), (450, 0.12), (1000, 0.55), (2000, 0.85)],
+        "color": [(200, 0.55, 0.25, 0.15), (450, 0.88, 0.60, 0.29), (1000, 1.0, 0.94, 0.85), (2000, 1.0, 1.0, 1.0)],
+    },
+    "teeth": {
+        "label": "牙齿",
+        "opacity": [(-1000, 0.0), (1100, 0.0), (1500, 0.35), (2200, 0.9)],
+        "color": [(1100, 0.80, 0.70, 0.55), (1500, 0.96, 0.92, 0.82), (2200, 1.0, 1.0, 0.97)],
+    },
+}
+DEFAULT_PRESET = "bone"
+
+# 表面预设（原始强度阈值）与显示颜色
+ISO_PRESETS = {
+    "bone": {"label": "骨骼", "level": 450, "color": (0.89, 0.85, 0.79)},
+    "teeth": {"label": "牙齿", "level": 1500, "color": (1.0, 1.0, 0.94)},
+}
+
+# 三维滤波（增强菜单）：params 为默认参数
+VOLUME_FILTERS = {
+    "sobel": {"label": "Sobel 梯度幅值", "params": {}},
+    "laplace": {"label": "Laplace", "params": {}},
+    "gaussian": {"label": "高斯平滑", "params": {"sigma": 1.0}},
+    "median": {"label": "中值滤波", "params": {"size": 3}},
+    "clahe": {"label": "CLAHE（逐层）", "params": {"clip_limit": 2.0, "tiles": 8}},
+}
+
+# 实时滤波（滚动时逐切片滤波，增强菜单）
+LIVE_FILTERS = {
+    "sobel_x": {"label": "Sobel 水平 (x)", "filter": "sobel", "direction": "x"},
+    "sobel_y": {"label": "Sobel 垂直 (y)", "filter": "sobel", "direction": "y"},
+    "sobel": {"label": "Sobel 双向 (x+y)", "filter": "sobel", "direction": "both"},
+    "laplace": {"label": "Laplace", "filter": "laplace"},
+}
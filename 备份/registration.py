@@ -0,0 +1,154 @@
+import os
+import time
+
+import numpy as np
+import SimpleITK as sitk
+
+from chunked_volume import VolumeGeometry
+from volume_pyramid import pyramid_level
+
+REGISTRATION_LEVEL = 4          # 在 1/4 金字塔层上配准（缓存的降采样结果；更细的层预处理开销远大于精度收益）
+SHRINK_FACTORS = (4, 2, 1)      # 在该层基础上再做多分辨率
+SMOOTHING_SIGMAS = (2, 1, 0)    # 各层高斯平滑（体素单位）
+SAMPLING_PERCENTAGE = 0.02      # 度量函数随机采样的体素比例
+SAMPLING_SEED = 2024
+
+
+def level_geometry(geometry, factor):
+    """金字塔 1/factor 层的几何信息：粗层体素 c 的中心对应原图的 factor·c + (factor-1)/2"""
+    spacing = np.array(geometry.GetSpacing(), dtype=float)
+    direction = np.array(geometry.GetDirection(), dtype=float).reshape(3, 3)
+    origin = np.array(geometry.GetOrigin(), dtype=float) + direction @ (spacing * (factor - 1) / 2.0)
+    size = -(-np.array(geometry.GetSize()) // factor)
+    return VolumeGeometry(spacing * factor, origin, direction.flatten(), size)
+
+
+def index_matrix(geometry):
+    """numpy 索引 (z, y, x) 到物理坐标 (x, y, z) 的 4x4 矩阵"""
+    spacing = np.array(geometry.GetSpacing(), dtype=float)
+    direction = np.array(geometry.GetDirection(), dtype=float).reshape(3, 3)
+    mat = np.eye(4)
+    mat[:3, :3] = (direction * spacing)[:, ::-1]
+    mat[:3, 3] = geometry.GetOrigin()
+    return mat
+
+
+def transform_matrix(transform):
+    """把 SimpleITK 线性变换（含 CompositeTransform，固定图像物理坐标 -> 浮动图像物理坐标）写成 4x4 矩阵"""
+    origin = np.array(transform.TransformPoint((0.0, 0.0, 0.0)))
+    mat = np.eye(4)
+    for i in range(3):
+        axis = [0.0, 0.0, 0.0]
+        axis[i] = 1.0
+        mat[:3, i] = np.array(transform.TransformPoint(axis)) - origin
+    mat[:3, 3] = origin
+    return mat
+
+
+def alignment_matrix(fixed_geometry, moving_geometry, transform=None):
+    """
+    把浮动图像放到固定图像网格上的 4x4 正向矩阵（索引坐标，ReslicedVolume/apply_affine 约定）。
+    尺寸、间距、原点不同的两幅图像按物理坐标对齐；transform 为配准得到的刚体变换
+    """
+    physical = np.eye(4) if transform is None else transform_matrix(transform)
+    sampling = np.linalg.inv(index_matrix(moving_geometry)) @ physical @ index_matrix(fixed_geometry)
+    return np.linalg.inv(sampling)
+
+
+def to_sitk(array, geometry):
+    image = sitk.GetImageFromArray(np.asarray(array, dtype=np.float32))
+    image.SetSpacing(tuple(geometry.GetSpacing()))
+    image.SetOrigin(tuple(geometry.GetOrigin()))
+    image.SetDirection(tuple(geometry.GetDirection()))
+    return image
+
+
+def register_rigid(fixed, moving, fixed_geometry, moving_geometry, level=REGISTRATION_LEVEL,
+                   shrink_factors=SHRINK_FACTORS, smoothing_sigmas=SMOOTHING_SIGMAS,
+                   sampling_percentage=SAMPLING_PERCENTAGE, iterations=100, threads=None, progress=None):
+    """
+    6 自由度刚体配准（Euler3D）：互信息度量 + 随机采样 + 多分辨率，SimpleITK 多线程执行
+    :param fixed: 固定图像（治疗前）体数据
+    :param moving: 浮动图像（治疗后）体数据，尺寸/间距可以不同
+    :param fixed_geometry: 固定图像的几何信息（sitk.Image 或 VolumeGeometry）
+    :param level: 先取体数据金字塔的 1/level 层再配准
+    :param threads: 线程数（默认为 CPU 核数）
+    :param progress: 可选回调 progress(done, total)，每次迭代调用；回调抛出异常时中止配准并重新抛出
+    :return: dict，包含 transform（固定 -> 浮动物理坐标的 sitk 变换）、matrix（固定网格上的正向矩阵）、
+             metric、levels（每层耗时、迭代次数和度量值）、seconds
+    """
+    start = time.perf_counter()
+    fixed_image = to_sitk(pyramid_level(fixed, level), level_geometry(fixed_geometry, level))
+    moving_image = to_sitk(pyramid_level(moving, level), level_geometry(moving_geometry, level))
+    prepared = time.perf_counter()
+
+    initial = sitk.CenteredTransformInitializer(
+        fixed_image, moving_image, sitk.Euler3DTransform(), sitk.CenteredTransformInitializerFilter.GEOMETRY)
+
+    method = sitk.ImageRegistrationMethod()
+    method.SetNumberOfThreads(threads or os.cpu_count() or 1)
+    method.SetMetricAsMattesMutualInformation(numberOfHistogramBins=32)
+    method.SetMetricSamplingStrategy(method.RANDOM)
+    method.SetMetricSamplingPercentage(sampling_percentage, SAMPLING_SEED)
+    method.SetInterpolator(sitk.sitkLinear)
+    method.SetOptimizerAsRegularStepGradientDescent(
+        learningRate=1.0, minStep=1e-3, numberOfIterations=iterations, relaxationFactor=0.5)
+    method.SetOptimizerScalesFromPhysicalShift()
+    method.SetShrinkFactorsPerLevel(list(shrink_factors))
+    method.SetSmoothingSigmasPerLevel(list(smoothing_sigmas))
+    method.SmoothingSigmasAreSpecifiedInPhysicalUnitsOff()
+    method.SetInitialTransform(initial, inPlace=False)
+
+    levels = []
+    state = {"level_start": None, "iterations": 0, "error": None}
+    total = len(shrink_factors) * iterations
+
+    def close_level():
+        if state["level_start"] is not None:
+            levels.append({
+                "shrink": shrink_factors[len(levels)],
+                "factor": shrink_factors[len(levels)] * level,  # 相对原图的缩小倍数
+                "seconds": time.perf_counter() - state["level_start"],
+                "iterations": state["iterations"],
+                "metric": method.GetMetricValue(),
+            })
+            print(f"[配准] 第 {len(levels)} 层 (缩小 {levels[-1]['shrink']}): {levels[-1]['iterations']} 次迭代, "
+                  f"{levels[-1]['seconds']:.2f}s, 度量 {levels[-1]['metric']:.4f}")
+
+    def on_level():
+        close_level()
+        state["level_start"] = time.perf_counter()
+        state["iterations"] = 0
+
+    def on_iteration():
+        state["iterations"] += 1
+        if progress is None or state["error"] is not None:
+            return
+        try:
+            progress(len(levels) * iterations + state["iterations"], total)
+        except Exception as e:
+            state["error"] = e
+            method.Abort()
+
+    method.AddCommand(sitk.sitkMultiResolutionIterationEvent, on_level)
+    method.AddCommand(sitk.sitkIterationEvent, on_iteration)
+    try:
+        transform = method.Execute(fixed_image, moving_image)
+    except RuntimeError:
+        if state["error"] is not None:
+            raise state["error"]
+        raise
+    if state["error"] is not None:
+        raise state["error"]
+    close_level()
+
+    seconds = time.perf_counter() - start
+    print(f"[配准] 降采样 {prepared - start:.2f}s, 总耗时 {seconds:.2f}s, "
+          f"停止原因: {method.GetOptimizerStopConditionDescription()}")
+    return {
+        "transform": transform,
+        "matrix": alignment_matrix(fixed_geometry, moving_geometry, transform),
+        "metric": method.GetMetricValue(),
+        "levels": levels,
+        "seconds": seconds,
+    }
@@ -0,0 +1,83 @@
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+
+import instrumentation
+from startup import lazy_module
+
+visualization = lazy_module("visualization")
+
+
+class RenderScheduler(QObject):
+    """
+    合并滑块和滚轮产生的切片切换请求：每个视图每帧最多渲染一次，只画最新的切片；
+    直方图和状态栏属于低优先级，在交互停顿后再刷新
+    """
+
+    def __init__(self, ui, fps=60, idle_delay_ms=80):
+        super().__init__()
+        self.ui = ui
+        self.frame_interval = 1.0 / fps
+        self._pending = {}  # orientation -> (index, sitk_image)
+        self._histogram_request = None
+        self._last_frame = 0.0
+        self._first_request = None  # 本帧最早一个请求的时刻，用于统计输入到画面的延迟
+
+        self._frame_timer = QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.timeout.connect(self._render_frame)
+
+        self._idle_timer = QTimer(self)
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.setInterval(idle_delay_ms)
+        self._idle_timer.timeout.connect(self._refresh_low_priority)
+
+        self.requests = 0
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+
+    def request_slice(self, orientation, index, sitk_image=None, histogram=False):
+        """登记某个视图要显示的切片；同一帧内的重复请求只保留最后一个"""
+        self.requests += 1
+        if orientation in self._pending:
+            self.frames_dropped += 1
+        self._pending[orientation] = (index, sitk_image)
+        if self._first_request is None:
+            self._first_request = time.perf_counter()
+        if histogram:
+            self._histogram_request = (orientation, index)
+        if not self._frame_timer.isActive():
+            wait = self.frame_interval - (time.perf_counter() - self._last_frame)
+            self._frame_timer.start(max(0, int(wait * 1000)))
+
+    def _render_frame(self):
+        pending, self._pending = self._pending, {}
+        first_request, self._first_request = self._first_request, None
+        with instrumentation.span("frame", "view"):
+            for orientation, (index, sitk_image) in pending.items():
+                visualization.update_slice(None, self.ui, orientation, index, sitk_image=sitk_image)
+        self._last_frame = time.perf_counter()
+        self.frames_rendered += 1
+        if first_request is not None:
+            instrumentation.record_frame(self._last_frame - first_request)
+        self._idle_timer.start()
+
+    def _refresh_low_priority(self):
+        visualization.update_status_bar(self.ui)
+        if self._histogram_request is not None:
+            orientation, index = self._histogram_request
+            self._histogram_request = None
+            self.ui.controller.update_histogram(slider=orientation, index=index)
+
+    def flush(self):
+        """立即渲染所有挂起的请求（例如在整体刷新视图之前）"""
+        self._frame_timer.stop()
+        if self._pending:
+            self._render_frame()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "frames_rendered": self.frames_rendered,
+            "frames_dropped": self.frames_dropped,
+        }
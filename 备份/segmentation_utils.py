@@ -1,19 +1,17 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+from scipy import ndimage
 from visualization import get_slice_image, numpy_to_vtk_image2d, render_image2d
+from instrumentation import traced
 
-def segment(ui, orientation, windowwide, windowlocation):
-    array = ui._preprocessed_array
-    if orientation == 'axial':
-        val = ui.axialBar.value()
-    elif orientation == 'sagittal':
-        val = ui.sagittalBar.value()
-    elif orientation == 'coronal':
-        val = ui.coronalBar.value()
-    else:
-        return
+SEGMENT_WIDGETS = {'axial': 'axialWidget', 'sagittal': 'sagittalWidget', 'coronal': 'coronalWidget'}
+SEGMENT_BARS = {'axial': 'axialBar', 'sagittal': 'sagittalBar', 'coronal': 'coronalBar'}
 
-    slice_array = get_slice_image(array, orientation, val)
 
+def segment_mask(slice_array, windowwide=None, windowlocation=None):
+    """窗宽/窗位阈值分割（纯计算，可在工作线程中执行）"""
     if windowwide is None:
         windowwide = 60
     if windowlocation is None:
@@ -22,12 +20,142 @@ def segment(ui, orientation, windowwide, windowlocation):
     segmented_arr = np.zeros_like(slice_array, dtype=np.uint8)
     segmented_arr[(slice_array < (windowlocation + windowwide / 2)) &
                   (slice_array > (windowlocation - windowwide / 2))] = 255
+    return segmented_arr
 
+
+def render_segmentation(ui, orientation, segmented_arr):
+    """在对应视图中显示分割结果（GUI 线程）"""
     vtk_img = numpy_to_vtk_image2d(segmented_arr)
+    render_image2d(vtk_img, getattr(ui, SEGMENT_WIDGETS[orientation]), (1.0, 1.0))
+
+
+def segment(ui, orientation, windowwide, windowlocation):
+    if orientation not in SEGMENT_BARS:
+        return
+    array = ui._preprocessed_array
+    val = getattr(ui, SEGMENT_BARS[orientation]).value()
+
+    slice_array = get_slice_image(array, orientation, val)
+    render_segmentation(ui, orientation, segment_mask(slice_array, windowwide, windowlocation))
+
+
+# ================= 三维分割 =================
+
+SEGMENT_SLAB = 64  # 分块处理的轴位层数
+
+
+def threshold_volume(volume, lower, upper=None):
+    """
+    在原始强度上做三维阈值分割（分块向量化，ChunkedVolume 不会整体载入）
+    :return: 与 volume 同形状的 bool 数组
+    """
+    mask = np.empty(volume.shape, dtype=bool)
+    for z0 in range(0, volume.shape[0], SEGMENT_SLAB):
+        slab = np.asarray(volume[z0:z0 + SEGMENT_SLAB])
+        out = mask[z0:z0 + SEGMENT_SLAB]
+        np.greater_equal(slab, lower, out=out)
+        if upper is not None:
+            out &= slab <= upper
+    return mask
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def label_components(mask, threads=None, slab=SEGMENT_SLAB):
+    """
+    分块三维连通域标记（6 邻接）：各轴位块在线程池中独立标记（scipy 在标记时释放 GIL），
+    再用并查集合并块边界上相接的连通域，最后统一重新编号
+    :return: (labels, count)；labels 为 int32，0 为背景，连通域编号 1..count
+    """
+    threads = threads or os.cpu_count() or 1
+    depth = mask.shape[0]
+    bounds = [(z0, min(z0 + slab, depth)) for z0 in range(0, depth, slab)]
+    labels = np.empty(mask.shape, dtype=np.int32)
+
+    def label_block(z0, z1):
+        return ndimage.label(mask[z0:z1], output=labels[z0:z1])
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        counts = list(pool.map(lambda b: label_block(*b), bounds))
+
+    # 各块编号加上偏移后全体唯一；这里只对块边界上的两层加偏移，用并查集合并跨块相接的连通域
+    offsets = np.cumsum([0] + counts[:-1])
+    total = int(sum(counts))
+    parent = np.arange(total + 1)
+    for k in range(len(bounds) - 1):
+        z1 = bounds[k][1]
+        below, above = labels[z1 - 1], labels[z1]
+        touching = (below > 0) & (above > 0)
+        if not touching.any():
+            continue
+        pairs = np.unique(np.stack([below[touching] + offsets[k], above[touching] + offsets[k + 1]], axis=1), axis=0)
+        for a, b in pairs:
+            ra, rb = _find(parent, a), _find(parent, b)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+    roots = np.array([_find(parent, i) for i in range(total + 1)])
+    unique_roots, lut = np.unique(roots, return_inverse=True)
+    lut = lut.astype(np.int32)  # 根 0（背景）排在最前，编号保持为 0
+    count = len(unique_roots) - 1
+
+    def relabel(k):
+        # 每块一次查表完成“加偏移 + 合并 + 重新编号”
+        z0, z1 = bounds[k]
+        block_lut = np.concatenate([[0], lut[offsets[k] + 1:offsets[k] + counts[k] + 1]]).astype(np.int32)
+        flat = labels[z0:z1].reshape(-1)
+        nonzero = np.flatnonzero(flat)  # 前景通常很稀疏，只改写前景体素
+        flat[nonzero] = block_lut[flat[nonzero]]
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(relabel, range(len(bounds))))
+    return labels, count
+
+
+GROW_RADIUS = 32  # 区域生长的初始搜索半径（体素）
+
+
+@traced("region_grow", "segment")
+def region_grow(volume, seed, lower, upper, threads=None):
+    """
+    种子点区域生长：返回与种子 (z, y, x) 连通、强度位于 [lower, upper] 内的区域。
+    只在种子周围的包围盒内阈值化并标记；种子所在连通域碰到包围盒的某个面时，把该面向外扩大一倍后重做，
+    直到连通域不再触及包围盒（或到达体数据边界）。单颗牙齿只需处理其附近的一小块，不再标记整个体数据；
+    连通域遍布整个体数据时（如整块颌骨）最多约为整体标记的 1.5 倍，界面中经 JobExecutor 在后台执行
+    :return: uint8 标签体数据（区域为 1），种子本身不在范围内时返回 None
+    """
+    seed = tuple(int(v) for v in seed)
+    if not lower <= volume[seed] <= upper:
+        return None
+    shape = volume.shape
+    lo = [max(0, s - GROW_RADIUS) for s in seed]
+    hi = [min(n, s + GROW_RADIUS + 1) for s, n in zip(seed, shape)]
+    while True:
+        box = tuple(slice(a, b) for a, b in zip(lo, hi))
+        labels, _ = label_components(threshold_volume(volume[box], lower, upper), threads=threads)
+        region = labels == labels[tuple(s - a for s, a in zip(seed, lo))]
+        del labels
+        grown = False
+        for axis in range(3):
+            faces = np.moveaxis(region, axis, 0)
+            size = hi[axis] - lo[axis]
+            if lo[axis] > 0 and faces[0].any():
+                lo[axis], grown = max(0, lo[axis] - size), True
+            if hi[axis] < shape[axis] and faces[-1].any():
+                hi[axis], grown = min(shape[axis], hi[axis] + size), True
+        if not grown:
+            break
+    result = np.zeros(shape, dtype=np.uint8)
+    result[box] = region
+    return result
+
 
-    if orientation == 'axial':
-        render_image2d(vtk_img, ui.axialWidget, (1.0, 1.0))
-    elif orientation == 'sagittal':
-        render_image2d(vtk_img, ui.sagittalWidget, (1.0, 1.0))
-    elif orientation == 'coronal':
-        render_image2d(vtk_img, ui.coronalWidget, (1.0, 1.0))
+@traced("segment", "segment")
+def segment_volume(volume, lower, upper=None, threads=None):
+    """三维阈值 + 连通域标记，返回 (labels, count)"""
+    return label_components(threshold_volume(volume, lower, upper), threads=threads)
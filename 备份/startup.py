@@ -0,0 +1,96 @@
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# 以 main.py 导入本模块的时刻为起点
+START = time.perf_counter()
+
+_records = []  # [名称, 类型, 开始时刻, 耗时, 嵌套深度]
+_local = threading.local()  # 各线程各自的嵌套深度（后台任务中也可能首次导入模块）
+_first_window = None
+
+
+@contextmanager
+def measure(name, kind="import"):
+    """
+    记录一段启动步骤的耗时（可嵌套）
+    :param kind: "import"（导入模块）或 "phase"（创建窗口等阶段）
+    """
+    depth = getattr(_local, "depth", 0)
+    record = [name, kind, time.perf_counter() - START, None, depth]
+    _records.append(record)
+    _local.depth = depth + 1
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        record[3] = time.perf_counter() - t
+        if _first_window is not None and kind == "import" and record[4] == 0:
+            print(f"[启动] 首次使用时导入 {name}: {record[3]:.3f}s")
+
+
+def timed_import(name):
+    """导入模块并记录耗时（已导入的模块不计）"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with measure(name):
+        return importlib.import_module(name)
+
+
+class LazyModule:
+    """
+    模块代理：第一次访问属性时才真正导入，并把导入耗时记入启动报告。
+    用于 vtk、SimpleITK、scipy、cv2 以及只在加载图像或点击工具后才用到的模块
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = timed_import(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "已导入" if self._module is not None else "未导入"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def first_window_shown():
+    """主窗口第一次显示（事件循环开始处理）时调用"""
+    global _first_window
+    if _first_window is not None:
+        return
+    _first_window = time.perf_counter() - START
+    print(f"[启动] 首个窗口 {_first_window:.3f}s")
+    if os.environ.get("CBCT_STARTUP_REPORT") or "--startup-report" in sys.argv:
+        print_report()
+
+
+def report():
+    """启动报告：各阶段与各模块导入耗时（缩进表示嵌套），以及首个窗口时间"""
+    lines = ["[启动] 耗时统计（从 main.py 开始计时）"]
+    for name, kind, at, seconds, depth in _records:
+        label = "导入" if kind == "import" else "阶段"
+        cost = "进行中" if seconds is None else f"{seconds:.3f}s"
+        lines.append(f"  {'  ' * depth}{label} {name:<40} {cost:>9}  (t={at:.3f}s)")
+    if _first_window is not None:
+        lines.append(f"  首个窗口 {_first_window:.3f}s")
+    return "\n".join(lines)
+
+
+def print_report():
+    print(report())
@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SOURCE_DIR)
+
+# 与 benchmark.DEFAULT_STUDY 相同的示例检查；不存在时依赖它的用例跳过
+STUDY = os.path.join(SOURCE_DIR, "..", "1000427996-40岁")
+
+
+@pytest.fixture(scope="session")
+def study_folder():
+    if not os.path.isdir(STUDY):
+        pytest.skip(f"未找到检查数据 {STUDY}")
+    return STUDY
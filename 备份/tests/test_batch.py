@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+import batch
+from volume_filters import apply_volume_filter
+
+SHAPE = (10, 16, 20)
+SPACING = (0.4, 0.4, 0.5)
+
+
+def write_series(folder, seed):
+    """用 SimpleITK 逐层写出一个小的 CT 序列"""
+    os.makedirs(folder, exist_ok=True)
+    array = np.random.default_rng(seed).integers(-1000, 3000, size=SHAPE).astype(np.int16)
+    series_uid = f"1.2.826.0.1.3680043.2.1125.{seed}"
+    writer = sitk.ImageFileWriter()
+    writer.KeepOriginalImageUIDOn()
+    for z in range(SHAPE[0]):
+        image = sitk.GetImageFromArray(array[z:z + 1])[:, :, 0]
+        image.SetSpacing(SPACING[:2])
+        for tag, value in (("0008|0060", "CT"), ("0010|0020", f"P{seed}"), ("0020|000e", series_uid),
+                           ("0020|000d", series_uid + ".1"), ("0008|0018", f"{series_uid}.{z + 1}"),
+                           ("0020|0013", str(z + 1)), ("0020|0032", f"0\\0\\{z * SPACING[2]}"),
+                           ("0020|0037", "1\\0\\0\\0\\1\\0"), ("0018|0050", str(SPACING[2]))):
+            image.SetMetaData(tag, value)
+        writer.SetFileName(os.path.join(folder, f"IM{z:04d}.dcm"))
+        writer.Execute(image)
+    return array
+
+
+@pytest.fixture
+def studies(tmp_path):
+    root = tmp_path / "studies"
+    arrays = {name: write_series(str(root / name), seed) for seed, name in enumerate(["a", "b"], start=1)}
+    return str(root), arrays
+
+
+def run(root, out, *extra):
+    return batch.main([root, "-o", out, "--workers", "1", "--filter", "sobel", "gaussian", *extra])
+
+
+def load_summary(out):
+    with open(os.path.join(out, batch.SUMMARY_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_cli_writes_summary_and_3d_filter_outputs(studies, tmp_path):
+    root, arrays = studies
+    out = str(tmp_path / "out")
+    assert run(root, out, "--save-normalized") == 0
+
+    summary = load_summary(out)
+    assert summary["totals"]["studies"] == summary["totals"]["ok"] == 2
+    assert summary["options"]["filters"] == ["sobel", "gaussian"]
+    for result in summary["studies"]:
+        name = os.path.basename(result["folder"])
+        assert result["status"] == "ok" and result["shape"] == list(SHAPE)
+        assert result["spacing"] == pytest.approx(SPACING)
+        assert {"load", "normalize", "filter_sobel", "filter_gaussian"} <= set(result["timings"])
+        for filter_name in ("sobel", "gaussian"):
+            image = sitk.ReadImage(result["outputs"][f"filter_{filter_name}"])
+            assert image.GetSpacing() == pytest.approx(SPACING)
+            saved = sitk.GetArrayFromImage(image)
+            # 三维 float32 滤波（与界面相同），而不是逐切片的 8 位滤波
+            assert saved.dtype == np.float32
+            assert np.allclose(saved, apply_volume_filter(arrays[name], filter_name))
+
+
+def test_cli_resume_only_reprocesses_failed_studies(studies, tmp_path):
+    root, arrays = studies
+    out = str(tmp_path / "out")
+    broken = os.path.join(root, "c")
+    os.makedirs(broken)
+    with open(os.path.join(broken, "IM0000.dcm"), "wb") as f:
+        f.write(b"\0" * 128 + b"DICM" + b"\0" * 64)
+    assert run(root, out) == 1
+    first = {os.path.basename(r["folder"]): r for r in load_summary(out)["studies"]}
+    assert first["c"]["status"] == "error" and first["a"]["status"] == first["b"]["status"] == "ok"
+    sobel_a = first["a"]["outputs"]["filter_sobel"]
+    mtime = os.stat(sobel_a).st_mtime_ns
+
+    os.remove(os.path.join(broken, "IM0000.dcm"))
+    write_series(broken, 3)
+    assert run(root, out, "--resume") == 0
+    summary = load_summary(out)
+    assert summary["totals"]["studies"] == summary["totals"]["ok"] == 3
+    resumed = {os.path.basename(r["folder"]): r for r in summary["studies"]}
+    # 已成功的检查原样保留，不会重新计算
+    assert resumed["a"] == first["a"] and resumed["b"] == first["b"]
+    assert os.stat(sobel_a).st_mtime_ns == mtime
+    assert os.path.exists(resumed["c"]["outputs"]["filter_gaussian"])
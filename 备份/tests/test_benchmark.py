@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import benchmark
+from benchmark import compare, load_baseline, result_key, save_baseline
+
+
+def make_result(case, size, seconds, peak_mb=10.0):
+    return {"case": case, "size": size, "status": "ok", "voxels": size ** 3, "seconds": seconds,
+            "median_seconds": seconds, "voxels_per_s": round(size ** 3 / seconds), "peak_mb": peak_mb,
+            "rss_peak_mb": 100.0}
+
+
+@pytest.fixture
+def baseline():
+    return {"environment": {}, "results": {
+        "sobel@256": make_result("sobel", 256, 1.0),
+        "laplace@256": make_result("laplace", 256, 1.0),
+        "segment_mask@256": make_result("segment_mask", 256, 1.0),
+    }}
+
+
+def verdicts(report):
+    return {line.split()[0]: line.split()[-1] for line in report.splitlines()[1:]}
+
+
+def test_compare_verdicts(baseline):
+    results = [
+        make_result("sobel", 256, 1.25),        # 慢 25%
+        make_result("laplace", 256, 0.8),       # 快 20%
+        make_result("segment_mask", 256, 1.1),  # 阈值以内
+        make_result("rotate_3d", 256, 2.0),     # 基线中没有
+    ]
+    report, regressions = compare(results, baseline, threshold=0.2)
+    assert regressions == ["sobel@256"]
+    assert verdicts(report) == {"sobel@256": "变慢", "laplace@256": "变快",
+                                "segment_mask@256": "持平", "rotate_3d@256": "无基线"}
+
+
+def test_compare_threshold_boundary(baseline):
+    # 恰好等于阈值不算变慢
+    assert compare([make_result("sobel", 256, 1.2)], baseline, threshold=0.2)[1] == []
+    assert compare([make_result("sobel", 256, 1.2)], baseline, threshold=0.1)[1] == ["sobel@256"]
+
+
+def test_compare_skipped_and_failed(baseline):
+    results = [{"case": "sobel", "size": 1024, "status": "skipped", "reason": "内存不足"},
+               {"case": "laplace", "size": 256, "status": "error", "reason": "崩溃"}]
+    report, regressions = compare(results, baseline)
+    assert regressions == []
+    assert "跳过" in report and "失败" in report
+
+
+def test_save_baseline_merges(tmp_path, baseline):
+    path = str(tmp_path / "baseline.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f)
+    failed = {"case": "laplace", "size": 256, "status": "error", "reason": "崩溃"}
+    save_baseline(path, [make_result("sobel", 256, 2.0), make_result("sobel", 512, 8.0), failed], {"cpus": 1})
+    saved = load_baseline(path)
+    assert saved["environment"] == {"cpus": 1}
+    assert saved["results"]["sobel@256"]["seconds"] == 2.0
+    assert saved["results"]["laplace@256"]["seconds"] == 1.0  # 失败的用例保留旧基线
+    assert list(saved["results"]) == sorted(saved["results"])
+    assert load_baseline(str(tmp_path / "missing.json")) == {"environment": {}, "results": {}}
+
+
+def test_stored_baseline_covers_cases():
+    baseline = load_baseline(benchmark.DEFAULT_BASELINE)
+    for name in benchmark.CASES:
+        sizes = [benchmark.STUDY] if benchmark.CASES[name]["setup"] is benchmark._setup_study \
+            else benchmark.DEFAULT_SIZES
+        for size in sizes:
+            assert result_key({"case": name, "size": size}) in baseline["results"]
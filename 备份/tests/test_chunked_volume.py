@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import chunked_volume
+from chunked_volume import ChunkedVolume, should_chunk
+
+KEYS = [
+    np.s_[5],
+    np.s_[-1],
+    np.s_[:, 7],
+    np.s_[:, :, 30],
+    np.s_[3:40, 2:19, 11:70],
+    np.s_[::3, 1::2, ::5],
+    np.s_[10, 4:20],
+    np.s_[..., 12],
+    np.s_[2, ..., 3],
+    np.s_[40:10],
+]
+
+
+@pytest.fixture
+def volumes():
+    rng = np.random.default_rng(0)
+    array = rng.integers(-1000, 3000, size=(45, 37, 71), dtype=np.int16)
+    return array, ChunkedVolume.from_array(array, chunk=16)
+
+
+@pytest.mark.parametrize("key", KEYS)
+def test_getitem_matches_ndarray(volumes, key):
+    array, volume = volumes
+    assert np.array_equal(volume[key], array[key])
+
+
+def test_whole_volume_and_reductions(volumes):
+    array, volume = volumes
+    assert np.array_equal(np.asarray(volume), array)
+    assert volume.min() == array.min() and volume.max() == array.max()
+    assert volume.nbytes == array.nbytes and len(volume) == len(array)
+
+
+def test_setitem_matches_ndarray(volumes):
+    array, volume = volumes
+    array, reference = array.copy(), array.copy()
+    reference[7] = 1
+    reference[:, 3] = np.arange(71, dtype=np.int16)
+    reference[20:33, 5:30, 40:71] = -5
+    volume[7] = 1
+    volume[:, 3] = np.arange(71, dtype=np.int16)
+    volume[20:33, 5:30, 40:71] = -5
+    assert np.array_equal(np.asarray(volume), reference)
+    with pytest.raises(IndexError):
+        volume[::2] = 0
+
+
+def test_save_and_open_round_trip(volumes, tmp_path):
+    array, volume = volumes
+    saved = volume.save(str(tmp_path / "volume.chunks"))
+    assert saved.shape == array.shape and saved.dtype == array.dtype
+    assert np.array_equal(saved[:, 20], array[:, 20])
+
+
+def test_map_slabs(volumes):
+    array, volume = volumes
+    doubled = volume.map_slabs(lambda slab: slab.astype(np.int32) * 2, np.int32)
+    assert np.array_equal(np.asarray(doubled), array.astype(np.int32) * 2)
+
+
+def test_out_of_bounds():
+    volume = ChunkedVolume.create((4, 4, 4), np.uint8, chunk=2)
+    with pytest.raises(IndexError):
+        volume[4]
+    with pytest.raises(IndexError):
+        volume[0, 0, 0, 0]
+
+
+def test_should_chunk_limits(monkeypatch):
+    monkeypatch.setattr(chunked_volume, "available_memory", lambda: None)
+    assert should_chunk(800 ** 3 * 2)
+    assert not should_chunk(440 * 536 * 536 * 2)
+    # 可用内存不足时更早改用分块存储
+    monkeypatch.setattr(chunked_volume, "available_memory", lambda: 512 * 1024 ** 2)
+    assert should_chunk(200 * 1024 ** 2)
@@ -0,0 +1,37 @@
+import os
+
+import SimpleITK as sitk
+
+from dicomdir import find_dicomdir, list_series, read_dicomdir, _slice_sort_key
+
+
+def _norm(paths):
+    return [os.path.normcase(os.path.realpath(p)) for p in paths]
+
+
+def test_series_order_matches_gdcm_scan(study_folder):
+    series = list_series(read_dicomdir(find_dicomdir(study_folder)))
+    assert series
+    reader = sitk.ImageSeriesReader()
+    for entry in series:
+        # GDCM 只扫描单个目录：取该序列切片所在的目录
+        folder = os.path.dirname(entry["files"][0])
+        uid = entry["SeriesInstanceUID"]
+        assert uid in reader.GetGDCMSeriesIDs(folder)
+        assert _norm(entry["files"]) == _norm(reader.GetGDCMSeriesFileNames(folder, uid))
+
+
+def test_slice_sort_key_uses_position_along_normal():
+    # 行/列方向为 x、y 时法向为 z，按 z 升序，与 InstanceNumber 无关
+    orientation = "1\\0\\0\\0\\1\\0"
+    images = [{"ImagePositionPatient": f"0\\0\\{z}", "ImageOrientationPatient": orientation, "InstanceNumber": str(n)}
+              for n, z in enumerate((5.0, -2.5, 0.0, 10.0))]
+    ordered = sorted(images, key=_slice_sort_key)
+    assert [float(i["ImagePositionPatient"].split("\\")[2]) for i in ordered] == [-2.5, 0.0, 5.0, 10.0]
+
+
+def test_slice_sort_key_falls_back_to_location_then_instance():
+    assert sorted([{"SliceLocation": "3"}, {"SliceLocation": "-1"}], key=_slice_sort_key) == \
+        [{"SliceLocation": "-1"}, {"SliceLocation": "3"}]
+    assert sorted([{"InstanceNumber": "10"}, {"InstanceNumber": "2"}], key=_slice_sort_key) == \
+        [{"InstanceNumber": "2"}, {"InstanceNumber": "10"}]
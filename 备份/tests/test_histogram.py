@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from chunked_volume import ChunkedVolume
+from histogram_utils import HistogramEngine
+
+AXES = {"axial": 0, "coronal": 1, "sagittal": 2}
+
+
+def reference_counts(plane, edges):
+    """与 np.histogram 相同的分箱（最后一箱包含最大值），再用 np.bincount 计数"""
+    bins = len(edges) - 1
+    index = np.clip(np.digitize(plane, edges) - 1, 0, bins - 1)
+    return np.bincount(index.ravel(), minlength=bins)
+
+
+@pytest.fixture(params=["int16", "uint8", "float32", "chunked"])
+def volume(request):
+    rng = np.random.default_rng(0)
+    array = rng.normal(500, 300, size=(23, 19, 31))
+    if request.param == "float32":
+        return array.astype(np.float32)
+    if request.param == "uint8":
+        return np.clip(array / 4, 0, 255).astype(np.uint8)
+    array = array.astype(np.int16)
+    return ChunkedVolume.from_array(array, chunk=8) if request.param == "chunked" else array
+
+
+@pytest.mark.parametrize("mode", sorted(AXES))
+def test_per_slice_counts_match_bincount(volume, mode):
+    engine = HistogramEngine(volume, bins=50)
+    array = np.asarray(volume)
+    axis = AXES[mode]
+    for index in range(array.shape[axis]):
+        plane = np.take(array, index, axis=axis)
+        assert np.array_equal(engine.counts(mode, index), reference_counts(plane, engine.edges))
+
+
+def test_whole_counts_match_bincount_and_histogram(volume):
+    engine = HistogramEngine(volume, bins=50)
+    array = np.asarray(volume)
+    assert np.array_equal(engine.counts("whole"), reference_counts(array, engine.edges))
+    assert np.array_equal(engine.whole, np.histogram(array, bins=engine.edges)[0])
+    assert engine.coronal.sum(axis=0).tolist() == engine.whole.tolist() == engine.sagittal.sum(axis=0).tolist()
+
+
+def test_plane_counts_for_resliced_planes(volume):
+    engine = HistogramEngine(volume, bins=50)
+    plane = np.asarray(volume)[5]
+    assert np.array_equal(engine.plane_counts(plane), engine.counts("axial", 5))
+    # 类型不同的平面（如重采样得到的 float32）按浮点分箱
+    assert np.array_equal(engine.plane_counts(plane.astype(np.float64)), reference_counts(plane, engine.edges))
+    assert engine.matches(volume) and not engine.matches(np.asarray(volume).copy())
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from PyQt5.QtCore import QCoreApplication
+
+from job_executor import JobCancelled, JobExecutor
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+@pytest.fixture
+def jobs(app):
+    executor = JobExecutor(max_workers=2)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def wait_idle(app, jobs, timeout=10):
+    deadline = time.monotonic() + timeout
+    while jobs.is_running() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.005)
+    # 工作线程在任务被取消后发出的信号也要处理掉
+    time.sleep(0.05)
+    app.processEvents()
+    assert not jobs.is_running()
+
+
+def blocking(started, release, result, ignore_cancel=False):
+    def run(job):
+        started.set()
+        release.wait(5)
+        if not ignore_cancel:
+            job.report(1, 1)
+        return result
+    return run
+
+
+@pytest.mark.parametrize("ignore_cancel", [False, True])
+def test_newer_job_with_same_key_cancels_older(app, jobs, ignore_cancel):
+    done, errors, progress, posted = [], [], [], []
+    started, release = threading.Event(), threading.Event()
+    old = jobs.submit("transform", blocking(started, release, "old", ignore_cancel),
+                      on_done=lambda r: done.append(("old", r)), on_error=errors.append,
+                      on_progress=lambda *a: progress.append("old"))
+    assert started.wait(5)
+
+    new = jobs.submit("transform", lambda job: (job.report(1, 2), job.post(posted.append, "new"), "new")[-1],
+                      on_done=lambda r: done.append(("new", r)), on_error=errors.append,
+                      on_progress=lambda *a: progress.append("new"))
+    assert old.cancelled and not new.cancelled
+    assert jobs.is_running("transform")
+
+    # 旧任务在新任务完成之后才结束（无论是否响应取消），其结果也不能送达界面
+    wait_idle(app, jobs)
+    release.set()
+    time.sleep(0.1)
+    app.processEvents()
+    assert old.future.done()
+    assert done == [("new", "new")]
+    assert progress == ["new"] and posted == ["new"] and errors == []
+
+
+def test_cancelled_job_raises_in_worker(app, jobs):
+    seen = []
+    started, release = threading.Event(), threading.Event()
+
+    def run(job):
+        started.set()
+        release.wait(5)
+        try:
+            job.report(0, 1)
+        except JobCancelled:
+            seen.append("cancelled")
+            raise
+
+    job = jobs.submit("load", run, on_done=seen.append)
+    assert started.wait(5)
+    assert jobs.cancel("load")
+    release.set()
+    job.future.result(5)
+    app.processEvents()
+    assert seen == ["cancelled"]
+    assert not jobs.is_running()
+
+
+def test_queued_job_superseded_before_start_never_runs(app):
+    jobs = JobExecutor(max_workers=1)
+    try:
+        started, release = threading.Event(), threading.Event()
+        ran, done = [], []
+        jobs.submit("load", blocking(started, release, None))
+        assert started.wait(5)
+        jobs.submit("segment", lambda job: ran.append(1), on_done=done.append)
+        jobs.submit("segment", lambda job: ran.append(2) or 2, on_done=done.append)
+        release.set()
+        wait_idle(app, jobs)
+        assert ran == [2] and done == [2]
+    finally:
+        jobs.shutdown(wait=True)
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from label_mask import BitMask, MaskSet
+
+SHAPE = (30, 26, 45)  # x 方向不是 8 的倍数，覆盖打包的补齐位
+
+
+def random_mask(seed, box):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros(SHAPE, dtype=bool)
+    mask[box] = rng.random(SHAPE)[box] > 0.4
+    return mask
+
+
+@pytest.fixture
+def dense():
+    return random_mask(0, np.s_[3:20, 5:18, 7:40]), random_mask(1, np.s_[10:28, 0:12, 20:45])
+
+
+def test_round_trip_and_bbox(dense):
+    a, _ = dense
+    mask = BitMask.from_dense(a)
+    assert np.array_equal(np.asarray(mask), a)
+    box = ndimage.find_objects(a.view(np.uint8))[0]
+    assert mask.bbox() == tuple((s.start, s.stop) for s in box)
+    assert mask.nbytes < a.nbytes / 8
+
+
+@pytest.mark.parametrize("key", [np.s_[12], np.s_[:, 9], np.s_[:, :, 33], np.s_[4:15, 2:20, 10:31], np.s_[-1]])
+def test_indexing_matches_dense(dense, key):
+    a, _ = dense
+    assert np.array_equal(BitMask.from_dense(a)[key], a[key])
+
+
+@pytest.mark.parametrize("axis", [0, 1, 2])
+def test_plane(dense, axis):
+    a, _ = dense
+    index = SHAPE[axis] // 2
+    assert np.array_equal(BitMask.from_dense(a).plane(axis, index), a[(slice(None),) * axis + (index,)])
+
+
+@pytest.mark.parametrize("op, reference", [
+    ("__and__", np.logical_and),
+    ("__or__", np.logical_or),
+    ("__xor__", np.logical_xor),
+    ("__sub__", lambda x, y: x & ~y),
+])
+def test_set_operations(dense, op, reference):
+    a, b = dense
+    result = getattr(BitMask.from_dense(a), op)(BitMask.from_dense(b))
+    assert np.array_equal(np.asarray(result), reference(a, b))
+
+
+def test_operations_with_empty_and_mismatched(dense):
+    a, _ = dense
+    mask, empty = BitMask.from_dense(a), BitMask.empty(SHAPE)
+    assert empty.is_empty() and empty.bbox() is None and empty.count() == 0
+    assert np.array_equal(np.asarray(mask | empty), a)
+    assert (mask & empty).is_empty()
+    with pytest.raises(ValueError):
+        mask & BitMask.empty((1, 2, 3))
+
+
+def test_stats(dense):
+    a, _ = dense
+    spacing = (0.3, 0.4, 0.5)
+    stats = BitMask.from_dense(a).stats(spacing)
+    assert stats["voxels"] == int(a.sum())
+    assert stats["volume_mm3"] == pytest.approx(a.sum() * 0.06)
+    assert stats["volume_ml"] == pytest.approx(stats["volume_mm3"] / 1000)
+
+
+def test_mask_set_labels_and_union(dense):
+    a, b = dense
+    masks = MaskSet(SHAPE)
+    masks.add("a", BitMask.from_dense(a))
+    masks.add("b", BitMask.from_dense(b))
+    expected = np.zeros(SHAPE, dtype=np.int32)
+    expected[a] = 1
+    expected[b] = 2  # 后加入的覆盖先加入的
+    assert np.array_equal(np.asarray(masks), expected)
+    assert np.array_equal(masks[:, 7], expected[:, 7])
+    assert np.array_equal(np.asarray(masks.union()), a | b)
+    assert [s["voxels"] for s in masks.stats().values()] == [a.sum(), b.sum()]
+    masks.remove("a")
+    assert masks.names() == ["b"]
+    with pytest.raises(ValueError):
+        masks.add("c", BitMask.empty((1, 1, 1)))
+
+
+def test_mask_set_from_labels(dense):
+    a, _ = dense
+    labels, count = ndimage.label(a)
+    masks = MaskSet.from_labels(labels)
+    assert len(masks) == count
+    assert np.array_equal(np.asarray(masks), labels)
+    assert masks.union().count() == int(a.sum())
@@ -0,0 +1,155 @@
+import threading
+
+import numpy as np
+import pytest
+
+from enhancement_utils import enhance_slice
+from fusion_engine import FusionEngine
+from live_filter import LiveFilter, SliceCache
+from visualization import get_slice_image
+
+
+def item(n):
+    return np.zeros(n, dtype=np.uint8)
+
+
+def test_slice_cache_evicts_least_recently_used():
+    cache = SliceCache(max_bytes=300)
+    for key in "abc":
+        cache.put(key, item(100))
+    assert cache.get("a") is not None  # a 变为最近使用
+    cache.put("d", item(100))
+    assert "b" not in cache
+    assert all(key in cache for key in "acd")
+    assert len(cache) == 3 and cache.nbytes == 300
+
+
+def test_slice_cache_replaces_and_keeps_oversized_item():
+    cache = SliceCache(max_bytes=300)
+    cache.put("a", item(100))
+    cache.put("a", item(250))
+    assert len(cache) == 1 and cache.nbytes == 250
+    # 单个超过上限的切片仍然保留（刚显示的一张总要缓存）
+    cache.put("big", item(1000))
+    assert len(cache) == 1 and "big" in cache and cache.nbytes == 1000
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0 and cache.get("big") is None
+
+
+@pytest.fixture
+def live():
+    live = LiveFilter(prefetch=3)
+    live.set_filter("sobel")
+    yield live
+    live.shutdown()
+
+
+def wait_prefetch(live):
+    # 预取线程池只有一个线程，排在最后的空任务完成时之前的预取都已结束
+    live._pool.submit(lambda: None).result()
+
+
+@pytest.fixture
+def volume():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, size=(20, 24, 28), dtype=np.uint8)
+
+
+def test_live_slice_matches_enhance_slice(live, volume):
+    for orientation in ("axial", "coronal", "sagittal"):
+        expected = enhance_slice(get_slice_image(volume, orientation, 5), "sobel", "both")
+        assert np.array_equal(live.slice(volume, orientation, 5), expected)
+    assert live.slice(volume, "axial", 99) is live.slice(volume, "axial", 19)  # 层号裁剪到范围内
+
+
+def test_prefetch_follows_scroll_direction(live, volume):
+    live.slice(volume, "axial", 5)
+    live.slice(volume, "axial", 6)
+    wait_prefetch(live)
+    assert live.prefetched == 3
+    before = live.hits
+    for index in (7, 8, 9):
+        live.slice(volume, "axial", index)
+    assert live.hits - before == 3
+    assert ("axial", 4, "sobel", live._generation) not in live.cache
+
+
+def test_cache_invalidated_by_volume_and_filter(live, volume):
+    first = live.slice(volume, "axial", 3)
+    assert live.slice(volume, "axial", 3) is first
+    live.set_filter("laplace")
+    assert not np.array_equal(live.slice(volume, "axial", 3), first)
+    other = volume.copy()
+    live.slice(other, "axial", 3)
+    assert all(key[1] == 3 for key in live.cache._items)
+    assert live.stats()["cached"] == 1
+
+
+def test_volume_swap_during_prefetch_discards_old_slices(live, volume):
+    started, release = threading.Event(), threading.Event()
+    compute = live._compute
+
+    def blocking_compute(*args):
+        if threading.current_thread().name.startswith("slice_prefetch"):
+            started.set()
+            release.wait(5)
+        return compute(*args)
+
+    live._compute = blocking_compute
+    live.slice(volume, "axial", 5)
+    live.slice(volume, "axial", 6)  # 向下滚动，开始预取 7、8、9
+    assert started.wait(5)
+    # 预取线程正在为旧体数据计算第 7 层时换成新体数据
+    other = 255 - volume
+    live.slice(other, "axial", 6)
+    release.set()
+    wait_prefetch(live)
+    assert all(key[3] == live._generation for key in live.cache._items)
+    expected = enhance_slice(get_slice_image(other, "axial", 7), "sobel", "both")
+    assert np.array_equal(live.slice(other, "axial", 7), expected)
+
+
+def test_fusion_parameter_change_invalidates_slices(live, volume):
+    engine = FusionEngine(volume, volume.astype(np.int16) * 4, mode="add", alpha=0.5)
+    fused = engine.volume()
+    before = live.slice(fused, "axial", 10)
+    engine.set_mode("alpha", 0.9)
+    after = live.slice(fused, "axial", 10)
+    expected = enhance_slice(get_slice_image(fused, "axial", 10), "sobel", "both")
+    assert np.array_equal(after, expected)
+    assert not np.array_equal(before, after)
+
+
+def test_fusion_plane_cache_is_thread_safe(volume):
+    engine = FusionEngine(volume, volume.astype(np.int16) * 4)
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        i = 0
+        while not stop.is_set():
+            try:
+                engine.plane(i % 3, i % 20)
+            except Exception as e:
+                errors.append(e)
+                return
+            i += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for t in threads:
+        t.start()
+    try:
+        for k in range(300):
+            engine.plane(k % 3, k % 20)
+            if k % 7 == 0:
+                engine.set_mode(("add", "alpha", "checkerboard", "color")[k % 4])
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert errors == []
+    # 缓存中的切片都是按当前参数算出的
+    for (axis, index), cached in list(engine._cache.items()):
+        key = (slice(None),) * axis + (index,)
+        expected = engine.blend(np.asarray(engine.base[key]), np.asarray(engine._resliced[key]), axis, index)
+        assert np.array_equal(cached, expected)
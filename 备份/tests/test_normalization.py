@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from chunked_volume import ChunkedVolume
+from normalization_utils import intensity_percentiles, normalize_volume
+
+
+def reference_normalize(array, qs=(1, 99)):
+    p_lo, p_hi = np.percentile(array, qs)
+    return ((np.clip(array, p_lo, p_hi) - p_lo) / (p_hi - p_lo) * 255).astype(np.uint8)
+
+
+@pytest.fixture
+def ct_volume():
+    rng = np.random.default_rng(0)
+    # 偏态分布，1%/99% 百分位落在两个样本之间，覆盖线性插值
+    return (rng.gamma(2.0, 400.0, size=(40, 33, 51)) - 1000).astype(np.int16)
+
+
+@pytest.mark.parametrize("qs", [(1, 99), (0.5, 99.5), (5, 95)])
+def test_percentiles_match_numpy(ct_volume, qs):
+    assert np.allclose(intensity_percentiles(ct_volume, qs), np.percentile(ct_volume, qs))
+
+
+@pytest.mark.parametrize("dtype", [np.int16, np.uint16, np.uint8])
+def test_normalize_matches_reference(ct_volume, dtype):
+    array = np.clip(ct_volume, np.iinfo(dtype).min, np.iinfo(dtype).max).astype(dtype)
+    assert np.array_equal(normalize_volume(array, use_cache=False), reference_normalize(array))
+
+
+def test_normalize_chunked_volume(ct_volume):
+    result = normalize_volume(ChunkedVolume.from_array(ct_volume, chunk=16), use_cache=False)
+    assert isinstance(result, ChunkedVolume)
+    assert np.array_equal(np.asarray(result), reference_normalize(ct_volume))
+
+
+def test_normalize_float_is_close(ct_volume):
+    # 浮点输入用定宽直方图求百分位，结果为近似值
+    array = ct_volume.astype(np.float32) + 0.25
+    difference = normalize_volume(array, use_cache=False).astype(int) - reference_normalize(array).astype(int)
+    assert np.abs(difference).max() <= 1
+
+
+def test_normalize_is_cached_per_volume(ct_volume):
+    first = normalize_volume(ct_volume)
+    assert normalize_volume(ct_volume) is first
+    assert normalize_volume(ct_volume, qs=(5, 95)) is not first
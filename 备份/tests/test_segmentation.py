@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from chunked_volume import ChunkedVolume
+from segmentation_utils import label_components, region_grow, segment_volume, threshold_volume
+
+
+@pytest.fixture(scope="module")
+def volume():
+    rng = np.random.default_rng(0)
+    return (ndimage.gaussian_filter(rng.normal(size=(90, 60, 70)), 2.5) * 1e4).astype(np.int16)
+
+
+def same_partition(labels, reference):
+    """两种编号表示同一组连通域（编号可以不同）"""
+    if not np.array_equal(labels > 0, reference > 0):
+        return False
+    pairs = np.unique(np.stack([labels[labels > 0], reference[reference > 0]]), axis=1)
+    return len(np.unique(pairs[0])) == len(np.unique(pairs[1])) == pairs.shape[1]
+
+
+@pytest.mark.parametrize("slab", [1, 7, 16, 200])
+@pytest.mark.parametrize("threads", [1, 3])
+def test_label_components_matches_ndimage(volume, slab, threads):
+    mask = volume > 500
+    labels, count = label_components(mask, threads=threads, slab=slab)
+    reference, reference_count = ndimage.label(mask)
+    assert count == reference_count
+    assert labels.dtype == np.int32
+    assert set(np.unique(labels)) == set(range(count + 1))
+    assert same_partition(labels, reference)
+
+
+def test_label_components_joins_across_slabs():
+    # 只在块边界处相连的 U 形
+    mask = np.zeros((8, 5, 5), dtype=bool)
+    mask[:, 1, 1] = mask[:, 1, 3] = True
+    mask[7, 1, 1:4] = True
+    labels, count = label_components(mask, threads=2, slab=2)
+    assert count == 1
+    assert np.unique(labels[mask]).tolist() == [1]
+
+
+def test_threshold_volume_matches_comparison(volume):
+    expected = (volume >= -200) & (volume <= 800)
+    assert np.array_equal(threshold_volume(volume, -200, 800), expected)
+    assert np.array_equal(threshold_volume(ChunkedVolume.from_array(volume, chunk=16), -200, 800), expected)
+    assert np.array_equal(threshold_volume(volume, 300), volume >= 300)
+
+
+def test_segment_volume(volume):
+    labels, count = segment_volume(volume, 300, 5000, threads=2)
+    reference, reference_count = ndimage.label((volume >= 300) & (volume <= 5000))
+    assert count == reference_count and same_partition(labels, reference)
+
+
+def test_region_grow_matches_seed_component(volume):
+    lower, upper = 800, 5000
+    reference, _ = ndimage.label((volume >= lower) & (volume <= upper))
+    sizes = np.bincount(reference.ravel())[1:]
+    # 覆盖最小的区域（不扩大包围盒）和最大的区域（多次扩大到体数据边界）
+    for component in (int(sizes.argmin()) + 1, int(sizes.argmax()) + 1):
+        seed = tuple(np.argwhere(reference == component)[0])
+        region = region_grow(volume, seed, lower, upper)
+        assert region.dtype == np.uint8
+        assert np.array_equal(region, (reference == component).astype(np.uint8))
+
+
+def test_region_grow_outside_range(volume):
+    seed = tuple(np.argwhere(volume < 0)[0])
+    assert region_grow(volume, seed, 0, 5000) is None
@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+import SimpleITK as sitk
+
+from chunked_volume import ChunkedVolume
+from volume_cache import VolumeCache
+
+
+def make_image(array):
+    image = sitk.GetImageFromArray(array)
+    image.SetSpacing((0.3, 0.25, 0.5))
+    image.SetOrigin((-12.5, 4.0, 101.25))
+    image.SetDirection((0, 1, 0, -1, 0, 0, 0, 0, 1))
+    return image
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return VolumeCache(str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def array():
+    return np.random.default_rng(0).integers(-1000, 3000, size=(6, 7, 9)).astype(np.int16)
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_round_trip_returns_identical_array_and_geometry(cache, array, chunked):
+    image = make_image(array)
+    data = ChunkedVolume.from_array(array, chunk=4) if chunked else array
+    metadata = {"PatientName": "张三", "Manufacturer": "Xé"}
+    cache.put("k", image, data, metadata)
+
+    geometry, cached, cached_metadata = cache.get("k")
+    assert isinstance(cached, ChunkedVolume) == chunked
+    assert cached.dtype == array.dtype and cached.shape == array.shape
+    assert np.array_equal(np.asarray(cached), array)
+    assert geometry.GetSpacing() == image.GetSpacing()
+    assert geometry.GetOrigin() == image.GetOrigin()
+    assert geometry.GetDirection() == image.GetDirection()
+    assert geometry.GetSize() == image.GetSize()
+    assert cached_metadata == metadata
+
+
+def test_touching_a_source_file_invalidates_its_entry(cache, array, tmp_path):
+    files = []
+    for i in range(3):
+        path = tmp_path / f"slice{i}.dcm"
+        path.write_bytes(b"x" * (10 + i))
+        files.append(str(path))
+    key = cache.make_key("1.2.3", files)
+    cache.put(key, make_image(array), array, {})
+    assert cache.make_key("1.2.3", files) == key
+    assert cache.get(key) is not None
+
+    st = os.stat(files[1])
+    os.utime(files[1], ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    new_key = cache.make_key("1.2.3", files)
+    assert new_key != key
+    assert cache.get(new_key) is None
+    # 同一文件列表在另一个序列 UID 下也不会命中
+    assert cache.make_key("1.2.4", files) != new_key
+
+
+def test_exceeding_byte_limit_evicts_least_recently_used_first(cache, array):
+    image = make_image(array)
+    cache.put("a", image, array, {})
+    entry_bytes = sum(size for _, size, _ in cache._entries())
+    cache.max_bytes = 2 * entry_bytes + entry_bytes // 2
+
+    cache.put("b", image, array, {})
+    # 固定写入时间，避免同一时刻写入的条目访问时间相同
+    for age, key in ((300, "a"), (200, "b")):
+        os.utime(cache._data_path(key), (1e9 - age, 1e9 - age))
+    assert cache.get("a") is not None  # 访问 a，使 b 成为最久未访问的条目
+
+    cache.put("c", image, array, {})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert not any(name.startswith("b.") for name in os.listdir(cache.cache_dir))
+
+    cache.put("d", image, array, {})
+    assert cache.get("a") is None  # 上面先访问 a 再访问 c，a 成为最久未访问的条目
+    assert {key for _, _, key in cache._entries()} == {"c", "d"}
@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+import pytest
+from scipy import ndimage
+
+import volume_filters
+from chunked_volume import ChunkedVolume
+from normalization_utils import normalize_volume
+from volume_filters import apply_volume_filter, filtered_volume
+
+
+def sobel_magnitude(volume):
+    volume = volume.astype(np.float32)
+    return np.sqrt(sum(ndimage.sobel(volume, axis, mode="nearest") ** 2 for axis in range(3)))
+
+
+REFERENCES = {
+    "sobel": (None, sobel_magnitude),
+    "laplace": (None, lambda v: ndimage.laplace(v.astype(np.float32), mode="nearest")),
+    "gaussian": ({"sigma": 1.5}, lambda v: ndimage.gaussian_filter(v.astype(np.float32), 1.5, mode="nearest")),
+    "median": ({"size": 3}, lambda v: ndimage.median_filter(v, size=3, mode="nearest").astype(np.float32)),
+}
+
+
+@pytest.fixture(scope="module")
+def volume():
+    rng = np.random.default_rng(0)
+    return (ndimage.gaussian_filter(rng.normal(size=(37, 41, 50)), 1.5) * 3000).astype(np.int16)
+
+
+@pytest.mark.parametrize("name", sorted(REFERENCES))
+@pytest.mark.parametrize("slab", [5, 64])
+def test_filter_matches_scipy(volume, name, slab):
+    params, reference = REFERENCES[name]
+    result = apply_volume_filter(volume, name, params, threads=2, slab=slab)
+    expected = reference(volume)
+    assert result.dtype == np.float32 and result.shape == volume.shape
+    assert np.allclose(result, expected, rtol=1e-4, atol=1e-5 * np.abs(expected).max())
+
+
+def test_clahe_matches_per_slice_cv2(volume):
+    result = apply_volume_filter(volume, "clahe", {"clip_limit": 3.0, "tiles": 4}, slab=6)
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(4, 4))
+    expected = np.stack([clahe.apply(plane) for plane in normalize_volume(volume)]).astype(np.float32)
+    assert np.array_equal(result, expected)
+
+
+def test_large_volume_output_is_chunked(volume, monkeypatch):
+    monkeypatch.setattr(volume_filters, "should_chunk", lambda nbytes: True)
+    source = ChunkedVolume.from_array(volume, chunk=16)
+    result = apply_volume_filter(source, "laplace", threads=2)
+    assert isinstance(result, ChunkedVolume)
+    assert np.allclose(np.asarray(result), REFERENCES["laplace"][1](volume), atol=1e-3)
+
+
+def test_progress_and_abort(volume):
+    calls = []
+    apply_volume_filter(volume, "laplace", slab=10, progress=lambda done, total: calls.append((done, total)))
+    assert calls == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+    def abort(done, total):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        apply_volume_filter(volume, "laplace", slab=10, threads=1, progress=abort)
+
+
+def test_filtered_volume_cache(volume):
+    source = volume.copy()
+    first = filtered_volume(source, "gaussian", {"sigma": 1.0})
+    assert filtered_volume(source, "gaussian") is first  # 与默认参数相同
+    assert filtered_volume(source, "gaussian", {"sigma": 2.0}) is not first
+    key = next(k for k in volume_filters._filter_cache if k[0] == id(source))
+    del source
+    assert key not in volume_filters._filter_cache
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from chunked_volume import ChunkedVolume
+from image_ops import TransformStack, apply_affine
+from volume_pyramid import VolumePyramid, downsample_mean, level_for, pyramid_level
+
+
+def reference_downsample(array, factor):
+    """按边缘补齐到 factor 的整数倍后逐块求均值"""
+    pad = [(0, -n % factor) for n in array.shape]
+    padded = np.pad(array.astype(np.float64), pad, mode="edge")
+    z, y, x = (n // factor for n in padded.shape)
+    return padded.reshape(z, factor, y, factor, x, factor).mean(axis=(1, 3, 5))
+
+
+@pytest.fixture(scope="module")
+def volume():
+    rng = np.random.default_rng(0)
+    return rng.integers(-1000, 3000, size=(70, 45, 38), dtype=np.int16)
+
+
+@pytest.mark.parametrize("factor", [2, 3, 4, 8])
+def test_downsample_mean_matches_block_mean(volume, factor):
+    result = downsample_mean(volume, factor)
+    assert result.dtype == volume.dtype
+    assert result.shape == tuple(-(-np.array(volume.shape) // factor))
+    assert np.array_equal(result, np.rint(reference_downsample(volume, factor)).astype(np.int16))
+
+
+def test_downsample_mean_float_and_chunked(volume):
+    as_float = volume.astype(np.float32)
+    assert np.allclose(downsample_mean(as_float, 4), reference_downsample(as_float, 4), atol=1e-3)
+    chunked = ChunkedVolume.from_array(volume, chunk=16)
+    assert np.array_equal(downsample_mean(chunked, 4), downsample_mean(volume, 4))
+    assert downsample_mean(volume, 1) is volume
+
+
+def test_pyramid_levels_are_cached_and_consistent(volume):
+    pyramid = VolumePyramid(volume)
+    half = pyramid.level(2)
+    assert pyramid.level(2) is half
+    # 1/4 层由 1/2 层再降采样得到
+    assert np.array_equal(pyramid.level(4), downsample_mean(half, 2))
+    with pytest.raises(ValueError):
+        pyramid.level(3)
+
+
+def test_level_for():
+    shape = (440, 536, 536)
+    assert level_for(shape, np.prod(shape)) == 1
+    assert level_for(shape, 2_500_000) == 4
+    assert level_for(shape, 24_000_000) == 2
+    assert level_for(shape, 1) == 8
+    assert VolumePyramid(np.zeros((40, 40, 40))).level_for(10_000) == 2
+
+
+def test_pyramid_level_of_resliced_volume(volume):
+    source = volume.astype(np.float32)
+    stack = TransformStack()
+    stack.translate(4, -6, 2)  # 偶数体素平移，在 1/2 层上也是整体素平移
+    coarse = pyramid_level(stack.reslice(source), 2)
+    expected = downsample_mean(apply_affine(source, stack.matrix, order=1, slab=None), 2)
+    assert coarse.shape == expected.shape
+    # 边界处 nearest 补边的范围不同，只比较内部
+    inner = np.s_[4:-4, 4:-4, 4:-4]
+    assert np.allclose(coarse[inner], expected[inner], atol=1e-3)
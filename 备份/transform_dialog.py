@@ -17,7 +17,11 @@ class TransformDialog(QDialog):
 
         elif mode == "rotate":
             self.angle_input = QLineEdit("0")
-            layout.addRow("角度（°）:", self.angle_input)
+            self.beta_input = QLineEdit("0")
+            self.gamma_input = QLineEdit("0")
+            layout.addRow("绕Z轴角度（°）:", self.angle_input)
+            layout.addRow("绕X轴角度（°）:", self.beta_input)
+            layout.addRow("绕Y轴角度（°）:", self.gamma_input)
 
         button_layout = QHBoxLayout()
         self.ok_button = QPushButton("确定")
@@ -40,3 +44,11 @@ class TransformDialog(QDialog):
 
     def get_rotation_angle(self):
         return float(self.angle_input.text())
+
+    def get_rotation_angles(self):
+        """欧拉角 [α, β, γ]（绕 Z, X, Y 轴，单位：度）"""
+        return [
+            float(self.angle_input.text()),
+            float(self.beta_input.text()),
+            float(self.gamma_input.text())
+        ]
@@ -1,13 +1,19 @@
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QGridLayout, QPushButton, QLabel, QSlider,
     QVBoxLayout, QHBoxLayout, QMenuBar, QStatusBar, QGroupBox, QAction,
-    QTableWidget, QTableWidgetItem, QHeaderView, QComboBox
+    QTableWidget, QTableWidgetItem, QHeaderView, QComboBox, QProgressBar, QActionGroup
 )
 from PyQt5.QtCore import Qt
-from vtk.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-from controller import Controller
+import startup
+# 只导入显示窗口所需的 vtk 子模块；完整的 vtk 包在加载图像时才导入
+with startup.measure("vtkmodules.qt"):
+    from vtkmodules.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
+    import vtkmodules.vtkRenderingOpenGL2  # 注册 OpenGL 渲染窗口的实现
+    import vtkmodules.vtkInteractionStyle  # 注册默认交互方式
+import instrumentation
+with startup.measure("controller"):
+    from controller import Controller
+from presets import FUSION_MODES, VOLUME_PRESETS, DEFAULT_PRESET, ISO_PRESETS, VOLUME_FILTERS, LIVE_FILTERS
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -49,9 +55,9 @@ class MainWindow(QMainWindow):
         self.hist_source_box.addItems(["Axial", "Sagittal", "Coronal", "Whole"])
         self.hist_layout.addWidget(self.hist_source_box)
 
-        self.hist_canvas = FigureCanvas(Figure(figsize=(3, 2)))
-        self.hist_ax = self.hist_canvas.figure.subplots()
-        self.hist_layout.addWidget(self.hist_canvas)
+        # matplotlib 画布在第一次画直方图时才创建（见 ensure_hist_canvas）
+        self.hist_canvas = None
+        self.hist_ax = None
 
         self.left_layout.addWidget(self.hist_group, 1)
 
@@ -112,18 +118,129 @@ class MainWindow(QMainWindow):
         ortho_menu = menu_bar.addMenu("正畸")
         fusion_menu = menu_bar.addMenu("融合")
         segment_menu = menu_bar.addMenu("分割")
+        enhance_menu = menu_bar.addMenu("增强")
+        render_menu = menu_bar.addMenu("三维")
         help_menu = menu_bar.addMenu("帮助")
         self.openOrthoAction = QAction("打开", self)
         self.ortho_help_action = QAction("帮助", self)
+        self.registerAction = QAction("自动配准", self)
         ortho_menu.addAction(self.openOrthoAction)
+        ortho_menu.addAction(self.registerAction)
         ortho_menu.addAction(self.ortho_help_action)
 
+        self.fusionModeActions = {}
+        fusion_group = QActionGroup(self)
+        for mode, label in FUSION_MODES.items():
+            action = QAction(label, self, checkable=True)
+            action.setChecked(mode == "add")
+            fusion_group.addAction(action)
+            fusion_menu.addAction(action)
+            self.fusionModeActions[mode] = action
+        fusion_menu.addSeparator()
+        self.removeOverlayAction = QAction("移除融合", self)
+        fusion_menu.addAction(self.removeOverlayAction)
+
+        self.segment3dAction = QAction("三维阈值分割", self)
+        self.regionGrowAction = QAction("区域生长", self)
+        self.clearSegmentAction = QAction("清除分割", self)
+        segment_menu.addAction(self.segment3dAction)
+        segment_menu.addAction(self.regionGrowAction)
+        segment_menu.addAction(self.clearSegmentAction)
+
+        self.filterActions = {}
+        for name, config in VOLUME_FILTERS.items():
+            action = QAction(f"三维{config['label']}", self)
+            enhance_menu.addAction(action)
+            self.filterActions[name] = action
+        enhance_menu.addSeparator()
+        self.clearFilterAction = QAction("显示原图", self)
+        enhance_menu.addAction(self.clearFilterAction)
+        enhance_menu.addSeparator()
+        live_menu = enhance_menu.addMenu("实时滤波（滚动时逐切片）")
+        self.liveFilterActions = {}
+        live_group = QActionGroup(self)
+        for name, config in [(None, {"label": "关闭"})] + list(LIVE_FILTERS.items()):
+            action = QAction(config["label"], self, checkable=True)
+            action.setChecked(name is None)
+            live_group.addAction(action)
+            live_menu.addAction(action)
+            self.liveFilterActions[name] = action
+
+        self.volumePresetActions = {}
+        preset_group = QActionGroup(self)
+        for preset, config in VOLUME_PRESETS.items():
+            action = QAction(config["label"], self, checkable=True)
+            action.setChecked(preset == DEFAULT_PRESET)
+            preset_group.addAction(action)
+            render_menu.addAction(action)
+            self.volumePresetActions[preset] = action
+        render_menu.addSeparator()
+        self.surfaceActions = {}
+        for preset, config in ISO_PRESETS.items():
+            action = QAction(f"提取{config['label']}表面", self)
+            render_menu.addAction(action)
+            self.surfaceActions[preset] = action
+        self.customSurfaceAction = QAction("自定义阈值表面", self)
+        self.maskSurfaceAction = QAction("分割结果表面", self)
+        self.clearSurfaceAction = QAction("清除表面", self)
+        self.exportSurfaceAction = QAction("导出表面 (STL/PLY)", self)
+        render_menu.addAction(self.customSurfaceAction)
+        render_menu.addAction(self.maskSurfaceAction)
+        render_menu.addAction(self.clearSurfaceAction)
+        render_menu.addAction(self.exportSurfaceAction)
+
+        perf_menu = help_menu.addMenu("性能")
+        self.instrumentAction = QAction("记录耗时", self, checkable=True)
+        self.instrumentAction.setChecked(instrumentation.is_enabled())
+        self.traceMemoryAction = QAction("记录内存分配", self, checkable=True)
+        self.traceMemoryAction.setChecked(instrumentation.memory_enabled())
+        self.exportTraceAction = QAction("导出性能追踪 (Chrome trace)", self)
+        perf_menu.addAction(self.instrumentAction)
+        perf_menu.addAction(self.traceMemoryAction)
+        perf_menu.addAction(self.exportTraceAction)
+
         self.openFileAction = QAction("打开文件", self)
         file_menu.addAction(self.openFileAction)
 
+        self.undoAction = QAction("撤销", self)
+        self.undoAction.setShortcut("Ctrl+Z")
+        self.redoAction = QAction("重做", self)
+        self.redoAction.setShortcut("Ctrl+Y")
+        self.commitTransformAction = QAction("应用变换", self)
+        edit_menu.addAction(self.undoAction)
+        edit_menu.addAction(self.redoAction)
+        edit_menu.addAction(self.commitTransformAction)
+
         # ========== 状态栏 ==========
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
+        self.jobProgress = QProgressBar()
+        self.jobProgress.setMaximumWidth(200)
+        self.jobProgress.setVisible(False)
+        self.cancelJobButton = QPushButton("取消")
+        self.cancelJobButton.setVisible(False)
+        self.status_bar.addPermanentWidget(self.jobProgress)
+        self.status_bar.addPermanentWidget(self.cancelJobButton)
+        self.perfLabel = QLabel()  # 帧率与延迟（记录耗时时显示）
+        self.status_bar.addPermanentWidget(self.perfLabel)
 
         # ========== 控制器绑定 ==========
         self.controller = Controller(self)
+
+    def ensure_hist_canvas(self):
+        """创建直方图画布（首次调用时导入 matplotlib），返回坐标轴"""
+        if self.hist_canvas is None:
+            with startup.measure("matplotlib"):
+                from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+                from matplotlib.figure import Figure
+            self.hist_canvas = FigureCanvas(Figure(figsize=(3, 2)))
+            self.hist_ax = self.hist_canvas.figure.subplots()
+            self.hist_layout.addWidget(self.hist_canvas)
+        return self.hist_ax
+
+    def closeEvent(self, event):
+        # 退出前取消后台任务，避免解释器等待未完成的重采样
+        self.controller.jobs.shutdown()
+        if self.controller.live is not None:
+            self.controller.live.shutdown()
+        super().closeEvent(event)
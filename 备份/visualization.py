@@ -2,8 +2,11 @@ import vtk
 import numpy as np
 from vtk.util import numpy_support
 import SimpleITK as sitk
+from normalization_utils import normalize_volume
+from instrumentation import traced, span
 
 
+@traced("slice", "view")
 def get_slice_image(array, orientation, index=None):
     z, y, x = array.shape
     if orientation == 'axial':
@@ -20,37 +23,148 @@ def get_slice_image(array, orientation, index=None):
 
 
 def preprocess_array(array):
-    array = np.clip(array, np.percentile(array, 1), np.percentile(array, 99))
-    array = (array - array.min()) / (array.max() - array.min()) * 255
-    return array.astype(np.uint8)
+    return normalize_volume(array)
 
 
 def numpy_to_vtk_image2d(slice_array):
     height, width = slice_array.shape
-    flat_array = slice_array.flatten(order="C")
+    # 连续数组直接共享内存（浅拷贝），由 vtk 数组持有 numpy 引用
+    flat_array = np.ascontiguousarray(slice_array, dtype=np.uint8).ravel()
     vtk_data_array = numpy_support.numpy_to_vtk(
-        num_array=flat_array, deep=True, array_type=vtk.VTK_UNSIGNED_CHAR)
+        num_array=flat_array, deep=False, array_type=vtk.VTK_UNSIGNED_CHAR)
     image = vtk.vtkImageData()
     image.SetDimensions(width, height, 1)
-    image.AllocateScalars(vtk.VTK_UNSIGNED_CHAR, 1)
     image.GetPointData().SetScalars(vtk_data_array)
     return image
 
 
+def numpy_to_vtk_volume(array, spacing=(1.0, 1.0, 1.0), factor=1):
+    """
+    (z, y, x) 体数据转为 vtkImageData（共享内存）。
+    金字塔 1/factor 层的体素 c 位于原图 factor·c + (factor-1)/2，据此设置间距和原点，不同层级在空间上重合
+    """
+    array = np.ascontiguousarray(array)
+    scalars = numpy_support.numpy_to_vtk(array.ravel(), deep=False,
+                                         array_type=numpy_support.get_vtk_array_type(array.dtype))
+    image = vtk.vtkImageData()
+    image.SetDimensions(array.shape[2], array.shape[1], array.shape[0])
+    image.SetSpacing(*(s * factor for s in spacing))
+    image.SetOrigin(*(s * (factor - 1) / 2.0 for s in spacing))
+    image.GetPointData().SetScalars(scalars)
+    image._array = array  # 保持底层内存存活
+    return image
+
+
+class SliceView:
+    """
+    每个二维视图常驻一条 vtkImageData -> vtkImageSliceMapper -> vtkImageSlice -> vtkRenderer 管线，
+    切换切片时只原地替换标量数据，相机和缩放状态得以保留
+    """
+
+    def __init__(self, vtk_widget):
+        self.widget = vtk_widget
+        self.image = vtk.vtkImageData()
+        self.mapper = vtk.vtkImageSliceMapper()
+        self.mapper.SetInputData(self.image)
+        self.actor = vtk.vtkImageSlice()
+        self.actor.SetMapper(self.mapper)
+        self.renderer = vtk.vtkRenderer()
+        self.renderer.SetBackground(0, 0, 0)
+        self.renderer.AddViewProp(self.actor)
+        self._buffer = None
+        self._extent = None
+        render_window = vtk_widget.GetRenderWindow()
+        render_window.GetRenderers().RemoveAllItems()
+        render_window.AddRenderer(self.renderer)
+
+    def _show(self, dims, spacing, reset_camera):
+        # 与旧实现一致：每次换图只保留图像本身，清掉上一张切片上的测量标注
+        self.renderer.RemoveAllViewProps()
+        self.renderer.AddViewProp(self.actor)
+        self.actor.SetScale(spacing[0], spacing[1], 1.0)
+        extent = (dims, tuple(spacing))
+        if reset_camera or extent != self._extent:
+            self.renderer.ResetCamera()
+            self._extent = extent
+        with span("render", "view"):
+            self.widget.GetRenderWindow().Render()
+
+    def set_slice(self, slice_array, spacing=(1.0, 1.0), reset_camera=False):
+        """零拷贝上传：连续的 uint8 切片直接作为 vtk 标量数组的底层缓冲区；(h, w, 3) 按 RGB 显示"""
+        with span("vtk_upload", "view"):
+            buffer = np.ascontiguousarray(slice_array, dtype=np.uint8)
+            height, width = buffer.shape[:2]
+            flat = buffer.reshape(height * width, -1) if buffer.ndim == 3 else buffer.ravel()
+            scalars = numpy_support.numpy_to_vtk(flat, deep=False, array_type=vtk.VTK_UNSIGNED_CHAR)
+            self._buffer = buffer  # 保持底层内存存活
+            self.image.SetDimensions(width, height, 1)
+            self.image.GetPointData().SetScalars(scalars)
+            self.image.Modified()
+            if self.mapper.GetInput() is not self.image:
+                self.mapper.SetInputData(self.image)
+        self._show((width, height), spacing, reset_camera)
+
+    def set_image(self, image_2d, spacing=(1.0, 1.0), reset_camera=False):
+        """显示外部构造好的 vtkImageData（分割、增强结果等）"""
+        self.mapper.SetInputData(image_2d)
+        dims = image_2d.GetDimensions()[:2]
+        self._show(dims, spacing, reset_camera)
+
+
+def get_slice_view(vtk_widget):
+    view = getattr(vtk_widget, "_slice_view", None)
+    if view is None:
+        view = SliceView(vtk_widget)
+        vtk_widget._slice_view = view
+    return view
+
+
 def render_image2d(image_2d, vtk_widget, spacing=(1.0, 1.0), reset_camera=False):
-    mapper = vtk.vtkImageSliceMapper()
-    mapper.SetInputData(image_2d)
-    actor = vtk.vtkImageSlice()
-    actor.SetMapper(mapper)
-    actor.SetScale(spacing[0], spacing[1], 1.0)
-    renderer = vtk.vtkRenderer()
-    renderer.AddViewProp(actor)
-    if reset_camera:
-        renderer.ResetCamera()
-    renderer.SetBackground(0, 0, 0)
-    vtk_widget.GetRenderWindow().GetRenderers().RemoveAllItems()
-    vtk_widget.GetRenderWindow().AddRenderer(renderer)
-    vtk_widget.GetRenderWindow().Render()
+    get_slice_view(vtk_widget).set_image(image_2d, spacing, reset_camera)
+
+
+def render_slice(slice_array, vtk_widget, spacing=(1.0, 1.0), reset_camera=False):
+    get_slice_view(vtk_widget).set_slice(slice_array, spacing, reset_camera)
+
+
+LABEL_ALPHA = 0.45
+
+
+def _label_palette(n=64):
+    """分割标签的显示颜色（按黄金角取色相，相邻编号颜色差异明显）"""
+    hues = (np.arange(n) * 0.618033988749895) % 1.0
+    rgb = np.stack([np.abs(hues * 6 - 3) - 1, 2 - np.abs(hues * 6 - 2), 2 - np.abs(hues * 6 - 4)], axis=1)
+    return (np.clip(rgb, 0, 1) * 255).astype(np.float32)
+
+
+LABEL_PALETTE = _label_palette()
+
+
+@traced("overlay", "view")
+def blend_label_overlay(slice_array, label_slice):
+    """把分割标签以半透明彩色叠加到灰度（或 RGB）切片上；没有前景时原样返回"""
+    mask = label_slice > 0
+    if not mask.any():
+        return slice_array
+    rgb = np.array(slice_array, dtype=np.uint8)
+    if rgb.ndim == 2:
+        rgb = np.repeat(rgb[..., None], 3, axis=2)
+    colors = LABEL_PALETTE[(label_slice[mask] - 1) % len(LABEL_PALETTE)]
+    rgb[mask] = (rgb[mask] * (1 - LABEL_ALPHA) + colors * LABEL_ALPHA).astype(np.uint8)
+    return rgb
+
+
+def display_slice(ui, array, orientation, index=None):
+    """取显示用切片；开启实时滤波（ui._live_filter）时取滤波后的切片，存在分割结果（ui._label_overlay）时叠加标签"""
+    live = getattr(ui, "_live_filter", None)
+    if live is not None:
+        slice_array = live.slice(array, orientation, index)
+    else:
+        slice_array = get_slice_image(array, orientation, index)
+    labels = getattr(ui, "_label_overlay", None)
+    if labels is not None and tuple(labels.shape) == tuple(array.shape):
+        slice_array = blend_label_overlay(slice_array, np.asarray(get_slice_image(labels, orientation, index)))
+    return slice_array
 
 
 def update_status_bar(ui, axial_idx=None, sagittal_idx=None, coronal_idx=None):
@@ -88,34 +202,29 @@ class ScrollSliceInteractorStyle(vtk.vtkInteractorStyleImage):
     def scroll_up(self, obj, event):
         if self.index < self.max_index:
             self.index += 1
-            update_slice(self.array, self.ui, self.orientation, self.index, sitk_image=self.image, update_status=False)
-            bar = {'axial': self.ui.axialBar, 'sagittal': self.ui.sagittalBar, 'coronal': self.ui.coronalBar}[self.orientation]
-            bar.blockSignals(True)
-            bar.setValue(self.index)
-            bar.blockSignals(False)
-            update_status_bar(self.ui)
-            self.ui.controller.update_histogram(slider=self.orientation, index=self.index)
+            self.request_render()
 
     def scroll_down(self, obj, event):
         if self.index > 0:
             self.index -= 1
-            update_slice(self.array, self.ui, self.orientation, self.index, sitk_image=self.image, update_status=False)
-            bar = {'axial': self.ui.axialBar, 'sagittal': self.ui.sagittalBar, 'coronal': self.ui.coronalBar}[self.orientation]
-            bar.blockSignals(True)
-            bar.setValue(self.index)
-            bar.blockSignals(False)
-            update_status_bar(self.ui)
-            self.ui.controller.update_histogram(slider=self.orientation, index=self.index)
+            self.request_render()
+
+    def request_render(self):
+        # 渲染、直方图和状态栏交给调度器合并，连续滚动时只画最新的切片
+        bar = {'axial': self.ui.axialBar, 'sagittal': self.ui.sagittalBar, 'coronal': self.ui.coronalBar}[self.orientation]
+        bar.blockSignals(True)
+        bar.setValue(self.index)
+        bar.blockSignals(False)
+        self.ui.controller.scheduler.request_slice(self.orientation, self.index, self.image, histogram=True)
 
 
 def update_slice(array, ui, orientation, index, sitk_image=None, update_status=False):
     array = ui._preprocessed_array
-    slice_array = get_slice_image(array, orientation, index)
-    vtk_img = numpy_to_vtk_image2d(slice_array)
+    slice_array = display_slice(ui, array, orientation, index)
     sx, sy, sz = sitk_image.GetSpacing() if sitk_image else (1.0, 1.0, 1.0)
     spacing = {'axial': (sx, sy), 'sagittal': (sy, sz), 'coronal': (sx, sz)}[orientation]
     render_func = {'axial': ui.axialWidget, 'sagittal': ui.sagittalWidget, 'coronal': ui.coronalWidget}[orientation]
-    render_image2d(vtk_img, render_func, spacing)
+    render_slice(slice_array, render_func, spacing)
     if update_status:
         update_status_bar(ui)
 
@@ -142,9 +251,9 @@ def show_views_with_slider(array, ui, sitk_image=None):
     spacing_coronal = (sx, sz)
 
     # 初次显示
-    render_image2d(numpy_to_vtk_image2d(get_slice_image(array, 'axial')), ui.axialWidget, spacing_axial, reset_camera=True)
-    render_image2d(numpy_to_vtk_image2d(get_slice_image(array, 'sagittal')), ui.sagittalWidget, spacing_sagittal, reset_camera=True)
-    render_image2d(numpy_to_vtk_image2d(get_slice_image(array, 'coronal')), ui.coronalWidget, spacing_coronal, reset_camera=True)
+    render_slice(display_slice(ui, array, 'axial'), ui.axialWidget, spacing_axial, reset_camera=True)
+    render_slice(display_slice(ui, array, 'sagittal'), ui.sagittalWidget, spacing_sagittal, reset_camera=True)
+    render_slice(display_slice(ui, array, 'coronal'), ui.coronalWidget, spacing_coronal, reset_camera=True)
 
     # 设置默认交互器样式（非测量模式）
     style_axial = ScrollSliceInteractorStyle("axial", array, ui, sitk_image, spacing_axial)
@@ -268,6 +377,54 @@ class MeasurementInteractorStyle(vtk.vtkInteractorStyleImage):
             self.GetInteractor().GetRenderWindow().Render()
 
 
+class SeedInteractorStyle(vtk.vtkInteractorStyleImage):
+    """区域生长的种子拾取：左键点击当前切片上的一点，换算为体素坐标 (z, y, x) 后回调 on_pick"""
+
+    def __init__(self, orientation, ui, spacing=(1.0, 1.0), renderer=None, on_pick=None):
+        super().__init__()
+        self.orientation = orientation
+        self.ui = ui
+        self.spacing = spacing
+        self.renderer = renderer
+        self.on_pick = on_pick
+        self.AddObserver("LeftButtonPressEvent", self.on_click)
+
+    def on_click(self, obj, event):
+        pos = self.GetInteractor().GetEventPosition()
+        picker = vtk.vtkPropPicker()
+        picker.Pick(pos[0], pos[1], 0, self.renderer)
+        p = picker.GetPickPosition()
+        if p == (0.0, 0.0, 0.0) or any(np.isnan(p)):
+            print("[区域生长] 未能成功拾取点")
+            return
+        # 切片以 (列, 行) * 间距 的方式显示
+        col = int(round(p[0] / self.spacing[0]))
+        row = int(round(p[1] / self.spacing[1]))
+        if self.orientation == 'axial':
+            voxel = (self.ui.axialBar.value(), row, col)
+        elif self.orientation == 'coronal':
+            voxel = (row, self.ui.coronalBar.value(), col)
+        else:
+            voxel = (row, col, self.ui.sagittalBar.value())
+        if self.on_pick is not None:
+            self.on_pick(voxel)
+
+
+def enable_seed_picking(ui, sitk_image, on_pick):
+    """三个视图进入种子拾取模式；调用 enable_measurement(ui, False, ...) 恢复滚动浏览"""
+    sx, sy, sz = sitk_image.GetSpacing() if sitk_image else (1.0, 1.0, 1.0)
+    configs = [
+        ("axial", ui.axialWidget, (sx, sy)),
+        ("sagittal", ui.sagittalWidget, (sy, sz)),
+        ("coronal", ui.coronalWidget, (sx, sz)),
+    ]
+    for orientation, widget, spacing in configs:
+        interactor = widget.GetRenderWindow().GetInteractor()
+        style = SeedInteractorStyle(orientation, ui, spacing, renderer=get_slice_view(widget).renderer, on_pick=on_pick)
+        interactor.SetInteractorStyle(style)
+        interactor.Initialize()
+
+
 def enable_measurement(ui, enabled, sitk_image):
     if not hasattr(ui, "_preprocessed_array") or ui._preprocessed_array is None:
         return
@@ -286,15 +443,8 @@ def enable_measurement(ui, enabled, sitk_image):
 
     for orientation, widget, spacing in configs:
         interactor = widget.GetRenderWindow().GetInteractor()
-        renderers = widget.GetRenderWindow().GetRenderers()
-
-        # ✅ 修复关键：强制确保 renderer 不为空
-        if renderers.GetNumberOfItems() == 0:
-            fallback_renderer = vtk.vtkRenderer()
-            widget.GetRenderWindow().AddRenderer(fallback_renderer)
-            widget.GetRenderWindow().Render()
-
-        renderer = widget.GetRenderWindow().GetRenderers().GetFirstRenderer()
+        # 常驻管线的 renderer 在切片切换之间保持不变，测量标注直接加在上面
+        renderer = get_slice_view(widget).renderer
         if enabled:
             style = MeasurementInteractorStyle(orientation, array, ui, spacing, renderer=renderer)
         else:
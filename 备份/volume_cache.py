@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from chunked_volume import ChunkedVolume, VolumeGeometry
+
+DEFAULT_CACHE_DIR = os.environ.get("CBCT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cbct_cache"))
+DEFAULT_MAX_BYTES = 8 * 1024 ** 3  # 8 GB
+
+
+class VolumeCache:
+    """
+    已解码体数据的磁盘缓存：体素以 .npy（或大体数据的 .chunks 分块文件）保存，命中时内存映射打开；
+    几何信息和 metadata 以 .json 保存；按最近访问时间做 LRU 淘汰
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(series_uid, file_names):
+        """缓存键 = SeriesInstanceUID + 各切片文件的修改时间和大小"""
+        digest = hashlib.sha1(str(series_uid).encode("utf-8"))
+        for name in file_names:
+            st = os.stat(name)
+            digest.update(f"\n{os.path.basename(name)}:{st.st_mtime_ns}:{st.st_size}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".npy", base + ".json"
+
+    def _data_path(self, key):
+        npy_path, _ = self._paths(key)
+        chunks_path = npy_path[:-4] + ".chunks"
+        return chunks_path if os.path.exists(chunks_path) else npy_path
+
+    def get(self, key):
+        """命中返回 (VolumeGeometry, 内存映射数组或 ChunkedVolume, metadata)，未命中返回 None"""
+        _, json_path = self._paths(key)
+        data_path = self._data_path(key)
+        if not (os.path.exists(data_path) and os.path.exists(json_path)):
+            return None
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+            if data_path.endswith(".chunks"):
+                array = ChunkedVolume.open(data_path)
+            else:
+                array = np.load(data_path, mmap_mode="r")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[缓存] 读取失败，忽略该条目: {e}")
+            self._remove(key)
+            return None
+
+        # 更新访问时间，用于 LRU
+        now = time.time()
+        os.utime(data_path, (now, now))
+
+        z, y, x = array.shape
+        geometry = VolumeGeometry(info["spacing"], info["origin"], info["direction"], (x, y, z))
+        return geometry, array, info["metadata"]
+
+    def put(self, key, image, array, metadata):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        npy_path, json_path = self._paths(key)
+        info = {
+            "spacing": list(image.GetSpacing()),
+            "origin": list(image.GetOrigin()),
+            "direction": list(image.GetDirection()),
+            "metadata": metadata,
+        }
+        # 先写临时文件再改名，避免中断时留下半个条目
+        tmp_json = json_path + ".tmp"
+        if isinstance(array, ChunkedVolume):
+            chunks_path = npy_path[:-4] + ".chunks"
+            array.save(chunks_path + ".tmp")
+            os.replace(chunks_path + ".tmp.json", chunks_path + ".json")
+            os.replace(chunks_path + ".tmp", chunks_path)
+        else:
+            tmp_npy = npy_path + ".tmp.npy"
+            np.save(tmp_npy, np.ascontiguousarray(array))
+            os.replace(tmp_npy, npy_path)
+        # 标签值中可能含有无法编码的私有字符，保持 ASCII 转义以便原样读回
+        with open(tmp_json, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tmp_json, json_path)
+        self.evict()
+
+    def _remove(self, key):
+        npy_path, json_path = self._paths(key)
+        chunks_path = npy_path[:-4] + ".chunks"
+        for path in (npy_path, json_path, chunks_path, chunks_path + ".json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npy") and not name.endswith(".tmp.npy"):
+                key = name[:-4]
+            elif name.endswith(".chunks") and not name.endswith(".tmp.chunks"):
+                key = name[:-7]
+            else:
+                continue
+            _, json_path = self._paths(key)
+            data_path = self._data_path(key)
+            try:
+                size = os.path.getsize(data_path) + os.path.getsize(json_path)
+                entries.append((os.path.getmtime(data_path), size, key))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self):
+        """超出容量上限时，按最久未访问的顺序删除条目"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            print(f"[缓存] 淘汰 {key}")
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            for _, _, key in self._entries():
+                self._remove(key)
@@ -0,0 +1,160 @@
+import os
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+from scipy import ndimage
+
+from chunked_volume import ChunkedVolume, LARGE_VOLUME_BYTES, should_chunk
+from normalization_utils import normalize_volume
+from presets import VOLUME_FILTERS
+from instrumentation import traced
+
+FILTER_SLAB = 24        # 每块输出的轴位层数；每个线程的临时内存约为块大小的 6~8 倍（float32）
+FILTER_CACHE_BYTES = LARGE_VOLUME_BYTES  # 缓存的滤波结果总大小上限（最近一次的结果总会保留）
+
+_DERIV = np.array([-1, 0, 1], dtype=np.float32)
+_SMOOTH = np.array([1, 2, 1], dtype=np.float32)
+
+# (id(source), 滤波名, 参数) -> (weakref(source), 结果)，按最近使用淘汰
+_filter_cache = OrderedDict()
+
+
+def _planes(block, func):
+    return np.stack([func(plane) for plane in block])
+
+
+def _sobel(block, params):
+    """三维 Sobel 梯度幅值：面内用 cv2 可分离滤波，z 方向用相邻层的加减（与 scipy.ndimage.sobel 的 nearest 边界一致）"""
+    def sep(kx, ky):
+        return _planes(block, lambda p: cv2.sepFilter2D(p, cv2.CV_32F, kx, ky, borderType=cv2.BORDER_REPLICATE))
+
+    dx, dy, smooth = sep(_DERIV, _SMOOTH), sep(_SMOOTH, _DERIV), sep(_SMOOTH, _SMOOTH)
+    gx = dx[:-2] + 2 * dx[1:-1] + dx[2:]
+    gy = dy[:-2] + 2 * dy[1:-1] + dy[2:]
+    gz = smooth[2:] - smooth[:-2]
+    del dx, dy, smooth
+    np.multiply(gx, gx, out=gx)
+    gx += gy * gy
+    gx += gz * gz
+    return np.sqrt(gx, out=gx)
+
+
+def _laplace(block, params):
+    """三维 6 邻域 Laplace：面内 cv2.Laplacian（ksize=1）加 z 方向二阶差分"""
+    inplane = _planes(block[1:-1], lambda p: cv2.Laplacian(p, cv2.CV_32F, ksize=1, borderType=cv2.BORDER_REPLICATE))
+    inplane += block[:-2]
+    inplane += block[2:]
+    inplane -= 2 * block[1:-1]
+    return inplane
+
+
+def _gaussian(block, params):
+    r = _gaussian_halo(params)
+    return ndimage.gaussian_filter(block, params["sigma"], mode="nearest", output=np.float32)[r:block.shape[0] - r]
+
+
+def _gaussian_halo(params):
+    return int(4.0 * params["sigma"] + 0.5)  # 与 scipy 默认的 truncate=4.0 一致
+
+
+def _median(block, params):
+    """精确的 size³ 中值：逐层把邻域的 size³ 个平移视图叠起来取中位数（比 ndimage.median_filter 快约一倍）"""
+    size = params["size"]
+    r = size // 2
+    padded = np.pad(block, ((0, 0), (r, r), (r, r)), mode="edge")
+    height, width = block.shape[1:]
+    out = np.empty((block.shape[0] - 2 * r, height, width), dtype=np.float32)
+    for z in range(out.shape[0]):
+        views = np.stack([padded[z + dz, dy:dy + height, dx:dx + width]
+                          for dz in range(size) for dy in range(size) for dx in range(size)])
+        out[z] = np.partition(views, views.shape[0] // 2, axis=0)[views.shape[0] // 2]
+    return out
+
+
+def _clahe(block, params):
+    """CLAHE 是二维算法，逐轴位层处理（输入为归一化后的 uint8，输出换算为 float32）"""
+    clahe = cv2.createCLAHE(clipLimit=params["clip_limit"], tileGridSize=(params["tiles"],) * 2)
+    return _planes(block, clahe.apply).astype(np.float32)
+
+
+# 滤波函数与 z 方向需要的补边层数；函数输入带补边的块，只返回中间 len(块) - 2 × 补边 层
+_KERNELS = {
+    "sobel": (_sobel, lambda p: 1),
+    "laplace": (_laplace, lambda p: 1),
+    "gaussian": (_gaussian, _gaussian_halo),
+    "median": (_median, lambda p: p["size"] // 2),
+    "clahe": (_clahe, lambda p: 0),
+}
+
+
+def filter_params(name, params=None):
+    """默认参数加上指定参数，返回排好序的元组（用作缓存键）"""
+    merged = dict(VOLUME_FILTERS[name]["params"])
+    merged.update(params or {})
+    return tuple(sorted(merged.items()))
+
+
+@traced("volume_filter", "filter")
+def apply_volume_filter(volume, name, params=None, threads=None, slab=FILTER_SLAB, progress=None):
+    """
+    三维滤波：沿 z 轴切成带补边的块，在线程池中以 float32 计算（cv2/scipy 计算时释放 GIL）
+    :param volume: (z, y, x) ndarray / np.memmap / ChunkedVolume
+    :param name: VOLUME_FILTERS 中的滤波名
+    :param params: 覆盖默认参数的字典
+    :param progress: 可选回调 progress(done, total)，块与块之间调用（回调可抛异常中止）
+    :return: 与 volume 同形状的 float32 体数据（should_chunk 判定过大时为 ChunkedVolume）
+    """
+    func, halo = _KERNELS[name]
+    params = dict(filter_params(name, params))
+    halo = halo(params)
+    threads = threads or os.cpu_count() or 1
+    depth = volume.shape[0]
+    if should_chunk(int(np.prod(volume.shape)) * 4):
+        output = ChunkedVolume.create(volume.shape, np.float32)
+        slab = output.chunk  # 按块层写入，各线程不会写同一个数据块
+    else:
+        output = np.empty(volume.shape, dtype=np.float32)
+    # CLAHE 在窗宽窗位归一化后的 uint8 上做（与显示一致），其余滤波在原始强度上做
+    source = normalize_volume(volume) if name == "clahe" else volume
+
+    def run(z0, z1):
+        lo, hi = max(0, z0 - halo), min(depth, z1 + halo)
+        block = np.asarray(source[lo:hi])
+        block = block if name == "clahe" else block.astype(np.float32)
+        # 体数据两端不足的补边按 nearest 复制边界层
+        block = np.pad(block, ((halo - (z0 - lo), halo - (hi - z1)), (0, 0), (0, 0)), mode="edge")
+        output[z0:z1] = func(block, params)
+        return z1
+
+    slabs = [(z0, min(z0 + slab, depth)) for z0 in range(0, depth, slab)]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(run, z0, z1) for z0, z1 in slabs]
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                if progress is not None:
+                    progress(done, len(slabs))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    if isinstance(output, ChunkedVolume):
+        output.flush()
+    return output
+
+
+def filtered_volume(volume, name, params=None, threads=None, progress=None):
+    """带缓存的 apply_volume_filter：同一体数据、同一滤波和参数只计算一次，结果总大小超过 FILTER_CACHE_BYTES 时淘汰最久未用的"""
+    key = (id(volume), name, filter_params(name, params))
+    entry = _filter_cache.get(key)
+    if entry is not None and entry[0]() is volume:
+        _filter_cache.move_to_end(key)
+        return entry[1]
+    result = apply_volume_filter(volume, name, params, threads=threads, progress=progress)
+    _filter_cache[key] = (weakref.ref(volume, lambda _: _filter_cache.pop(key, None)), result)
+    while len(_filter_cache) > 1 and sum(entry[1].nbytes for entry in _filter_cache.values()) > FILTER_CACHE_BYTES:
+        _filter_cache.popitem(last=False)
+    return result
@@ -0,0 +1,129 @@
+import weakref
+
+import numpy as np
+
+from image_ops import ReslicedVolume, apply_affine
+
+PYRAMID_FACTORS = (2, 4, 8)
+PYRAMID_SLAB = 64   # 降采样时每次读取的轴位切片数（会取整到缩放倍数的整数倍）
+
+# id(volume) -> (weakref(volume), VolumePyramid)
+_pyramid_cache = {}
+
+
+def downsample_mean(volume, factor):
+    """
+    按 factor³ 的体素块求均值降采样；尺寸不能整除时按边缘值补齐，输出形状为 ceil(shape / factor)
+    按轴位分块读取，ChunkedVolume 不会被整体载入内存
+    """
+    if factor == 1:
+        return volume
+    shape = np.array(volume.shape)
+    out_shape = tuple(-(-shape // factor))
+    dtype = np.dtype(volume.dtype)
+    out = np.empty(out_shape, dtype=dtype)
+    step = max(1, PYRAMID_SLAB // factor) * factor
+    pad_y = out_shape[1] * factor - shape[1]
+    pad_x = out_shape[2] * factor - shape[2]
+    for z0 in range(0, shape[0], step):
+        z1 = min(z0 + step, shape[0])
+        slab = np.asarray(volume[z0:z1], dtype=np.float32)
+        pad_z = -(-(z1 - z0) // factor) * factor - (z1 - z0)
+        if pad_z or pad_y or pad_x:
+            slab = np.pad(slab, ((0, pad_z), (0, pad_y), (0, pad_x)), mode='edge')
+        nz = slab.shape[0] // factor
+        mean = slab.reshape(nz, factor, out_shape[1], factor, out_shape[2], factor).mean(axis=(1, 3, 5))
+        if dtype.kind in "iub":
+            mean = np.rint(mean)
+        out[z0 // factor:z0 // factor + nz] = mean.astype(dtype)
+    return out
+
+
+def level_for(shape, max_voxels, factors=PYRAMID_FACTORS):
+    """形状为 shape 的体数据中，体素数不超过 max_voxels 的最细层级的缩放倍数（都超过时取最粗层）"""
+    for factor in (1,) + tuple(sorted(factors)):
+        if np.prod(-(-np.array(shape) // factor)) <= max_voxels:
+            return factor
+    return max(factors)
+
+
+class VolumePyramid:
+    """
+    体数据的多分辨率金字塔（1/2、1/4、1/8），各层在首次使用时才计算并缓存；
+    粗层由已有的最细一层继续降采样得到
+    """
+
+    def __init__(self, volume, factors=PYRAMID_FACTORS):
+        self._volume = weakref.ref(volume) if _weakrefable(volume) else (lambda v=volume: v)
+        self.shape = tuple(volume.shape)
+        self.factors = tuple(sorted(factors))
+        self._levels = {}
+
+    @property
+    def volume(self):
+        return self._volume()
+
+    def level(self, factor):
+        """返回缩小 factor 倍的体数据；factor 为 1 时返回原图"""
+        if factor == 1:
+            return self.volume
+        if factor not in self.factors:
+            raise ValueError(f"Unsupported pyramid factor: {factor}")
+        cached = self._levels.get(factor)
+        if cached is None:
+            finer = [f for f in self._levels if f < factor and factor % f == 0]
+            base = max(finer) if finer else 1
+            cached = downsample_mean(self.level(base), factor // base)
+            self._levels[factor] = cached
+            print(f"[金字塔] 生成 1/{factor} 层 {cached.shape}")
+        return cached
+
+    def level_for(self, max_voxels):
+        """体素数不超过 max_voxels 的最细层级的缩放倍数"""
+        return level_for(self.shape, max_voxels, self.factors)
+
+    def clear(self):
+        self._levels.clear()
+
+
+def _weakrefable(volume):
+    try:
+        weakref.ref(volume)
+        return True
+    except TypeError:
+        return False
+
+
+def get_pyramid(volume):
+    """按体数据缓存金字塔，同一份体数据的各层只计算一次"""
+    key = id(volume)
+    entry = _pyramid_cache.get(key)
+    if entry is not None and entry[0]() is volume:
+        return entry[1]
+    pyramid = VolumePyramid(volume)
+    if _weakrefable(volume):
+        _pyramid_cache[key] = (weakref.ref(volume, lambda _: _pyramid_cache.pop(key, None)), pyramid)
+    return pyramid
+
+
+def coarse_matrix(forward_matrix, factor):
+    """把全分辨率体素坐标下的 4x4 仿射矩阵换算到 1/factor 层（粗层体素 c 的中心位于 factor·c + (factor-1)/2）"""
+    scale = np.eye(4)
+    scale[:3, :3] *= factor
+    scale[:3, 3] = (factor - 1) / 2.0
+    return np.linalg.inv(scale) @ np.asarray(forward_matrix, dtype=float) @ scale
+
+
+def pyramid_level(volume, factor):
+    """
+    任意体数据的 1/factor 层。ReslicedVolume 取其原图的金字塔层，再在粗网格上按同一变换重采样，
+    不会触发全分辨率的整体重采样
+    """
+    if factor == 1:
+        return volume
+    if isinstance(volume, ReslicedVolume):
+        coarse = get_pyramid(volume.source).level(factor)
+        return apply_affine(coarse, coarse_matrix(volume.matrix, factor), order=1, mode=volume.mode,
+                            output_shape=tuple(-(-np.array(volume.shape) // factor)))
+    return get_pyramid(volume).level(factor)
+
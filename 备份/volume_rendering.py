@@ -0,0 +1,221 @@
+from collections import OrderedDict
+
+import numpy as np
+import vtk
+from PyQt5.QtCore import QObject, QTimer
+
+from volume_pyramid import level_for, pyramid_level
+from presets import VOLUME_PRESETS, DEFAULT_PRESET
+from visualization import numpy_to_vtk_volume
+from instrumentation import span
+
+INTERACTIVE_MAX_VOXELS = 2_500_000   # 旋转/缩放时使用的层级（CPU 光线投射也能保持流畅）
+STILL_MAX_VOXELS = 24_000_000        # 交互停止后细化到的层级
+REFINE_DELAY_MS = 250                # 交互停止多久后切换到细层
+
+
+class VolumeView(QObject):
+    """
+    三维视图中的直接体绘制。粗、细两个层级各有一个 vtkVolume（vtkSmartVolumeMapper，无独显时退回 CPU 光线投射），
+    共用同一套传递函数；旋转/缩放时只显示粗层，交互停止 REFINE_DELAY_MS 后切换到细层重新渲染。
+    也用于显示等值面网格
+    """
+
+    def __init__(self, vtk_widget, preset=DEFAULT_PRESET):
+        super().__init__()
+        self.widget = vtk_widget
+        self.renderer = vtk.vtkRenderer()
+        self.renderer.SetBackground(0.0, 0.0, 0.0)
+        render_window = vtk_widget.GetRenderWindow()
+        render_window.GetRenderers().RemoveAllItems()
+        render_window.AddRenderer(self.renderer)
+
+        self.property = vtk.vtkVolumeProperty()
+        self.property.SetInterpolationTypeToLinear()
+        self.property.ShadeOn()
+        self.property.SetAmbient(0.3)
+        self.property.SetDiffuse(0.7)
+        self.property.SetSpecular(0.2)
+        self.preset = None
+        self.set_preset(preset, render=False)
+
+        self.volumes = {}  # "coarse" / "fine" -> vtkVolume
+        self.meshes = OrderedDict()  # 名称 -> vtkActor（等值面）；显示表面时隐藏体绘制
+        self.interacting = False
+        self._has_camera = False
+
+        self._refine_timer = QTimer(self)
+        self._refine_timer.setSingleShot(True)
+        self._refine_timer.setInterval(REFINE_DELAY_MS)
+        self._refine_timer.timeout.connect(self.refine)
+
+        self.style = vtk.vtkInteractorStyleTrackballCamera()
+        self.style.AddObserver("StartInteractionEvent", self._on_interaction_start)
+        self.style.AddObserver("EndInteractionEvent", self._on_interaction_end)
+        interactor = render_window.GetInteractor()
+        interactor.SetInteractorStyle(self.style)
+        interactor.Initialize()
+
+    def set_preset(self, name, render=True):
+        preset = VOLUME_PRESETS[name]
+        opacity = vtk.vtkPiecewiseFunction()
+        for value, alpha in preset["opacity"]:
+            opacity.AddPoint(value, alpha)
+        color = vtk.vtkColorTransferFunction()
+        for value, r, g, b in preset["color"]:
+            color.AddRGBPoint(value, r, g, b)
+        self.property.SetScalarOpacity(opacity)
+        self.property.SetColor(color)
+        self.preset = name
+        if render:
+            self.render()
+
+    def set_level(self, level, array, spacing, factor):
+        """
+        替换某一层级的数据
+        :param level: "coarse"（交互时显示）或 "fine"（静止时显示）
+        :param spacing: 原图的 (sx, sy, sz)
+        :param factor: 该数据相对原图的缩小倍数
+        """
+        if level == "coarse" and "fine" in self.volumes:
+            # 新数据的粗层先到，旧的细层已过期
+            self.renderer.RemoveVolume(self.volumes.pop("fine"))
+        volume = self.volumes.get(level)
+        if volume is None:
+            mapper = vtk.vtkSmartVolumeMapper()
+            mapper.SetRequestedRenderModeToDefault()
+            mapper.SetInteractiveAdjustSampleDistances(True)
+            volume = vtk.vtkVolume()
+            volume.SetMapper(mapper)
+            volume.SetProperty(self.property)
+            self.renderer.AddVolume(volume)
+            self.volumes[level] = volume
+        image = numpy_to_vtk_volume(array, spacing, factor)
+        volume.GetMapper().SetInputData(image)
+        self.property.SetScalarOpacityUnitDistance(min(spacing) * factor)
+        print(f"[体绘制] {level} 层 1/{factor} {tuple(array.shape)}")
+        self._update_visibility()
+        if not self._has_camera:
+            self.renderer.ResetCamera()
+            self._has_camera = True
+        self.render()
+
+    def clear(self):
+        self._refine_timer.stop()
+        for volume in self.volumes.values():
+            self.renderer.RemoveVolume(volume)
+        self.volumes.clear()
+        self._has_camera = False
+        self.render()
+
+    def set_mesh(self, name, mesh, color=(1.0, 1.0, 1.0), matrix=None):
+        """
+        显示（或替换）一个表面网格
+        :param matrix: 网格坐标下的 4x4 矩阵（当前未提交的变换），导出时一并应用
+        """
+        actor = self.meshes.get(name)
+        if actor is None:
+            mapper = vtk.vtkPolyDataMapper()
+            mapper.ScalarVisibilityOff()
+            actor = vtk.vtkActor()
+            actor.SetMapper(mapper)
+            self.renderer.AddActor(actor)
+            self.meshes[name] = actor
+        actor.GetMapper().SetInputData(mesh)
+        actor.GetProperty().SetColor(*color)
+        self.set_mesh_matrix(name, matrix)
+        self._update_visibility()
+        if not self._has_camera:
+            self.renderer.ResetCamera()
+            self._has_camera = True
+        self.render()
+
+    def set_mesh_matrix(self, name, matrix=None):
+        actor = self.meshes[name]
+        if matrix is None:
+            actor.SetUserMatrix(None)
+            return
+        user = vtk.vtkMatrix4x4()
+        for i in range(4):
+            for j in range(4):
+                user.SetElement(i, j, float(matrix[i][j]))
+        actor.SetUserMatrix(user)
+
+    def remove_mesh(self, name, render=True):
+        actor = self.meshes.pop(name, None)
+        if actor is not None:
+            self.renderer.RemoveActor(actor)
+        self._update_visibility()
+        if render:
+            self.render()
+
+    def clear_meshes(self):
+        for actor in self.meshes.values():
+            self.renderer.RemoveActor(actor)
+        self.meshes.clear()
+        self._update_visibility()
+        self.render()
+
+    def mesh_data(self):
+        """当前显示的网格（已应用各自的矩阵），用于导出"""
+        result = []
+        for actor in self.meshes.values():
+            mesh = actor.GetMapper().GetInput()
+            if actor.GetUserMatrix() is not None:
+                transform = vtk.vtkTransform()
+                transform.SetMatrix(actor.GetUserMatrix())
+                apply = vtk.vtkTransformPolyDataFilter()
+                apply.SetInputData(mesh)
+                apply.SetTransform(transform)
+                apply.Update()
+                mesh = apply.GetOutput()
+            result.append(mesh)
+        return result
+
+    def _update_visibility(self):
+        shown = "coarse" if self.interacting or "fine" not in self.volumes else "fine"
+        if self.meshes:
+            shown = None
+        for level, volume in self.volumes.items():
+            volume.SetVisibility(level == shown)
+
+    def _on_interaction_start(self, obj, event):
+        self._refine_timer.stop()
+        if not self.interacting:
+            self.interacting = True
+            self._update_visibility()
+
+    def _on_interaction_end(self, obj, event):
+        # 滚轮缩放每一格都会开始/结束一次交互，延迟细化避免来回切换
+        self._refine_timer.start()
+
+    def refine(self):
+        self.interacting = False
+        self._update_visibility()
+        self.render()
+
+    def render(self):
+        with span("render_3d", "view"):
+            self.widget.GetRenderWindow().Render()
+
+
+def get_volume_view(vtk_widget):
+    view = getattr(vtk_widget, "_volume_view", None)
+    if view is None:
+        view = VolumeView(vtk_widget)
+        vtk_widget._volume_view = view
+    return view
+
+
+def render_volume_levels(volume, spacing, on_level, progress=None):
+    """
+    依次生成粗层和细层（体数据金字塔，变换后的体数据在粗网格上重采样），每生成一层调用 on_level(level, array, factor)
+    :param progress: 可选回调 progress(done, total)
+    """
+    coarse = level_for(volume.shape, INTERACTIVE_MAX_VOXELS)
+    fine = level_for(volume.shape, STILL_MAX_VOXELS)
+    levels = [("coarse", coarse)] + ([("fine", fine)] if fine != coarse else [])
+    for i, (level, factor) in enumerate(levels):
+        if progress is not None:
+            progress(i, len(levels))
+        on_level(level, np.asarray(pyramid_level(volume, factor)), factor)